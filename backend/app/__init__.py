@@ -1,33 +1,45 @@
-﻿from flask import Flask, jsonify
+﻿from importlib import import_module
+
+from flask import Flask, jsonify
 from .config import load_config
 from .extensions import db, migrate, cors
+from .replicas import init_replicas
+from .serialization.json_provider import init_json
+from .middleware.compression import init_compression
+from .middleware.profiling import init_profiling
+from .cache.course_tree import init_course_cache
+from .archive.blob import init_archive
+from .events.bus import init_events
+from .services.revision_service import init_revisions
+from .cli import init_cli
 
 from .domain import models  # noqa: F401
-from .api.courses import bp as courses_bp
-from .api.chapters import bp as chapters_bp
-from .api.lessons import bp as lessons_bp
-from .api.quizzes import bp as quizzes_bp
-from .api.questions import bp as questions_bp
-from .api.options import bp as options_bp
-from .api.export import bp as export_bp
+
+# blueprints importés par create_app seulement : `import app.<module>` (CLI,
+# migrations, scripts) ne charge pas toute l'API
+BLUEPRINTS = ("courses", "chapters", "lessons", "quizzes", "questions", "options", "export", "preview", "stats", "profiles")
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(load_config())
+    init_json(app)
 
     cors(app, resources={r"/api/*": {"origins": "*"}})
     db.init_app(app)
+    init_replicas(app)
     migrate.init_app(app, db)
+    init_compression(app)
+    init_course_cache(app)
+    init_archive(app)
+    init_events(app)
+    init_revisions(app)
+    init_cli(app)
+    init_profiling(app)
 
     @app.get("/api/health")
     def health():
         return jsonify({"status": "ok"})
 
-    app.register_blueprint(courses_bp)
-    app.register_blueprint(chapters_bp)
-    app.register_blueprint(lessons_bp)
-    app.register_blueprint(quizzes_bp)
-    app.register_blueprint(questions_bp)
-    app.register_blueprint(options_bp)
-    app.register_blueprint(export_bp)
+    for name in BLUEPRINTS:
+        app.register_blueprint(import_module(f"{__name__}.api.{name}").bp)
     return app
@@ -0,0 +1,160 @@
+﻿"""
+Application ASGI : les routes de lecture, le flux SSE, l'export et l'envoi du
+HTML des chapitres sont servis nativement en asynchrone (app.aio.routes) ; tout
+le reste est délégué à l'application Flask, exécutée dans un pool de threads.
+"""
+import asyncio
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qs
+
+from werkzeug.http import parse_accept_header
+
+from app.aio.database import make_async_engine
+
+class BodyTooLarge(Exception):
+    pass
+
+class AsgiRequest:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {}
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1")
+            value = value.decode("latin-1")
+            self.headers[name] = f"{self.headers[name]},{value}" if name in self.headers else value
+        self.args = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+
+    @property
+    def accept_encodings(self):
+        return parse_accept_header(self.headers.get("accept-encoding"))
+
+    async def body(self, limit: int) -> bytes:
+        """Lit le corps au fil de l'eau, sans bloquer de thread ; BodyTooLarge au-delà de `limit`."""
+        declared = self.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > limit:
+            raise BodyTooLarge()
+        buf = bytearray()
+        while True:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                raise ConnectionResetError()
+            buf += message.get("body", b"")
+            if len(buf) > limit:
+                raise BodyTooLarge()
+            if not message.get("more_body"):
+                return bytes(buf)
+
+async def send_response(send, status: int, body: bytes = b"", headers=(), content_type=None):
+    raw = [(b"content-length", str(len(body)).encode()), (b"access-control-allow-origin", b"*")]
+    if content_type:
+        raw.append((b"content-type", content_type.encode()))
+    raw += [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+    await send({"type": "http.response.start", "status": status, "headers": raw})
+    await send({"type": "http.response.body", "body": body})
+
+def _build_environ(scope, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        key = name if name in ("CONTENT_TYPE", "CONTENT_LENGTH") else f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def _call_wsgi(wsgi_app, environ):
+    started = []
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    status, headers = started
+    return int(status.split(" ", 1)[0]), headers, b"".join(chunks)
+
+class AsgiApp:
+    def __init__(self, flask_app, routes):
+        self.flask_app = flask_app
+        self.routes = [(method, re.compile(pattern + "$"), handler) for method, pattern, handler in routes]
+        self.engine = make_async_engine(flask_app)
+        self.executor = ThreadPoolExecutor(max_workers=flask_app.config["ASGI_THREADS"],
+                                           thread_name_prefix="wsgi")
+
+    async def run_sync(self, fn, *args):
+        """Exécute `fn` dans le pool, dans un contexte d'application Flask (session SQL synchrone)."""
+        def call():
+            with self.flask_app.app_context():
+                return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        for method, pattern, handler in self.routes:
+            m = pattern.match(scope["path"])
+            if m and scope["method"] == method:
+                request = AsgiRequest(scope, receive)
+                with self.flask_app.app_context():
+                    return await handler(self, request, send, **{k: int(v) for k, v in m.groupdict().items()})
+        await self._fallback(scope, receive, send)
+
+    async def _fallback(self, scope, receive, send):
+        try:
+            body = await AsgiRequest(scope, receive).body(self.flask_app.config["MAX_CONTENT_LENGTH"])
+        except BodyTooLarge:
+            return await send_response(send, 413, b"")
+        except ConnectionResetError:
+            return
+        status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+            self.executor, _call_wsgi, self.flask_app.wsgi_app, _build_environ(scope, body))
+        raw = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+        await send({"type": "http.response.start", "status": status, "headers": raw})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+def create_asgi_app(flask_app):
+    from app.aio.routes import ROUTES
+    return AsgiApp(flask_app, ROUTES)
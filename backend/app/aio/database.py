@@ -0,0 +1,36 @@
+﻿from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.extensions import db
+
+# pilote asynchrone à utiliser pour chaque base du moteur synchrone
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def make_async_engine(flask_app):
+    """Moteur asynchrone sur la même base que `db` (ou ASYNC_DATABASE_URL si défini)."""
+    url = flask_app.config.get("ASYNC_DATABASE_URL")
+    if not url:
+        with flask_app.app_context():
+            # URL résolue par Flask-SQLAlchemy (chemin SQLite relatif à instance/)
+            sync_url = db.engine.url
+        driver = ASYNC_DRIVERS.get(sync_url.get_backend_name())
+        if driver is None:
+            raise RuntimeError(f"Pas de pilote asynchrone connu pour {sync_url.get_backend_name()!r}.")
+        url = sync_url.set(drivername=driver)
+    return create_async_engine(url)
+
+async def run(engine, plan):
+    """Exécute un plan de lecture de course_service sur le moteur asynchrone."""
+    try:
+        stmt = next(plan)
+    except StopIteration as stop:  # servi par le cache, sans requête
+        return stop.value
+    async with engine.connect() as conn:
+        try:
+            while True:
+                stmt = plan.send(await conn.execute(stmt))
+        except StopIteration as stop:
+            return stop.value
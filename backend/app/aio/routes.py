@@ -0,0 +1,189 @@
+﻿import asyncio
+
+from flask import current_app
+
+from app.aio.application import BodyTooLarge, send_response
+from app.aio.database import run
+from app.api.chapters import chapter_view, patch_chapter
+from app.api.export import EXPORT_MODES, export_filename
+from app.events.bus import get_bus
+from app.events.sse import format_event, replay
+from app.middleware.compression import choose_encoding, compress_body
+from app.serialization import serializers
+from app.services import course_service
+
+async def send_json(send, request, status, obj, headers=(), compress_key=None):
+    cfg = current_app.config
+    body = current_app.json.dumps(obj).encode("utf-8")
+    headers = list(headers)
+    if cfg["COMPRESS_ENABLED"] and len(body) >= cfg["COMPRESS_MIN_SIZE"]:
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding:
+            body = compress_body(body, encoding, cfg, compress_key, current_app.extensions["compression_cache"])
+            headers += [("content-encoding", encoding), ("vary", "Accept-Encoding")]
+    await send_response(send, status, body, headers, content_type="application/json")
+
+async def list_courses(app, request, send):
+    rows = await run(app.engine, course_service.plan_list_courses())
+    await send_json(send, request, 200, [serializers.course_summary(c) for c in rows])
+
+async def course_detail(app, request, send, course_id):
+    c = await run(app.engine, course_service.plan_course_snapshot(course_id))
+    if not c:
+        return await send_json(send, request, 404, {"error": "not found"})
+    await send_json(send, request, 200, serializers.course_detail(c, c.lessons, c.chapters()))
+
+async def quiz_by_lesson(app, request, send, lesson_id):
+    qz = await run(app.engine, course_service.plan_quiz_snapshot_by_lesson(lesson_id))
+    if not qz:
+        return await send_json(send, request, 200, {"quiz": None})
+    options = [op for qu in qz.questions for op in qu.options]
+    await send_json(send, request, 200, serializers.quiz_detail(qz, qz.questions, options))
+
+async def quiz_draw(app, request, send, lesson_id):
+    try:
+        count = int(request.args["count"]) if "count" in request.args else None
+        seed = int(request.args["seed"]) if "seed" in request.args else None
+    except ValueError:
+        count = seed = -1
+    if (count is not None and count < 1) or (seed is not None and seed < 0):
+        return await send_json(send, request, 400, {"error": "count et seed doivent être positifs"})
+    found = await run(app.engine, course_service.plan_quiz_draw(lesson_id, count, seed))
+    if not found:
+        return await send_json(send, request, 404, {"error": "not found"})
+    qz, seed, drawn = found
+    payload = serializers.quiz_detail(qz, [q for q, _ in drawn], [op for _, ops in drawn for op in ops])
+    await send_json(send, request, 200, {**payload, "seed": seed}, [("cache-control", "no-store")])
+
+async def chapter_detail(app, request, send, chapter_id):
+    rendered = request.args.get("view") == "rendered"
+    ch = await run(app.engine, course_service.plan_chapter_row(chapter_id, rendered))
+    if not ch:
+        return await send_json(send, request, 404, {"error": "not found"})
+    version, payload = chapter_view(ch, rendered, request.headers.get("if-none-match"))
+    headers = [("etag", f'W/"{version}"'), ("cache-control", "no-cache")]
+    if payload is None:
+        return await send_response(send, 304, b"", headers)
+    await send_json(send, request, 200, payload, headers, compress_key=version)
+
+async def chapter_upload(app, request, send, chapter_id):
+    """PATCH d'un chapitre (HTML complet ou delta) : le corps est reçu en asynchrone, l'écriture passe par course_service."""
+    try:
+        data = current_app.json.loads(await request.body(current_app.config["CHAPTER_PATCH_MAX_BYTES"]))
+    except BodyTooLarge:
+        return await send_json(send, request, 413, {"error": "Corps de requête trop volumineux."})
+    except ConnectionResetError:
+        return
+    except ValueError:
+        return await send_json(send, request, 400, {"error": "JSON invalide."})
+    body, status = await app.run_sync(patch_chapter, chapter_id, data)
+    await send_json(send, request, status, body)
+
+def _build_export(course_id, mode):
+    from app.scorm.builder import build_scorm_zip
+    from app.scorm.media import get_media_store
+    course = course_service.get_course_snapshot(course_id)
+    if not course:
+        return None
+    course.load_rendered()
+    return build_scorm_zip(course, per_lesson=mode == "lessons", media=get_media_store()).getvalue()
+
+async def export_scorm(app, request, send, course_id):
+    """Le zip est construit dans le pool de threads puis envoyé par morceaux (contre-pression ASGI)."""
+    mode = request.args.get("mode", "single")
+    if mode not in EXPORT_MODES:
+        return await send_json(send, request, 400, {"error": "mode doit être single ou lessons"})
+    data = await app.run_sync(_build_export, course_id, mode)
+    if data is None:
+        return await send_json(send, request, 404, {"error": "not found"})
+    filename = export_filename(course_id, mode)
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"application/zip"),
+        (b"content-length", str(len(data)).encode()),
+        (b"content-disposition", f'attachment; filename={filename}'.encode()),
+        (b"access-control-allow-origin", b"*"),
+    ]})
+    view = memoryview(data)
+    chunk = 64 * 1024
+    for start in range(0, len(view), chunk):
+        await send({"type": "http.response.body", "body": bytes(view[start:start + chunk]),
+                    "more_body": start + chunk < len(view)})
+    if not view:
+        await send({"type": "http.response.body", "body": b""})
+
+async def course_events(app, request, send, course_id):
+    """Flux SSE : une coroutine par client, sans thread ni limite de durée."""
+    if not await run(app.engine, course_service.plan_course_snapshot(course_id)):
+        return await send_json(send, request, 404, {"error": "not found"})
+    bus = get_bus()
+    dumps = current_app.json.dumps
+    heartbeat = current_app.config["EVENTS_HEARTBEAT"]
+    loop = asyncio.get_running_loop()
+    q = asyncio.Queue(maxsize=1000)
+
+    def put(ev):
+        try:
+            q.put_nowait(ev)
+        except asyncio.QueueFull:  # client trop lent : il reprendra avec Last-Event-ID
+            stream.cancel()
+
+    def on_event(ev):  # appelé depuis le thread qui a commité
+        try:
+            loop.call_soon_threadsafe(put, ev)
+        except RuntimeError:  # boucle fermée
+            pass
+
+    async def watch_disconnect():
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+        stream.cancel()
+
+    async def pump():
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            (b"access-control-allow-origin", b"*"),
+        ]})
+        msgs, last = replay(bus, course_id, request.headers.get("last-event-id") or request.args.get("last_event_id"), dumps)
+        await send({"type": "http.response.body", "body": ("retry: 3000\n\n" + "".join(msgs)).encode(), "more_body": True})
+        while True:
+            try:
+                ev = await asyncio.wait_for(q.get(), heartbeat)
+            except asyncio.TimeoutError:
+                await send({"type": "http.response.body", "body": b": ping\n\n", "more_body": True})
+                continue
+            if ev.seq <= last:
+                continue
+            last = ev.seq
+            msg = format_event(bus.format_id(ev), ev.type, dumps(ev.data))
+            await send({"type": "http.response.body", "body": msg.encode(), "more_body": True})
+
+    unsubscribe = bus.subscribe(course_id, on_event)
+    stream = asyncio.ensure_future(pump())
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        # wait() n'annule pas le flux : une CancelledError ici vient du serveur
+        # (arrêt, timeout) et est propagée après le nettoyage
+        await asyncio.wait({stream})
+    finally:
+        stream.cancel()
+        unsubscribe()
+        watcher.cancel()
+    if not stream.cancelled():
+        stream.result()  # erreur d'envoi de pump()
+    try:
+        await send({"type": "http.response.body", "body": b""})
+    except Exception:  # client déjà parti
+        pass
+
+ROUTES = (
+    ("GET", r"/api/courses", list_courses),
+    ("GET", r"/api/courses/(?P<course_id>\d+)", course_detail),
+    ("GET", r"/api/courses/(?P<course_id>\d+)/events", course_events),
+    ("GET", r"/api/quizzes/by-lesson/(?P<lesson_id>\d+)", quiz_by_lesson),
+    ("GET", r"/api/quizzes/by-lesson/(?P<lesson_id>\d+)/draw", quiz_draw),
+    ("GET", r"/api/chapters/(?P<chapter_id>\d+)", chapter_detail),
+    ("PATCH", r"/api/chapters/(?P<chapter_id>\d+)", chapter_upload),
+    ("GET", r"/api/export/scorm/(?P<course_id>\d+)", export_scorm),
+)
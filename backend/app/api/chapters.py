@@ -1,5 +1,10 @@
-﻿from flask import Blueprint, request, jsonify
-from app.services import course_service
+﻿from flask import Blueprint, current_app, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_etags
+from app.services import course_service, revision_service
+from app.serialization import serializers
+from app.middleware.compression import mark_immutable
+from app.content import html_pipeline
 
 bp = Blueprint("chapters", __name__, url_prefix="/api/chapters")
 
@@ -16,33 +21,75 @@ def add():
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
+def chapter_view(ch, rendered: bool, if_none_match) -> tuple:
+    """
+    (version, corps) du GET d'un chapitre : la version (updated_at, et version du
+    pipeline pour le rendu) identifie le contenu, ETag et clé de la forme
+    compressée en cache ; corps None si `if_none_match` la contient (304).
+    Partagé avec la route ASGI.
+    """
+    version = f"chapter-{ch.id}-{ch.updated_at.timestamp():.6f}"
+    if rendered:
+        version += f"-r{html_pipeline.PIPELINE_VERSION}"
+    if parse_etags(if_none_match).contains_weak(version):
+        return version, None
+    return version, serializers.chapter_rendered(ch) if rendered else serializers.chapter_detail(ch)
+
 @bp.get("/<int:chapter_id>")
 def get_one(chapter_id: int):
-    ch = course_service.get_chapter(chapter_id)
+    # ?view=rendered : HTML nettoyé servi aux apprenants, au lieu de la source éditée
+    rendered = request.args.get("view") == "rendered"
+    ch = course_service.get_chapter_row(chapter_id, rendered)
     if not ch:
         return jsonify({"error": "not found"}), 404
-    return jsonify({
-        "id": ch.id,
-        "lesson_id": ch.lesson_id,
-        "index": ch.index,
-        "title": ch.title,
-        "html_content": ch.html_content,
-    })
+    version, payload = chapter_view(ch, rendered, request.headers.get("If-None-Match"))
+    resp = jsonify(payload) if payload is not None else current_app.response_class(status=304)
+    resp.set_etag(version)
+    resp.headers["Cache-Control"] = "no-cache"
+    return mark_immutable(resp, version)
+
+def patch_chapter(chapter_id: int, data) -> tuple:
+    """
+    Corps JSON : `title`, et `html_content` (HTML complet) ou un delta sur la
+    version de hash `base_hash` (`html_hash` de GET / PATCH) : `html_delta`
+    (opérations [début, fin, texte], indices en points de code) ou `html_diff`
+    (diff unifié). 409 si le HTML a changé depuis `base_hash`. Renvoie (corps,
+    statut) ; partagé avec la route ASGI.
+    """
+    if not isinstance(data, dict):
+        data = {}
+    title = data.get("title") if "title" in data else None
+    try:
+        if "html_delta" in data or "html_diff" in data:
+            if "html_content" in data:
+                raise ValueError("html_content et html_delta / html_diff sont exclusifs.")
+            ch = course_service.patch_chapter_html(chapter_id, data.get("base_hash"), ops=data.get("html_delta"),
+                                                   diff=data.get("html_diff"), title=title)
+        else:
+            ch = course_service.update_chapter(
+                chapter_id, title=title,
+                html_content=data.get("html_content") if "html_content" in data else None,
+            )
+    except course_service.ChapterConflict as e:
+        return {"error": str(e), "html_hash": e.html_hash}, 409
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if not ch:
+        return {"error": "not found"}, 404
+    return {"id": ch.id, "title": ch.title, "html_hash": ch.html_hash}, 200
 
 @bp.patch("/<int:chapter_id>")
 def patch(chapter_id: int):
-    data = request.get_json(force=True) or {}
+    # corps lu une fois, sans copie gardée par la requête, et décodé directement depuis les octets
+    request.max_content_length = current_app.config["CHAPTER_PATCH_MAX_BYTES"]
     try:
-        ch = course_service.update_chapter(
-            chapter_id,
-            title=data.get("title") if "title" in data else None,
-            html_content=data.get("html_content") if "html_content" in data else None,
-        )
-        if not ch:
-            return jsonify({"error":"not found"}), 404
-        return jsonify({"id": ch.id, "title": ch.title})
-    except ValueError as e:
-        return jsonify({"error": str(e)}), 400
+        data = current_app.json.loads(request.get_data(cache=False))
+    except RequestEntityTooLarge:
+        return jsonify({"error": "Corps de requête trop volumineux."}), 413
+    except ValueError:
+        return jsonify({"error": "JSON invalide."}), 400
+    body, status = patch_chapter(chapter_id, data)
+    return jsonify(body), status
 
 @bp.delete("/<int:chapter_id>")
 def delete(chapter_id: int):
@@ -50,3 +97,48 @@ def delete(chapter_id: int):
     if not ok:
         return jsonify({"error":"not found"}), 404
     return ("", 204)
+
+# --- Historique ---
+@bp.get("/<int:chapter_id>/revisions")
+def revisions(chapter_id: int):
+    before = request.args.get("before", type=int)
+    limit = min(request.args.get("limit", 50, type=int), 200)
+    rows = revision_service.list_revisions(chapter_id, before=before, limit=limit)
+    if rows is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({
+        "revisions": [serializers.revision_summary(r) for r in rows],
+        "next_before": rows[-1].rev if len(rows) == limit else None,
+    })
+
+@bp.get("/<int:chapter_id>/revisions/<int:rev>")
+def revision(chapter_id: int, rev: int):
+    found = revision_service.get_revision(chapter_id, rev)
+    if not found:
+        return jsonify({"error": "not found"}), 404
+    meta, html = found
+    return jsonify({**serializers.revision_summary(meta), "html_content": html})
+
+@bp.get("/<int:chapter_id>/revisions/<int:rev>/diff")
+def revision_diff(chapter_id: int, rev: int):
+    """?to=<rev> (défaut : dernière révision), ?format=unified|ops"""
+    to = request.args.get("to", type=int) or revision_service.last_rev(chapter_id)
+    fmt = request.args.get("format", "unified")
+    if fmt not in ("unified", "ops"):
+        return jsonify({"error": "format invalide (unified|ops)"}), 400
+    result = revision_service.diff(chapter_id, rev, to, fmt) if to else None
+    if result is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"from": rev, "to": to, "format": fmt, "diff": result})
+
+@bp.post("/<int:chapter_id>/revisions/<int:rev>/restore")
+def revision_restore(chapter_id: int, rev: int):
+    try:
+        ch = course_service.restore_chapter_revision(chapter_id, rev)
+    except course_service.ChapterConflict as e:
+        return jsonify({"error": str(e), "html_hash": e.html_hash}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not ch:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"id": ch.id, "title": ch.title, "rev": revision_service.last_rev(chapter_id)})
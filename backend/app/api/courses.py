@@ -1,5 +1,8 @@
-﻿from flask import Blueprint, request, jsonify
+﻿from flask import Blueprint, Response, current_app, request, jsonify
 from app.services import course_service
+from app.serialization import serializers
+from app.events.bus import get_bus
+from app.events.sse import sse_stream
 
 bp = Blueprint("courses", __name__, url_prefix="/api/courses")
 
@@ -19,36 +22,27 @@ def create():
 @bp.get("")
 def list_():
     items = course_service.list_courses()
-    return jsonify([{
-        "id": c.id,
-        "title": c.title,
-        "lesson_count": c.lesson_count,
-        "has_certification": c.has_certification,
-        "created_at": c.created_at.isoformat(),
-        "updated_at": c.updated_at.isoformat(),
-    } for c in items])
+    return jsonify([serializers.course_summary(c) for c in items])
 
 @bp.get("/<int:course_id>")
 def detail(course_id: int):
-    c = course_service.get_course_detail(course_id)
+    c = course_service.get_course_snapshot(course_id)
     if not c:
         return jsonify({"error":"not found"}), 404
-    return jsonify({
-        "id": c.id,
-        "title": c.title,
-        "lesson_count": c.lesson_count,
-        "has_certification": c.has_certification,
-        "lessons": [{
-            "id": l.id,
-            "index": l.index,
-            "title": l.title,
-            "chapters": [{
-                "id": ch.id,
-                "index": ch.index,
-                "title": ch.title
-            } for ch in l.chapters]
-        } for l in c.lessons]
-    })
+    return jsonify(serializers.course_detail(c, c.lessons, c.chapters()))
+
+@bp.get("/<int:course_id>/events")
+def events(course_id: int):
+    if not course_service.get_course_snapshot(course_id):
+        return jsonify({"error":"not found"}), 404
+    cfg = current_app.config
+    # le générateur ne garde ni contexte de requête ni session SQL ouverts
+    stream = sse_stream(get_bus(), course_id,
+                        request.headers.get("Last-Event-ID") or request.args.get("last_event_id"),
+                        current_app.json.dumps,
+                        heartbeat=cfg["EVENTS_HEARTBEAT"], max_seconds=cfg["EVENTS_STREAM_MAX_SECONDS"])
+    return Response(stream, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @bp.patch("/<int:course_id>")
 def patch(course_id: int):
@@ -69,3 +63,31 @@ def delete(course_id: int):
     if not ok:
         return jsonify({"error":"not found"}), 404
     return ("", 204)
+
+@bp.post("/<int:course_id>/clone")
+def clone(course_id: int):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    title = data.get("title")
+    if title is not None and not isinstance(title, str):
+        return jsonify({"error": "title doit être un texte."}), 400
+    try:
+        new_id = course_service.clone_course(course_id, title=title)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if new_id is None:
+        return jsonify({"error":"not found"}), 404
+    return jsonify({"id": new_id}), 201
+
+@bp.post("/bulk-delete")
+def bulk_delete():
+    data = request.get_json(force=True) or {}
+    ids = data.get("ids")
+    if not isinstance(ids, list):
+        return jsonify({"error": "ids doit être une liste."}), 400
+    try:
+        n = course_service.delete_courses(ids)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"deleted": n})
@@ -1,16 +1,26 @@
-﻿from flask import Blueprint, send_file, abort
+﻿from flask import Blueprint, request, send_file, abort, jsonify
 from io import BytesIO
-from app.extensions import db
-from app.domain.models import Course
-from app.scorm.builder import build_scorm_zip
+from app.services import course_service
 
 bp = Blueprint("export", __name__, url_prefix="/api/export")
 
+EXPORT_MODES = ("single", "lessons")
+
+def export_filename(course_id: int, mode: str) -> str:
+    return f"course-{course_id}-scorm.zip" if mode == "single" else f"course-{course_id}-scorm-{mode}.zip"
+
 @bp.get("/scorm/<int:course_id>")
 def export_scorm(course_id: int):
-    course = Course.query.get(course_id)
+    # ?mode=lessons : un SCO par leçon (chargé et suivi leçon par leçon par le LMS)
+    mode = request.args.get("mode", "single")
+    if mode not in EXPORT_MODES:
+        return jsonify({"error": "mode doit être single ou lessons"}), 400
+    course = course_service.get_course_snapshot(course_id)
     if not course:
         abort(404)
-    buf: BytesIO = build_scorm_zip(course)
-    filename = f"course-{course_id}-scorm.zip"
+    course.load_rendered()
+    from app.scorm.builder import build_scorm_zip  # chargé au premier export
+    from app.scorm.media import get_media_store
+    buf: BytesIO = build_scorm_zip(course, per_lesson=mode == "lessons", media=get_media_store())
+    filename = export_filename(course_id, mode)
     return send_file(buf, mimetype="application/zip", as_attachment=True, download_name=filename)
@@ -0,0 +1,58 @@
+﻿import os
+
+from flask import Blueprint, Response, request, jsonify, send_file
+from app.services import course_service
+from app.middleware.compression import mark_immutable
+
+bp = Blueprint("preview", __name__, url_prefix="/api/preview")
+
+# Un fichier du package SCORM rendu seul, sans construire le zip : les liens
+# relatifs des pages restent valides sous /api/preview/<course_id>/ (un SCO)
+# ou /api/preview/<course_id>/lessons/ (un SCO par leçon).
+@bp.get("/<int:course_id>/")
+def index(course_id: int):
+    return _serve(course_id, "index.html", "single")
+
+@bp.get("/<int:course_id>/<path>")
+def page(course_id: int, path: str):
+    return _serve(course_id, path, "single")
+
+@bp.get("/<int:course_id>/lessons/<path>")
+def lesson_page(course_id: int, path: str):
+    return _serve(course_id, path, "lessons")
+
+@bp.get("/<int:course_id>/media/<name>")
+@bp.get("/<int:course_id>/lessons/media/<name>")
+def media_file(course_id: int, name: str):
+    # images optimisées (app.scorm.media) : nom = empreinte, donc immuables
+    from app.scorm.media import get_media_store
+    store = get_media_store()
+    path = store and store.path(name)
+    if not path or not os.path.exists(path) or not course_service.get_course_snapshot(course_id):
+        return jsonify({"error": "not found"}), 404
+    return send_file(path, max_age=365 * 24 * 3600)
+
+def _serve(course_id: int, path: str, mode: str):
+    course = course_service.get_course_snapshot(course_id)
+    if not course:
+        return jsonify({"error": "not found"}), 404
+    from app.scorm.builder import render_page  # chargé à la première prévisualisation
+    from app.scorm.media import get_media_store
+    media = get_media_store()
+
+    def render():
+        if path == "imsmanifest.xml" and media:
+            course.load_rendered()  # images de tous les chapitres
+        return render_page(course, path, per_lesson=mode == "lessons", media=media)
+
+    # mis en cache avec l'instantané : recalculé après toute modification du cours
+    found = course.page((mode, path), render)
+    if not found:
+        return jsonify({"error": "not found"}), 404
+    body, mimetype, digest = found
+    resp = Response(body, mimetype=mimetype)
+    # empreinte du contenu : les versions d'instantané sont propres à chaque processus
+    version = f"preview-{digest}"
+    resp.set_etag(version)
+    resp.headers["Cache-Control"] = "no-cache"
+    return mark_immutable(resp.make_conditional(request), version)
@@ -0,0 +1,28 @@
+﻿from flask import Blueprint, current_app, jsonify, request, send_file, abort
+
+from app.middleware.profiling import KINDS, token_matches
+
+bp = Blueprint("profiles", __name__, url_prefix="/api/profiles")
+
+@bp.before_request
+def authorize():
+    # même jeton que pour déclencher un profil ; sans jeton configuré, l'API n'existe pas
+    token = current_app.config["PROFILE_TOKEN"]
+    given = request.headers.get("X-Profile") or request.args.get("token")
+    if not token:
+        abort(404)
+    if not token_matches(given, token):
+        return jsonify({"error": "jeton de profilage requis"}), 403
+
+@bp.get("")
+def list_():
+    return jsonify(current_app.extensions["profile_store"].list())
+
+@bp.get("/<profile_id>.<kind>")
+def download(profile_id: str, kind: str):
+    store = current_app.extensions["profile_store"]
+    if kind not in KINDS or profile_id not in store.ids():
+        return jsonify({"error": "not found"}), 404
+    mimetype = {"json": "application/json", "collapsed": "text/plain"}.get(kind, "application/octet-stream")
+    return send_file(store.path(profile_id, kind), mimetype=mimetype, as_attachment=kind != "json",
+                     download_name=f"{profile_id}.{kind}", max_age=0)
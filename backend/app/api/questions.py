@@ -11,6 +11,7 @@ def add():
             quiz_id=int(data.get("quiz_id", 0)),
             text=data.get("text"),
             qtype=data.get("type", "single"),
+            tag=data.get("tag"),
         )
         return jsonify({"id": q.id}), 201
     except ValueError as e:
@@ -24,6 +25,7 @@ def patch(question_id: int):
             question_id,
             text=data.get("text") if "text" in data else None,
             qtype=data.get("type") if "type" in data else None,
+            tag=(data.get("tag") or "") if "tag" in data else None,
         )
         if not q: return jsonify({"error":"not found"}), 404
         return jsonify({"id": q.id})
@@ -1,5 +1,6 @@
 ﻿from flask import Blueprint, request, jsonify
 from app.services import course_service
+from app.serialization import serializers
 
 bp = Blueprint("quizzes", __name__, url_prefix="/api/quizzes")
 
@@ -16,20 +17,41 @@ def create_for_lesson():
 
 @bp.get("/by-lesson/<int:lesson_id>")
 def by_lesson(lesson_id: int):
-    qz = course_service.get_quiz_by_lesson(lesson_id)
+    qz = course_service.get_quiz_snapshot_by_lesson(lesson_id)
     if not qz:
         return jsonify({"quiz": None})
-    return jsonify({
-        "id": qz.id,
-        "lesson_id": qz.lesson_id,
-        "title": qz.title,
-        "questions": [{
-            "id": qu.id,
-            "index": qu.index,
-            "text": qu.text,
-            "type": qu.type,
-            "options": [{
-                "id": op.id, "text": op.text, "is_correct": op.is_correct
-            } for op in qu.options]
-        } for qu in qz.questions]
-    })
+    options = [op for qu in qz.questions for op in qu.options]
+    return jsonify(serializers.quiz_detail(qz, qz.questions, options))
+
+@bp.get("/by-lesson/<int:lesson_id>/draw")
+def draw(lesson_id: int):
+    """Tirage pour une tentative : ?count=N (défaut draw_count du quiz), ?seed= pour le reproduire."""
+    count = request.args.get("count", type=int)
+    seed = request.args.get("seed", type=int)
+    if (count is not None and count < 1) or (seed is not None and seed < 0):
+        return jsonify({"error": "count et seed doivent être positifs"}), 400
+    found = course_service.draw_quiz_by_lesson(lesson_id, count, seed)
+    if not found:
+        return jsonify({"error": "not found"}), 404
+    qz, seed, drawn = found
+    resp = jsonify({**serializers.quiz_detail(qz, [q for q, _ in drawn], [op for _, ops in drawn for op in ops]),
+                    "seed": seed})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@bp.patch("/<int:quiz_id>")
+def patch(quiz_id: int):
+    data = request.get_json(force=True) or {}
+    try:
+        qz = course_service.update_quiz(
+            quiz_id,
+            title=data.get("title") if "title" in data else None,
+            draw_count=(data.get("draw_count") or 0) if "draw_count" in data else None,
+            stratify_by_tag=data.get("stratify_by_tag") if "stratify_by_tag" in data else None,
+            shuffle_options=data.get("shuffle_options") if "shuffle_options" in data else None,
+        )
+        if not qz: return jsonify({"error": "not found"}), 404
+        return jsonify({"id": qz.id, "title": qz.title, "draw_count": qz.draw_count,
+                        "stratify_by_tag": qz.stratify_by_tag, "shuffle_options": qz.shuffle_options})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
@@ -0,0 +1,8 @@
+﻿from flask import Blueprint, jsonify
+from app.services import course_service
+
+bp = Blueprint("stats", __name__, url_prefix="/api/stats")
+
+@bp.get("")
+def rollup():
+    return jsonify(course_service.get_stats())
@@ -0,0 +1,149 @@
+﻿"""
+Fichiers d'archive des cours (app.services.archive_service), un par cours.
+
+Format : MAGIC, des trames JSON compressées (zlib), l'index des trames (JSON
+compressé : nom -> [position, longueur]) puis le pied (position et longueur de
+l'index, MAGIC). Les fichiers sont projetés en mémoire (mmap) et gardés ouverts
+dans une LRU par processus : une lecture ne décompresse que la trame demandée
+(le HTML d'un chapitre, ou les quiz du cours).
+
+Trames : "quiz" (lignes des tables quizzes, questions et answer_options, par
+nom de table) et
+"chapter-<id>" (html_content, html_rendered, pipeline_version).
+"""
+import json
+import mmap
+import os
+import secrets
+import struct
+import zlib
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from threading import Lock
+
+from flask import current_app
+from sqlalchemy import DateTime
+
+from app.content import html_pipeline
+from app.domain.models import Quiz, Question, AnswerOption
+
+MAGIC = b"ELARCH1\n"
+_FOOTER = struct.Struct("<QI8s")
+
+# même forme que les lignes de serializers.RENDITION_COLUMNS (serializers.rendition)
+ChapterContent = namedtuple("ChapterContent", "html_content html_rendered stale_source")
+
+def dump_rows(model, rows) -> dict:
+    """Lignes Core de `model` (toutes ses colonnes) en JSON ; dates au format ISO."""
+    columns = [c.name for c in model.__table__.c]
+    return {"columns": columns,
+            "rows": [[v.isoformat() if isinstance(v, datetime) else v for v in row] for row in rows]}
+
+def load_rows(model, data) -> list:
+    """Inverse de dump_rows : namedtuples aux noms des colonnes."""
+    Row = namedtuple(model.__name__ + "Row", data["columns"])
+    dates = [i for i, name in enumerate(data["columns"]) if isinstance(model.__table__.c[name].type, DateTime)]
+    out = []
+    for values in data["rows"]:
+        for i in dates:
+            if values[i] is not None:
+                values[i] = datetime.fromisoformat(values[i])
+        out.append(Row(*values))
+    return out
+
+def write(directory: str, course_id: int, frames: dict) -> str:
+    """Écrit (fsync) un nouveau fichier d'archive et renvoie son nom ; jamais de réécriture d'un fichier existant."""
+    os.makedirs(directory, exist_ok=True)
+    name = f"course-{course_id}-{secrets.token_hex(6)}.arc"
+    index = {}
+    tmp = os.path.join(directory, f".{name}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        for key, obj in frames.items():
+            data = zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+            index[key] = (f.tell(), len(data))
+            f.write(data)
+        data = zlib.compress(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+        offset = f.tell()
+        f.write(data)
+        f.write(_FOOTER.pack(offset, len(data), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(directory, name))
+    return name
+
+class BlobReader:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:  # la projection garde son propre descripteur
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset, length, magic = _FOOTER.unpack_from(self._mm, len(self._mm) - _FOOTER.size)
+        if magic != MAGIC or self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Fichier d'archive invalide : {path}")
+        self.index = json.loads(zlib.decompress(self._mm[offset:offset + length]))
+        self.size = len(self._mm)
+
+    def frame(self, key: str):
+        """Trame décodée, ou None si absente."""
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        return json.loads(zlib.decompress(self._mm[offset:offset + length]))
+
+class ReaderCache:
+    """
+    Fichiers ouverts, LRU bornée. Un lecteur écarté n'est pas fermé
+    explicitement : sa projection l'est quand plus aucune lecture ne l'utilise.
+    """
+
+    def __init__(self, directory: str, max_open: int):
+        self.directory = directory
+        self.max_open = max_open
+        self._lock = Lock()
+        self._items = OrderedDict()
+
+    def get(self, name: str) -> BlobReader:
+        with self._lock:
+            reader = self._items.get(name)
+            if reader is not None:
+                self._items.move_to_end(name)
+                return reader
+        reader = BlobReader(os.path.join(self.directory, name))
+        with self._lock:
+            self._items[name] = reader
+            while len(self._items) > self.max_open:
+                self._items.popitem(last=False)
+        return reader
+
+    def discard(self, name: str):
+        with self._lock:
+            self._items.pop(name, None)
+
+def get_readers() -> ReaderCache:
+    return current_app.extensions["archive_readers"]
+
+def _frame(name: str, key: str):
+    """Trame d'une archive ; None si le fichier a disparu (cours réhydraté entre-temps)."""
+    try:
+        return get_readers().get(name).frame(key)
+    except FileNotFoundError:
+        return None
+
+def quiz_rows(name: str):
+    """(quiz, questions, options) archivés, dans l'ordre des requêtes de course_service ; None si indisponible."""
+    data = _frame(name, "quiz")
+    if data is None:
+        return None
+    return tuple(load_rows(model, data[model.__tablename__]) for model in (Quiz, Question, AnswerOption))
+
+def chapter_content(name: str, chapter_id: int):
+    """HTML archivé d'un chapitre (ChapterContent), ou None si indisponible."""
+    data = _frame(name, f"chapter-{chapter_id}")
+    if data is None:
+        return None
+    fresh = data["pipeline_version"] == html_pipeline.PIPELINE_VERSION and data["html_rendered"] is not None
+    return ChapterContent(data["html_content"], data["html_rendered"], None if fresh else data["html_content"])
+
+def init_archive(app):
+    directory = app.config["ARCHIVE_DIR"] or os.path.join(app.instance_path, "archive")
+    app.extensions["archive_readers"] = ReaderCache(directory, app.config["ARCHIVE_OPEN_FILES"])
@@ -0,0 +1,362 @@
+﻿"""
+Cache en mémoire d'instantanés immuables de l'arbre d'un cours.
+
+Les instantanés utilisent __slots__ et des tuples, et reprennent les noms
+d'attributs des modèles ORM (lessons, chapters, quiz, questions, options,
+html_content…) : sérialiseurs et builder SCORM les acceptent indifféremment.
+Le HTML des chapitres (source ou rendu) n'est lu qu'à la demande, dans la base
+ou dans le fichier d'archive du cours (app.archive) selon son état au moment de
+la lecture ; les pages SCORM prévisualisées (/api/preview) sont gardées avec
+l'instantané. Ces lectures vont aux réplicas : une ligne dont le cours n'est
+pas à la version de l'instantané (réplica en retard) est relue sur le primaire.
+
+Chaque instantané porte la version du cours en base (courses.version), que
+course_service incrémente (mark_dirty) dans la transaction de chaque
+modification, et sa date de création : un id réutilisé après une suppression
+(ou par une copie) ne retrouve pas l'instantané de l'ancien cours. Chaque
+lecture relit les deux sur le primaire par clé primaire ; les modifications
+faites par un autre worker ou par une commande `flask …` sont donc vues dès
+leur commit. Les cours supprimés sont retirés du cache après le commit
+(discard). La taille totale est bornée par une LRU sur une estimation des
+octets occupés, y compris le HTML et les pages ajoutés après coup.
+"""
+import hashlib
+from array import array
+from collections import OrderedDict
+from threading import Lock
+from types import SimpleNamespace
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.archive import blob
+from app.domain.models import Course, Lesson, Chapter
+from app.replicas import primary
+from app.serialization import serializers as S
+
+_OBJ_OVERHEAD = 120  # estimation par instantané (objet + tuple)
+
+def _size(*strings) -> int:
+    return _OBJ_OVERHEAD + sum(len(s) for s in strings if s)
+
+def run_plan(plan):
+    """Exécute un plan de lecture (générateur de requêtes) sur la session synchrone."""
+    try:
+        stmt = next(plan)
+        while True:
+            stmt = plan.send(db.session.execute(stmt))
+    except StopIteration as stop:
+        return stop.value
+
+def _chapter_select(columns):
+    return (db.select(*columns, Course.archive_file, Course.created_at.label("course_created_at"),
+                      Course.version.label("course_version"))
+            .join(Lesson, Chapter.lesson_id == Lesson.id).join(Course, Lesson.course_id == Course.id))
+
+def _with_archive(row):
+    """Ligne avec le HTML archivé (html_content, html_rendered, stale_source) si le cours l'est ; None si le fichier a disparu."""
+    if not row.archive_file:
+        return row
+    content = blob.chapter_content(row.archive_file, row.id)
+    return None if content is None else SimpleNamespace(**{**row._asdict(), **content._asdict()})
+
+def plan_chapter(chapter_id: int, columns, fresh=None):
+    """
+    Plan : ligne du chapitre (`columns`, dont Chapter.id), son HTML lu dans la
+    table ou dans le fichier d'archive selon l'état du cours à cet instant ;
+    None si absent. La ligne est lue là où la session route la requête (réplica
+    pendant un GET) ; si `fresh(row)` la dit en retard sur les versions lues sur
+    le primaire, ou si elle manque alors que `fresh` est donné, elle y est relue.
+    """
+    stmt = _chapter_select(columns).where(Chapter.id == chapter_id)
+    row = (yield stmt).first()
+    if row is None and fresh is None:
+        return None
+    if row is not None and (fresh is None or fresh(row)):
+        found = _with_archive(row)
+        if found is not None:
+            return found
+    for _ in range(2):  # fichier disparu : cours réhydraté entre-temps, relu une fois
+        row = (yield primary(stmt)).first()
+        if row is None:
+            return None
+        found = _with_archive(row)
+        if found is not None:
+            return found
+    return row
+
+class OptionSnapshot:
+    __slots__ = ("id", "question_id", "text", "is_correct")
+
+    def __init__(self, id, question_id, text, is_correct):
+        self.id, self.question_id, self.text, self.is_correct = id, question_id, text, is_correct
+
+class QuestionSnapshot:
+    __slots__ = ("id", "index", "text", "type", "tag", "options")
+
+    def __init__(self, id, index, text, type, tag, options):
+        self.id, self.index, self.text, self.type, self.tag, self.options = id, index, text, type, tag, options
+
+class QuizSnapshot:
+    __slots__ = ("id", "lesson_id", "title", "draw_count", "stratify_by_tag", "shuffle_options",
+                 "questions", "strata")
+
+    def __init__(self, id, lesson_id, title, draw_count, stratify_by_tag, shuffle_options, questions):
+        self.id, self.lesson_id, self.title = id, lesson_id, title
+        self.draw_count, self.stratify_by_tag, self.shuffle_options = draw_count, stratify_by_tag, shuffle_options
+        self.questions = questions
+        # index de tirage précalculé : positions dans `questions` par tag (None : sans tag)
+        strata = {}
+        for i, q in enumerate(questions):
+            strata.setdefault(q.tag, array("I")).append(i)
+        self.strata = strata
+
+class ChapterSnapshot:
+    __slots__ = ("id", "lesson_id", "index", "title", "_html", "_rendered", "_course")
+
+    def __init__(self, id, lesson_id, index, title, course=None):
+        self.id, self.lesson_id, self.index, self.title = id, lesson_id, index, title
+        self._html = None
+        self._rendered = None
+        self._course = course
+
+    @property
+    def html_content(self) -> str:
+        if self._html is None:
+            row = run_plan(plan_chapter(self.id, (Chapter.id, Chapter.html_content), self._fresh))
+            self._set_html(row.html_content if row else "")
+        return self._html
+
+    @property
+    def html_rendered(self) -> str:
+        """Rendu du pipeline HTML (app.content.html_pipeline), servi par l'export."""
+        if self._rendered is None:
+            row = run_plan(plan_chapter(self.id, (Chapter.id, *S.RENDITION_COLUMNS), self._fresh))
+            self._set_rendered(S.rendition(row) if row else "")
+        return self._rendered
+
+    def _fresh(self, row) -> bool:
+        return self._course is None or self._course.fresh(row)
+
+    def _set_html(self, html: str):
+        self._html = html
+        self._account(html)
+
+    def _set_rendered(self, html: str):
+        self._rendered = html
+        self._account(html)
+
+    def _account(self, html: str):
+        if self._course is not None:
+            self._course.grow(len(html))
+
+class LessonSnapshot:
+    __slots__ = ("id", "index", "title", "chapters", "quiz")
+
+    def __init__(self, id, index, title, chapters, quiz):
+        self.id, self.index, self.title, self.chapters, self.quiz = id, index, title, chapters, quiz
+
+class CourseSnapshot:
+    __slots__ = ("id", "title", "lesson_count", "has_certification", "lessons", "created_at", "version",
+                 "nbytes", "pages", "cache")
+
+    def __init__(self, id, title, lesson_count, has_certification, created_at, version):
+        self.id, self.title, self.lesson_count, self.has_certification = id, title, lesson_count, has_certification
+        self.lessons = ()
+        self.created_at, self.version = created_at, version
+        self.nbytes = _size(title)
+        self.pages = {}  # clé -> (corps, type MIME, empreinte)
+        self.cache = None  # CourseTreeCache qui le garde
+
+    def fresh(self, row) -> bool:
+        """La ligne (de _chapter_select) a été lue sur le cours à la version de l'instantané."""
+        return row.course_created_at == self.created_at and row.course_version == self.version
+
+    def grow(self, nbytes: int):
+        """HTML ou page ajouté après coup : compté dans la taille du cache."""
+        self.nbytes += nbytes
+        if self.cache is not None:
+            self.cache.grew(self, nbytes)
+
+    def lesson(self, lesson_id: int):
+        for l in self.lessons:
+            if l.id == lesson_id:
+                return l
+        return None
+
+    def chapters(self):
+        return [ch for l in self.lessons for ch in l.chapters]
+
+    def page(self, key, render):
+        """
+        Fichier produit par `render()` ((texte, type MIME) ou None), mis en cache
+        avec l'instantané et donc recalculé à la version suivante du cours.
+        """
+        cached = self.pages.get(key)
+        if cached is None:
+            rendered = render()
+            if rendered is None:
+                return None
+            text, mimetype = rendered
+            body = text.encode("utf-8")
+            cached = self.pages[key] = (body, mimetype, hashlib.sha256(body).hexdigest()[:32])
+            self.grow(len(body))
+        return cached
+
+    def load_rendered(self):
+        """Charge en une requête le rendu des chapitres pas encore lus (export complet)."""
+        missing = {ch.id: ch for ch in self.chapters() if ch._rendered is None}
+        if not missing:
+            return
+        stmt = _chapter_select((Chapter.id, *S.RENDITION_COLUMNS)).where(Chapter.id.in_(missing))
+        for row in db.session.execute(stmt):
+            found = _with_archive(row) if self.fresh(row) else None
+            if found is not None:
+                missing.pop(row.id)._set_rendered(S.rendition(found))
+        if not missing:
+            return
+        # réplica en retard, ou cours réhydraté entre-temps : relus sur le primaire
+        for row in db.session.execute(primary(stmt.where(Chapter.id.in_(missing)))):
+            ch = missing.pop(row.id)
+            found = _with_archive(row)
+            if found is None:  # réhydraté entre-temps
+                ch.html_rendered
+            else:
+                ch._set_rendered(S.rendition(found))
+        for ch in missing.values():  # supprimés entre-temps
+            ch._set_rendered("")
+
+def build_snapshot(stamp, course, lessons, chapters, quizzes, questions, options) -> CourseSnapshot:
+    """
+    Assemble un instantané à partir de lignes (cours, leçons, chapitres, quiz,
+    questions, options) ; `stamp` : (created_at, version) du cours.
+    """
+    snap = CourseSnapshot(course.id, course.title, course.lesson_count, course.has_certification, *stamp)
+    size = 0
+    opts_by_q = {}
+    for o in options:
+        opts_by_q.setdefault(o.question_id, []).append(OptionSnapshot(o.id, o.question_id, o.text, o.is_correct))
+        size += _size(o.text)
+    qs_by_quiz = {}
+    for q in questions:
+        qs_by_quiz.setdefault(q.quiz_id, []).append(
+            QuestionSnapshot(q.id, q.index, q.text, q.type, q.tag, tuple(opts_by_q.get(q.id, ()))))
+        size += _size(q.text, q.type, q.tag) + 4
+    quiz_by_lesson = {}
+    for qz in quizzes:
+        quiz_by_lesson.setdefault(qz.lesson_id, QuizSnapshot(
+            qz.id, qz.lesson_id, qz.title, qz.draw_count, qz.stratify_by_tag, qz.shuffle_options,
+            tuple(qs_by_quiz.get(qz.id, ()))))
+        size += _size(qz.title)
+    chs_by_lesson = {}
+    for ch in chapters:
+        chs_by_lesson.setdefault(ch.lesson_id, []).append(ChapterSnapshot(ch.id, ch.lesson_id, ch.index, ch.title, snap))
+        size += _size(ch.title)
+    snap.lessons = tuple(
+        LessonSnapshot(l.id, l.index, l.title, tuple(chs_by_lesson.get(l.id, ())), quiz_by_lesson.get(l.id))
+        for l in lessons)
+    snap.nbytes += size + sum(_size(l.title) for l in lessons)
+    return snap
+
+class CourseTreeCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._items = OrderedDict()  # course_id -> CourseSnapshot
+        self._lesson_course = {}     # lesson_id -> course_id
+        self._nbytes = 0
+        self.hits = self.misses = 0
+
+    def lookup(self, course_id: int, created_at, version: int):
+        """Instantané de ce cours (created_at) à cette version (courses.version), ou None."""
+        with self._lock:
+            snap = self._items.get(course_id)
+            if snap is not None and snap.created_at == created_at and snap.version == version:
+                self._items.move_to_end(course_id)
+                self.hits += 1
+                return snap
+            self.misses += 1
+            return None
+
+    def course_id_for_lesson(self, lesson_id: int):
+        return self._lesson_course.get(lesson_id)
+
+    def store(self, snap: CourseSnapshot):
+        with self._lock:
+            current = self._items.get(snap.id)
+            if current is not None and current.created_at == snap.created_at and current.version > snap.version:
+                return  # construit entre-temps sur une version plus récente
+            if current is not None:
+                self._remove(current)
+            snap.cache = self
+            self._items[snap.id] = snap
+            self._nbytes += snap.nbytes
+            for l in snap.lessons:
+                self._lesson_course[l.id] = snap.id
+            self._evict()
+
+    def grew(self, snap: CourseSnapshot, nbytes: int):
+        with self._lock:
+            if self._items.get(snap.id) is snap:
+                self._nbytes += nbytes
+                self._evict()
+
+    def discard(self, course_ids):
+        """Retire les instantanés de ces cours (supprimés)."""
+        with self._lock:
+            for course_id in course_ids:
+                snap = self._items.get(course_id)
+                if snap is not None:
+                    self._remove(snap)
+
+    def _remove(self, snap: CourseSnapshot):
+        del self._items[snap.id]
+        snap.cache = None
+        self._nbytes -= snap.nbytes
+        for l in snap.lessons:
+            if self._lesson_course.get(l.id) == snap.id:
+                del self._lesson_course[l.id]
+
+    def _evict(self):
+        while self._nbytes > self.max_bytes and len(self._items) > 1:
+            self._remove(next(iter(self._items.values())))
+
+    def clear(self):
+        with self._lock:
+            for snap in self._items.values():
+                snap.cache = None
+            self._items.clear()
+            self._lesson_course.clear()
+            self._nbytes = 0
+
+def get_cache() -> CourseTreeCache:
+    return current_app.extensions["course_tree_cache"]
+
+def mark_dirty(*course_ids):
+    """
+    Incrémente la version des cours dans la transaction courante : tous les
+    processus reconstruisent leur instantané après le commit, aucun si elle est
+    annulée. La date de modification du cours n'est pas touchée.
+    """
+    if course_ids:
+        db.session.execute(db.update(Course).where(Course.id.in_(course_ids))
+                           .values(version=Course.version + 1, updated_at=Course.updated_at))
+
+def discard_after_commit(*course_ids):
+    """Retire les instantanés de ces cours du cache de ce processus après le commit (suppression)."""
+    db.session.info.setdefault("discard_courses", set()).update(course_ids)
+
+@event.listens_for(Session, "after_commit")
+def _discard_committed(session):
+    ids = session.info.pop("discard_courses", None)
+    if ids and has_app_context():
+        get_cache().discard(ids)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_discards(session, previous_transaction):
+    session.info.pop("discard_courses", None)
+
+def init_course_cache(app):
+    app.extensions["course_tree_cache"] = CourseTreeCache(app.config["COURSE_CACHE_MAX_BYTES"])
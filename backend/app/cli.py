@@ -0,0 +1,115 @@
+﻿"""Commandes `flask …` de maintenance."""
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.extensions import db
+from app.domain.models import Course
+from app.services import revision_service, content_service, archive_service
+
+revisions_cli = AppGroup("revisions", help="Historique des chapitres.")
+content_cli = AppGroup("content", help="Rendus HTML des chapitres.")
+replicas_cli = AppGroup("replicas", help="Réplicas en lecture (DB_READ_BINDS).")
+archive_cli = AppGroup("archive", help="Archivage des cours inactifs (ARCHIVE_DIR).")
+
+@revisions_cli.command("compact")
+@click.option("--chapter-id", type=int, help="Un seul chapitre (défaut : tous).")
+def compact(chapter_id):
+    """Compacte l'historique (révisions récentes conservées, une par jour au-delà)."""
+    if chapter_id:
+        removed = revision_service.compact(chapter_id)
+    else:
+        removed = revision_service.compact_all()
+    click.echo(f"{removed} révision(s) supprimée(s).")
+
+@content_cli.command("reprocess")
+@click.option("--workers", type=int, default=None, help="Processus de rendu (défaut : nombre de CPU).")
+@click.option("--batch-size", type=int, default=500, show_default=True)
+@click.option("--all", "force", is_flag=True, help="Recalcule aussi les rendus à jour.")
+def reprocess(workers, batch_size, force):
+    """Recalcule les rendus des chapitres absents ou produits par une autre version du pipeline."""
+    total, skipped = content_service.reprocess(workers=workers, force=force, batch_size=batch_size,
+                                               progress=lambda n: click.echo(f"{n} chapitre(s)…", err=True))
+    click.echo(f"{total} chapitre(s) retraité(s), {skipped} ignoré(s) car modifié(s) pendant le rendu.")
+
+@replicas_cli.command("status")
+def replicas_status():
+    """Teste chaque réplica (SELECT 1) et affiche son état de routage."""
+    down = current_app.extensions["replicas"].status()
+    for key in current_app.config["DB_READ_BINDS"]:
+        start = time.perf_counter()
+        try:
+            with db.engines[key].connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+            state = f"ok ({(time.perf_counter() - start) * 1000:.1f} ms)"
+        except Exception as e:
+            state = f"erreur : {e.__class__.__name__}: {e}"
+        if down.get(key):
+            state += f", écarté encore {down[key]:.0f} s"
+        click.echo(f"{key} {db.engines[key].url.render_as_string(hide_password=True)} : {state}")
+
+@replicas_cli.command("sync")
+def replicas_sync():
+    """Copie la base primaire dans chaque réplica (SQLite seulement, tests locaux)."""
+    primary = db.engines[None]
+    for key in current_app.config["DB_READ_BINDS"]:
+        replica = db.engines[key]
+        if primary.dialect.name != "sqlite" or replica.dialect.name != "sqlite":
+            raise click.ClickException("sync ne gère que des bases SQLite ; utiliser la réplication du SGBD.")
+        src, dst = primary.raw_connection(), replica.raw_connection()
+        try:
+            src.driver_connection.backup(dst.driver_connection)
+        finally:
+            dst.close(); src.close()
+        click.echo(f"{key} synchronisé.")
+
+@archive_cli.command("run")
+@click.option("--days", type=int, default=None, help="Inactivité minimale (défaut : ARCHIVE_AFTER_DAYS).")
+@click.option("--limit", type=int, default=None, help="Nombre maximal de cours archivés.")
+def archive_run(days, limit):
+    """Archive les cours sans modification depuis --days jours."""
+    if days is None:
+        days = current_app.config["ARCHIVE_AFTER_DAYS"]
+    total = archive_service.archive_cold(days, limit, progress=lambda cid: click.echo(f"cours {cid} archivé", err=True))
+    click.echo(f"{total} cours archivé(s).")
+
+@archive_cli.command("restore")
+@click.argument("course_ids", type=int, nargs=-1)
+@click.option("--all", "restore_all", is_flag=True, help="Tous les cours archivés (avant un retour de migration).")
+def archive_restore(course_ids, restore_all):
+    """Réhydrate des cours archivés."""
+    if restore_all:
+        course_ids = db.session.scalars(db.select(Course.id).where(Course.archive_file.is_not(None))).all()
+    if not course_ids:
+        raise click.UsageError("Indiquer des ids de cours ou --all.")
+    total = 0
+    for cid in course_ids:
+        try:
+            if archive_service.rehydrate(cid):
+                db.session.commit()
+                total += 1
+        except ValueError as e:
+            db.session.rollback()
+            click.echo(str(e), err=True)
+    click.echo(f"{total} cours réhydraté(s).")
+
+@archive_cli.command("status")
+def archive_status():
+    """Nombre de cours archivés et taille des fichiers."""
+    st = archive_service.status()
+    oldest = st["oldest_archived_at"].isoformat(timespec="seconds") if st["oldest_archived_at"] else "-"
+    click.echo(f"{st['archived_courses']} cours archivé(s), {st['bytes']} octet(s) dans {st['directory']} "
+               f"(plus ancien : {oldest}).")
+
+@archive_cli.command("gc")
+def archive_gc():
+    """Supprime les fichiers d'archive qu'aucun cours ne référence."""
+    click.echo(f"{archive_service.gc()} fichier(s) supprimé(s).")
+
+def init_cli(app):
+    app.cli.add_command(revisions_cli)
+    app.cli.add_command(content_cli)
+    app.cli.add_command(replicas_cli)
+    app.cli.add_command(archive_cli)
@@ -3,7 +3,60 @@
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # réplicas en lecture (app.replicas) : URL séparées par des virgules, binds replica1, replica2…
+    DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+    SQLALCHEMY_BINDS = {f"replica{i}": {"url": url, "pool_pre_ping": True}
+                        for i, url in enumerate(DATABASE_REPLICA_URLS, 1)}
+    DB_READ_BINDS = tuple(SQLALCHEMY_BINDS)
+    DB_REPLICA_RETRY_SECONDS = int(os.getenv("DB_REPLICA_RETRY_SECONDS", "10"))  # réplica en erreur écarté
+    DB_PRIMARY_PIN_SECONDS = int(os.getenv("DB_PRIMARY_PIN_SECONDS", "5"))  # lectures d'un client après écriture
     JSON_SORT_KEYS = False
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", str(16 * 1024 * 1024)))
+    # PATCH d'un chapitre (HTML complet ou delta) : corps refusé (413) au-delà
+    CHAPTER_PATCH_MAX_BYTES = int(os.getenv("CHAPTER_PATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+    JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")  # auto|orjson|stdlib
+    # compression des réponses (gzip, ou brotli si le paquet est installé)
+    COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "1") == "1"
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_QUALITY = 5
+    COMPRESS_STREAMING = True
+    COMPRESS_CACHE_MAX_BYTES = int(os.getenv("COMPRESS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    COMPRESS_MIMETYPES = ("application/json", "text/html", "text/plain", "text/css",
+                          "application/javascript", "image/svg+xml")
+    # cache en mémoire des arbres de cours (par processus)
+    COURSE_CACHE_MAX_BYTES = int(os.getenv("COURSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # flux d'événements SSE : backend "memory" (un processus), "database" (table
+    # course_events, partagée entre workers et serveurs) ou "module:Classe"
+    EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+    EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "0.5"))  # secondes, backend "database"
+    EVENTS_BUFFER_SIZE = 500          # événements conservés par cours pour la reprise
+    EVENTS_HEARTBEAT = 15             # secondes
+    EVENTS_STREAM_MAX_SECONDS = 300   # le client se reconnecte ensuite (Last-Event-ID)
+    # mode ASGI (asgi.py) : moteur asynchrone pour les lectures, pool pour le reste
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")  # défaut : DATABASE_URL + pilote async
+    ASGI_THREADS = int(os.getenv("ASGI_THREADS", "32"))
+    # profilage à la demande (app.middleware.profiling) : en-tête X-Profile ou ?_profile=<jeton>
+    PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")  # absent : déclenchement et /api/profiles désactivés
+    PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))  # 1 requête sur N (0 : jamais)
+    PROFILE_DIR = os.getenv("PROFILE_DIR")  # défaut : <instance>/profiles
+    PROFILE_MAX_PROFILES = int(os.getenv("PROFILE_MAX_PROFILES", "200"))
+    PROFILE_INTERVAL_MS = 5  # période d'échantillonnage des piles
+    # images des packages exportés (app.scorm.media) : réduites, réencodées (Pillow) et mises en cache
+    MEDIA_OPTIMIZE = os.getenv("MEDIA_OPTIMIZE", "1") == "1"
+    MEDIA_MAX_WIDTH = int(os.getenv("MEDIA_MAX_WIDTH", "1280"))
+    MEDIA_FORMAT = os.getenv("MEDIA_FORMAT", "webp")  # webp|jpeg (PNG pour les images transparentes)
+    MEDIA_QUALITY = 80
+    MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "0"))  # processus d'encodage (0 : nombre de CPU)
+    MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR")  # défaut : <instance>/media
+    # archivage des cours inactifs (app.services.archive_service, `flask archive run`)
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR")  # défaut : <instance>/archive ; partagé entre les serveurs
+    ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+    ARCHIVE_OPEN_FILES = 64  # fichiers d'archive gardés projetés en mémoire, par processus
+    # historique des chapitres : un instantané complet toutes les K révisions, des deltas entre
+    REVISIONS_SNAPSHOT_EVERY = 20     # K : au plus K lignes lues pour reconstruire une révision
+    REVISIONS_KEEP_RECENT = 50        # au-delà, une révision par jour après compactage
+    REVISIONS_COMPACT_EVERY = int(os.getenv("REVISIONS_COMPACT_EVERY", "100"))  # 0 : CLI seulement
 
 def load_config():
     return Config()
@@ -0,0 +1,252 @@
+﻿"""
+Chaîne de traitement du HTML des chapitres, exécutée à l'enregistrement.
+
+render() nettoie le HTML saisi ou collé (Word notamment) et produit la version
+servie aux apprenants :
+- liste blanche de balises et d'attributs ; script/style/iframe… supprimés avec
+  leur contenu (jusqu'à la fin de l'élément parent s'ils ne sont pas fermés),
+  balises inconnues (font, o:p, form, span sans attribut…) dépliées ;
+- URL limitées à http(s), mailto, tel, liens relatifs (et data:image pour img) ;
+  liens externes ouverts dans un nouvel onglet (rel="noopener noreferrer") ;
+- styles et classes Word (mso-*, Mso*) retirés, b/i normalisés en strong/em ;
+- éléments en ligne vides supprimés, espaces blancs réduits (hors pre).
+
+Fonction pure, sans dépendance : utilisable dans un pool de processus
+(`flask content reprocess`). Incrémenter PIPELINE_VERSION à chaque changement
+de sortie pour que les rendus existants soient recalculés.
+"""
+import re
+from html import escape
+from html.parser import HTMLParser
+
+PIPELINE_VERSION = 3
+
+_GLOBAL_ATTRS = {"class", "style", "title", "lang", "dir"}
+ALLOWED = {
+    "p": set(), "br": set(), "hr": set(), "div": set(), "span": set(),
+    "h1": set(), "h2": set(), "h3": set(), "h4": set(), "h5": set(), "h6": set(),
+    "strong": set(), "em": set(), "u": set(), "s": set(), "sub": set(), "sup": set(),
+    "small": set(), "mark": set(), "code": set(), "pre": set(), "blockquote": set(),
+    "ul": set(), "ol": {"start", "type"}, "li": set(),
+    "a": {"href", "target", "rel"},
+    "img": {"src", "alt", "width", "height"},
+    "figure": set(), "figcaption": set(),
+    "table": set(), "caption": set(), "thead": set(), "tbody": set(), "tfoot": set(), "tr": set(),
+    "th": {"colspan", "rowspan", "scope"}, "td": {"colspan", "rowspan"},
+    "video": {"src", "controls", "width", "height", "poster"}, "audio": {"src", "controls"},
+    "source": {"src", "type"},
+}
+RENAMED = {"b": "strong", "i": "em", "strike": "s"}
+DROPPED = {"script", "style", "head", "title", "iframe", "object", "embed", "noscript", "template",
+           "xml", "svg", "math", "textarea", "select", "button"}
+VOID = {"br", "hr", "img", "source", "meta", "link", "input", "col", "wbr", "embed"}
+BLOCK = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li", "pre", "blockquote", "hr",
+         "figure", "figcaption", "table", "caption", "thead", "tbody", "tfoot", "tr", "th", "td",
+         "video", "audio", "source", "br"}
+# supprimés s'ils n'ont aucun contenu
+REMOVABLE_EMPTY = {"span", "strong", "em", "u", "s", "sub", "sup", "small", "mark", "code", "a", "p"}
+ALLOWED_STYLES = {"color", "background-color", "text-align", "font-weight", "font-style", "text-decoration",
+                  "vertical-align", "width", "height", "margin-left", "padding-left", "list-style-type"}
+URL_ATTRS = {"href", "src", "poster"}
+_SCHEME = re.compile(r"^\s*([a-zA-Z][a-zA-Z0-9+.\-]*):")
+_SAFE_SCHEMES = {"http", "https", "mailto", "tel"}
+# retirés par les navigateurs avant l'analyse d'une URL (« jav&#x09;ascript: »)
+_URL_STRIPPED = re.compile(r"[\t\n\r]")
+_URL_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_WS = re.compile(r"[ \t\r\n\f]+")
+
+class _Element:
+    __slots__ = ("tag", "attrs", "children")
+
+    def __init__(self, tag, attrs):
+        self.tag, self.attrs, self.children = tag, attrs, []
+
+def _safe_url(value: str, tag: str, attr: str):
+    value = _URL_STRIPPED.sub("", value or "")
+    if _URL_CONTROL.search(value):
+        return None
+    value = value.strip()
+    m = _SCHEME.match(value)
+    if not m:
+        return value  # relatif, ancre
+    scheme = m.group(1).lower()
+    if scheme in _SAFE_SCHEMES:
+        return value
+    if scheme == "data" and tag == "img" and attr == "src" and value[5:].lower().startswith("image/"):
+        return value
+    return None
+
+def _clean_style(value: str):
+    kept = []
+    for decl in (value or "").split(";"):
+        name, sep, val = decl.partition(":")
+        name, val = name.strip().lower(), val.strip()
+        if not sep or name not in ALLOWED_STYLES or not val:
+            continue
+        low = val.lower()
+        if "url(" in low or "expression(" in low or "javascript:" in low:
+            continue
+        kept.append(f"{name}: {val}")
+    return "; ".join(kept) or None
+
+def _clean_attrs(tag: str, attrs):
+    allowed = ALLOWED[tag] | _GLOBAL_ATTRS
+    out = []
+    for name, value in attrs:
+        name = name.lower()
+        if name not in allowed or name.startswith("on"):
+            continue
+        value = value if value is not None else ""
+        if name in URL_ATTRS:
+            value = _safe_url(value, tag, name)
+        elif name == "style":
+            value = _clean_style(value)
+        elif name == "class":
+            value = " ".join(c for c in value.split() if not c.lower().startswith("mso")) or None
+        if value is not None:
+            out.append((name, value))
+    if tag == "a":
+        href = dict(out).get("href", "")
+        if re.match(r"^https?://", href, re.I):
+            out = [(n, v) for n, v in out if n not in ("target", "rel")]
+            out += [("target", "_blank"), ("rel", "noopener noreferrer")]
+    elif tag == "img" and not any(n == "alt" for n, _ in out):
+        out.append(("alt", ""))
+    return out
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Element(None, [])
+        self.stack = [self.root]
+        self.drop = None  # [balise, imbrication] de l'élément supprimé avec son contenu
+
+    def handle_starttag(self, tag, attrs):
+        tag = RENAMED.get(tag, tag)
+        if self.drop:
+            if tag == self.drop[0]:
+                self.drop[1] += 1
+            return
+        if tag in DROPPED:
+            if tag not in VOID:
+                self.drop = [tag, 1]
+            return
+        if tag not in ALLOWED:
+            return  # balise dépliée : seul son contenu est gardé
+        el = _Element(tag, _clean_attrs(tag, attrs))
+        if tag == "a" and not any(n == "href" for n, _ in el.attrs):
+            el.tag = None  # lien sans cible : déplié au rendu
+        self.stack[-1].children.append(el)
+        if tag not in VOID:
+            self.stack.append(el)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if RENAMED.get(tag, tag) not in VOID:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        tag = RENAMED.get(tag, tag)
+        if self.drop:
+            if tag == self.drop[0]:
+                self.drop[1] -= 1
+                if not self.drop[1]:
+                    self.drop = None
+                return
+            if not any(el.tag == tag for el in self.stack[1:]):
+                return
+            self.drop = None  # élément supprimé non fermé : s'arrête à la fin de son parent
+        if tag not in ALLOWED or tag in VOID:
+            return
+        for i in range(len(self.stack) - 1, 0, -1):
+            el = self.stack[i]
+            if el.tag == tag or (tag == "a" and el.tag is None and not el.attrs):
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        if not self.drop and data:
+            self.stack[-1].children.append(data)
+
+    def close(self):
+        if self.cdata_elem is not None and self.rawdata:
+            # <script>/<style> non fermé : le reste, gardé comme texte brut, est
+            # relu comme du HTML pour que la suppression s'arrête au parent
+            rest, self.rawdata = self.rawdata, ""
+            self.clear_cdata_mode()
+            self.feed(rest)
+        super().close()
+
+def _is_empty(el) -> bool:
+    return all(isinstance(c, str) and not c.strip(" \t\r\n\f") for c in el.children)
+
+def _normalize(el, in_pre=False):
+    """Dépliage, suppression des vides et réduction des espaces (récursif, en place)."""
+    out = []
+    for child in el.children:
+        if isinstance(child, str):
+            text = child if in_pre else _WS.sub(" ", child)
+            if text:
+                if out and isinstance(out[-1], str):
+                    out[-1] += text
+                else:
+                    out.append(text)
+            continue
+        _normalize(child, in_pre or child.tag == "pre")
+        unwrap = child.tag is None or (child.tag == "span" and not child.attrs)
+        if not unwrap and child.tag in REMOVABLE_EMPTY and child.tag not in VOID and _is_empty(child):
+            if child.children and child.tag != "p":
+                out.append(" ")  # <b> </b> : l'espace est conservé
+            continue
+        if unwrap:
+            for c in child.children:
+                if isinstance(c, str) and out and isinstance(out[-1], str):
+                    out[-1] += c
+                else:
+                    out.append(c)
+        else:
+            out.append(child)
+    if not in_pre:
+        out = _trim_around_blocks(out, el.tag in BLOCK or el.tag is None)
+    el.children = out
+
+def _trim_around_blocks(children, block_parent):
+    """Supprime les espaces sans effet : en bord de bloc et autour des éléments de bloc."""
+    def is_block(c):
+        return not isinstance(c, str) and c.tag in BLOCK
+    out = []
+    for i, c in enumerate(children):
+        if isinstance(c, str):
+            prev_block = is_block(children[i - 1]) if i > 0 else block_parent
+            next_block = is_block(children[i + 1]) if i + 1 < len(children) else block_parent
+            if prev_block:
+                c = c.lstrip(" ")
+            if next_block:
+                c = c.rstrip(" ")
+            if not c:
+                continue
+        out.append(c)
+    return out
+
+def _serialize(el, parts):
+    for c in el.children:
+        if isinstance(c, str):
+            parts.append(escape(c, quote=False).replace("\xa0", "&nbsp;"))
+            continue
+        attrs = "".join(f' {n}="{escape(v, quote=True)}"' for n, v in c.attrs)
+        parts.append(f"<{c.tag}{attrs}>")
+        if c.tag not in VOID:
+            _serialize(c, parts)
+            parts.append(f"</{c.tag}>")
+
+def render(html: str) -> str:
+    """Version nettoyée, normalisée et minifiée de `html`."""
+    if not html:
+        return ""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    _normalize(builder.root)
+    parts = []
+    _serialize(builder.root, parts)
+    return "".join(parts)
@@ -5,19 +5,34 @@ class TimestampMixin:
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
-class Course(db.Model, TimestampMixin):
+# Compteurs dénormalisés, maintenus transactionnellement par course_service.
+class CountersMixin:
+    chapter_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    option_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    html_bytes = db.Column(db.Integer, nullable=False, default=0, server_default="0")  # octets UTF-8
+
+class Course(db.Model, TimestampMixin, CountersMixin):
     __tablename__ = "courses"
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     lesson_count = db.Column(db.Integer, nullable=False, default=1)
     has_certification = db.Column(db.Boolean, nullable=False, default=False)
+    # cours archivé (app.services.archive_service) : HTML des chapitres et quiz
+    # dans ce fichier d'ARCHIVE_DIR, cours et leçons restent dans les tables
+    archived_at = db.Column(db.DateTime, nullable=True)
+    archive_file = db.Column(db.String(64), nullable=True)
+    # version de l'arbre du cours, incrémentée dans la transaction de chaque
+    # modification : clé des instantanés en cache (app.cache.course_tree)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     lessons = db.relationship("Lesson",
         backref="course",
         order_by="Lesson.index",
-        cascade="all, delete-orphan")
+        cascade="all, delete-orphan",
+        passive_deletes=True)
 
-class Lesson(db.Model, TimestampMixin):
+class Lesson(db.Model, TimestampMixin, CountersMixin):
     __tablename__ = "lessons"
     id = db.Column(db.Integer, primary_key=True)
     course_id = db.Column(db.Integer, db.ForeignKey("courses.id", ondelete="CASCADE"), nullable=False)
@@ -27,12 +42,14 @@ class Lesson(db.Model, TimestampMixin):
     chapters = db.relationship("Chapter",
         backref="lesson",
         order_by="Chapter.index",
-        cascade="all, delete-orphan")
+        cascade="all, delete-orphan",
+        passive_deletes=True)
 
     quiz = db.relationship("Quiz",
         backref="lesson",
         uselist=False,
-        cascade="all, delete-orphan")
+        cascade="all, delete-orphan",
+        passive_deletes=True)
 
 class Chapter(db.Model, TimestampMixin):
     __tablename__ = "chapters"
@@ -41,6 +58,58 @@ class Chapter(db.Model, TimestampMixin):
     index = db.Column(db.Integer, nullable=False)  # 1..M
     title = db.Column(db.String(255), nullable=False, default="")
     html_content = db.Column(db.Text, nullable=False, default="")
+    # Rendu servi aux apprenants (app.content.html_pipeline), calculé à
+    # l'enregistrement ; html_hash est le sha256 de html_content rendu.
+    html_rendered = db.Column(db.Text, nullable=True)
+    html_hash = db.Column(db.String(64), nullable=True, index=True)
+    pipeline_version = db.Column(db.Integer, nullable=True)
+
+    revisions = db.relationship("ChapterRevision",
+        backref="chapter",
+        lazy="dynamic",
+        order_by="ChapterRevision.rev.desc()",
+        cascade="all, delete-orphan",
+        passive_deletes=True)
+
+# Historique du HTML d'un chapitre : un instantané complet (`snapshot`) ouvre
+# chaque chaîne, suivi de deltas compressés (`delta`) par rapport à la révision
+# précédente de la chaîne ; `base_rev` est le numéro de l'instantané.
+class ChapterRevision(db.Model):
+    __tablename__ = "chapter_revisions"
+    __table_args__ = (db.UniqueConstraint("chapter_id", "rev"),)
+    id = db.Column(db.Integer, primary_key=True)
+    chapter_id = db.Column(db.Integer, db.ForeignKey("chapters.id", ondelete="CASCADE"), nullable=False)
+    rev = db.Column(db.Integer, nullable=False)  # 1..R (des trous après compactage)
+    base_rev = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # snapshot|delta
+    title = db.Column(db.String(255), nullable=False, default="")
+    size = db.Column(db.Integer, nullable=False)  # caractères du HTML reconstruit
+    content_hash = db.Column(db.String(64), nullable=False)  # sha256 du HTML
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib : HTML ou opérations JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+# Quiz, questions et options d'un cours archivé : leurs ids, pour retrouver le
+# cours à réhydrater avant une écriture.
+class ArchivedRow(db.Model):
+    __tablename__ = "archived_rows"
+    __table_args__ = (db.Index("ix_archived_rows_kind_row_id", "kind", "row_id"),)
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey("courses.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # nom de la table : quizzes|questions|answer_options
+    row_id = db.Column(db.Integer, nullable=False)
+
+# Événements des cours pour le backend partagé "database" (app.events.bus) :
+# numérotés par cours, les EVENTS_BUFFER_SIZE derniers sont gardés pour la
+# reprise. Pas de clé étrangère : course.deleted suit la suppression du cours.
+class CourseEvent(db.Model):
+    __tablename__ = "course_events"
+    __table_args__ = (db.UniqueConstraint("course_id", "seq"),)
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(64), nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
 # --- Quiz models ---
 class Quiz(db.Model, TimestampMixin):
@@ -48,8 +117,12 @@ class Quiz(db.Model, TimestampMixin):
     id = db.Column(db.Integer, primary_key=True)
     lesson_id = db.Column(db.Integer, db.ForeignKey("lessons.id", ondelete="CASCADE"), nullable=False)
     title = db.Column(db.String(255), nullable=False, default="Quiz")
+    # banque de questions : chaque tentative en tire `draw_count` (None : toutes, dans l'ordre)
+    draw_count = db.Column(db.Integer, nullable=True)
+    stratify_by_tag = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    shuffle_options = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
-    questions = db.relationship("Question", backref="quiz", cascade="all, delete-orphan", order_by="Question.index")
+    questions = db.relationship("Question", backref="quiz", cascade="all, delete-orphan", passive_deletes=True, order_by="Question.index")
 
 class Question(db.Model, TimestampMixin):
     __tablename__ = "questions"
@@ -58,8 +131,9 @@ class Question(db.Model, TimestampMixin):
     index = db.Column(db.Integer, nullable=False)  # 1..K
     text = db.Column(db.Text, nullable=False)
     type = db.Column(db.String(20), nullable=False, default="single")  # single|multiple
+    tag = db.Column(db.String(64), nullable=True)  # strate pour les tirages (thème, difficulté…)
 
-    options = db.relationship("AnswerOption", backref="question", cascade="all, delete-orphan", order_by="AnswerOption.id")
+    options = db.relationship("AnswerOption", backref="question", cascade="all, delete-orphan", passive_deletes=True, order_by="AnswerOption.id")
 
 class AnswerOption(db.Model, TimestampMixin):
     __tablename__ = "answer_options"
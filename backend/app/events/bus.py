@@ -0,0 +1,307 @@
+﻿"""
+Flux d'événements de modification des cours (Server-Sent Events).
+
+course_service met les événements en attente dans la session ; ils sont publiés
+après le commit (et abandonnés sur rollback). Le bus délègue à un backend
+interchangeable (EVENTS_BACKEND : "memory", "database" ou chemin
+"module:Classe") qui numérote les événements par cours, en garde les derniers
+pour la reprise (Last-Event-ID) et les diffuse aux abonnés. Le backend "memory"
+ne sert que les abonnés du processus qui publie ; "database" passe par la table
+course_events et sert tous les processus qui partagent la base (workers
+gunicorn, serveurs) : c'est le défaut de gunicorn.conf.py.
+"""
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from threading import Lock, Thread
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, exc
+from sqlalchemy.orm import Session
+from werkzeug.utils import import_string
+
+from app.extensions import db
+from app.domain.models import CourseEvent
+
+class Event:
+    __slots__ = ("course_id", "seq", "type", "data")
+
+    def __init__(self, course_id, seq, type, data):
+        self.course_id, self.seq, self.type, self.data = course_id, seq, type, data
+
+class InProcessBackend:
+    """Backend mémoire, limité au processus courant."""
+
+    def __init__(self, buffer_size: int = 500):
+        self.buffer_size = buffer_size
+        # les ids changent à chaque démarrage : un client revenant d'un autre
+        # processus est détecté et recharge tout
+        self._reset()
+
+    def _reset(self):
+        self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+        self._lock = Lock()
+        self._seq = {}          # course_id -> dernier numéro
+        self._buffers = {}      # course_id -> deque[Event]
+        self._subscribers = {}  # course_id -> set[callback]
+
+    def after_fork(self):
+        """Nouvelle époque dans chaque worker : sinon tous partageraient celle du maître."""
+        self._reset()
+
+    def publish(self, course_id, type, data) -> Event:
+        with self._lock:
+            seq = self._seq.get(course_id, 0) + 1
+            self._seq[course_id] = seq
+            ev = Event(course_id, seq, type, data)
+            self._buffers.setdefault(course_id, deque(maxlen=self.buffer_size)).append(ev)
+            callbacks = tuple(self._subscribers.get(course_id, ()))
+        for cb in callbacks:
+            cb(ev)
+        return ev
+
+    def since(self, course_id, seq):
+        """Événements postérieurs à `seq`, ou None si certains ne sont plus disponibles."""
+        with self._lock:
+            buf = tuple(self._buffers.get(course_id, ()))
+            last = self._seq.get(course_id, 0)
+        missed = [ev for ev in buf if ev.seq > seq]
+        if seq > last or len(missed) != last - seq:
+            return None
+        return missed
+
+    def last_seq(self, course_id) -> int:
+        with self._lock:
+            return self._seq.get(course_id, 0)
+
+    def subscribe(self, course_id, callback):
+        """Abonne `callback(event)` au cours ; renvoie la fonction de désabonnement."""
+        with self._lock:
+            self._subscribers.setdefault(course_id, set()).add(callback)
+
+        def unsubscribe():
+            with self._lock:
+                subs = self._subscribers.get(course_id)
+                if subs is not None:
+                    subs.discard(callback)
+                    if not subs:
+                        del self._subscribers[course_id]
+        return unsubscribe
+
+_GAP_GRACE = 2.0  # secondes d'attente d'un numéro manquant (commit concurrent) avant de le sauter
+
+class DatabaseBackend:
+    """
+    Backend partagé par les processus d'une même base : les événements sont
+    écrits dans course_events, et un thread par processus y lit les nouveaux
+    toutes les EVENTS_POLL_INTERVAL secondes, tant qu'il a des abonnés.
+    """
+    epoch = "db"  # numéros communs à tous les processus : Last-Event-ID valable partout
+
+    def __init__(self, buffer_size: int = 500):
+        self.buffer_size = buffer_size
+        self.app = None
+        self.interval = 0.5
+        self._db_engine = None
+        self._reset()
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config["EVENTS_POLL_INTERVAL"]
+
+    def _reset(self):
+        self._lock = Lock()
+        self._subscribers = {}  # course_id -> set[callback]
+        self._delivered = {}    # course_id -> dernier numéro diffusé
+        self._gaps = {}         # course_id -> instant (monotonic) où un numéro a manqué
+        self._last_id = 0       # dernier course_events.id lu par le thread
+        self._thread = None
+
+    def after_fork(self):
+        """Le thread de lecture n'existe que dans le processus qui l'a lancé."""
+        self._reset()
+
+    def _engine(self):
+        if self._db_engine is None:
+            with self.app.app_context():
+                self._db_engine = db.engine
+        return self._db_engine
+
+    def publish(self, course_id, type, data) -> Event:
+        t = CourseEvent.__table__
+        payload = json.dumps(data, default=str)
+        # numéro attribué par l'INSERT lui-même ; conflit avec un autre processus : rejoué
+        stmt = db.insert(t).from_select(
+            ["course_id", "seq", "type", "data", "created_at"],
+            db.select(db.literal(course_id), db.func.coalesce(db.func.max(t.c.seq), 0) + 1, db.literal(type),
+                      db.literal(payload), db.literal(datetime.utcnow(), db.DateTime))
+            .where(t.c.course_id == course_id),
+        ).returning(t.c.seq)
+        for attempt in range(5):
+            try:
+                with self._engine().begin() as conn:
+                    seq = conn.execute(stmt).scalar_one()
+                    conn.execute(db.delete(t).where(t.c.course_id == course_id, t.c.seq <= seq - self.buffer_size))
+                return Event(course_id, seq, type, data)
+            except exc.IntegrityError:
+                if attempt == 4:
+                    raise
+
+    def since(self, course_id, seq):
+        """Événements postérieurs à `seq`, ou None si certains ne sont plus disponibles."""
+        t = CourseEvent.__table__
+        with self._engine().connect() as conn:
+            rows = conn.execute(db.select(t.c.seq, t.c.type, t.c.data)
+                                .where(t.c.course_id == course_id, t.c.seq > seq).order_by(t.c.seq)).all()
+            if not rows:
+                return [] if seq <= self._last_seq(conn, course_id) else None
+        if [r.seq for r in rows] != list(range(seq + 1, seq + 1 + len(rows))):
+            return None
+        return [Event(course_id, r.seq, r.type, json.loads(r.data)) for r in rows]
+
+    def last_seq(self, course_id) -> int:
+        with self._engine().connect() as conn:
+            return self._last_seq(conn, course_id)
+
+    @staticmethod
+    def _last_seq(conn, course_id) -> int:
+        t = CourseEvent.__table__
+        return conn.scalar(db.select(db.func.coalesce(db.func.max(t.c.seq), 0)).where(t.c.course_id == course_id))
+
+    def subscribe(self, course_id, callback):
+        """Abonne `callback(event)` au cours ; renvoie la fonction de désabonnement."""
+        start = self.last_seq(course_id)
+        with self._lock:
+            self._subscribers.setdefault(course_id, set()).add(callback)
+            self._delivered.setdefault(course_id, start)
+            if self._thread is None:
+                with self._engine().connect() as conn:
+                    self._last_id = conn.scalar(db.select(db.func.coalesce(db.func.max(CourseEvent.id), 0)))
+                self._thread = Thread(target=self._run, name="course-events", daemon=True)
+                self._thread.start()
+
+        def unsubscribe():
+            with self._lock:
+                subs = self._subscribers.get(course_id)
+                if subs is not None:
+                    subs.discard(callback)
+                    if not subs:
+                        del self._subscribers[course_id]
+                        del self._delivered[course_id]
+        return unsubscribe
+
+    def _run(self):
+        engine = self._engine()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                self._poll(engine)
+            except exc.SQLAlchemyError as e:  # base indisponible : nouvel essai au tour suivant
+                self.app.logger.warning("Lecture des événements impossible : %s", e)
+
+    def _poll(self, engine):
+        t = CourseEvent.__table__
+        with engine.connect() as conn:
+            new = conn.execute(db.select(t.c.id, t.c.course_id).where(t.c.id > self._last_id)).all()
+            if new:
+                self._last_id = max(r.id for r in new)
+            with self._lock:
+                delivered = dict(self._delivered)
+            for course_id in set(self._gaps) - set(delivered):
+                del self._gaps[course_id]
+            # relus par cours et par numéro : un événement commité après un autre
+            # d'id plus grand n'est pas perdu
+            courses = ({r.course_id for r in new} | set(self._gaps)) & set(delivered)
+            if not courses:
+                return
+            rows = conn.execute(db.select(t.c.course_id, t.c.seq, t.c.type, t.c.data).where(db.or_(
+                *[db.and_(t.c.course_id == c, t.c.seq > delivered[c]) for c in courses]
+            )).order_by(t.c.course_id, t.c.seq)).all()
+        by_course = {}
+        for r in rows:
+            by_course.setdefault(r.course_id, []).append(r)
+        now = time.monotonic()
+        for course_id, course_rows in by_course.items():
+            last, events = delivered[course_id], []
+            for r in course_rows:
+                if r.seq != last + 1 and now - self._gaps.setdefault(course_id, now) < _GAP_GRACE:
+                    break
+                events.append(Event(course_id, r.seq, r.type, json.loads(r.data)))
+                last = r.seq
+            else:
+                self._gaps.pop(course_id, None)
+            with self._lock:
+                if course_id not in self._delivered:
+                    continue  # plus d'abonnés
+                self._delivered[course_id] = last
+                callbacks = tuple(self._subscribers[course_id])
+            for ev in events:
+                for cb in callbacks:
+                    cb(ev)
+
+BACKENDS = {"memory": InProcessBackend, "database": DatabaseBackend}
+
+class EventBus:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def format_id(self, ev) -> str:
+        return f"{self.backend.epoch}:{ev.seq}"
+
+    def parse_id(self, event_id):
+        """Numéro de séquence d'un Last-Event-ID, ou None s'il vient d'une autre époque."""
+        epoch, _, seq = (event_id or "").rpartition(":")
+        if epoch != self.backend.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, course_id, type, data):
+        return self.backend.publish(course_id, type, data)
+
+    def since(self, course_id, seq):
+        return self.backend.since(course_id, seq)
+
+    def last_seq(self, course_id):
+        return self.backend.last_seq(course_id)
+
+    def subscribe(self, course_id, callback):
+        return self.backend.subscribe(course_id, callback)
+
+    def after_fork(self):
+        reset = getattr(self.backend, "after_fork", None)
+        if reset:
+            reset()
+
+def get_bus() -> EventBus:
+    return current_app.extensions["event_bus"]
+
+def emit(course_id, event_type, **data):
+    """Met un événement en attente ; il sera publié après le commit de la session."""
+    db.session.info.setdefault("pending_events", []).append((course_id, event_type, data))
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    pending = session.info.pop("pending_events", None)
+    if pending and has_app_context():
+        bus = get_bus()
+        for course_id, event_type, data in pending:
+            bus.publish(course_id, event_type, data)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_pending(session, previous_transaction):
+    session.info.pop("pending_events", None)
+
+def init_events(app):
+    name = app.config["EVENTS_BACKEND"]
+    cls = BACKENDS.get(name) or import_string(name)
+    backend = cls(buffer_size=app.config["EVENTS_BUFFER_SIZE"])
+    init_app = getattr(backend, "init_app", None)
+    if init_app:
+        init_app(app)
+    app.extensions["event_bus"] = EventBus(backend)
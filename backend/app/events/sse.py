@@ -0,0 +1,58 @@
+﻿import queue
+import time
+
+def format_event(event_id, type, payload: str) -> str:
+    lines = [f"id: {event_id}", f"event: {type}"] if event_id else [f"event: {type}"]
+    lines += [f"data: {line}" for line in payload.splitlines() or [""]]
+    return "\n".join(lines) + "\n\n"
+
+def replay(bus, course_id, last_event_id, dumps):
+    """
+    (messages initiaux, dernier numéro envoyé). Sans Last-Event-ID exploitable, ou
+    si des événements ont été perdus, le client reçoit `reset` et doit recharger.
+    """
+    seq = bus.parse_id(last_event_id) if last_event_id else None
+    backlog = bus.since(course_id, seq) if seq is not None else None
+    if backlog is None:
+        last = bus.last_seq(course_id)
+        reset_id = f"{bus.backend.epoch}:{last}"
+        kind = "reset" if last_event_id else "ready"
+        return [format_event(reset_id, kind, dumps({"course_id": course_id}))], last
+    msgs = [format_event(bus.format_id(ev), ev.type, dumps(ev.data)) for ev in backlog]
+    return msgs, (backlog[-1].seq if backlog else seq)
+
+def sse_stream(bus, course_id, last_event_id, dumps, heartbeat=15, max_seconds=300, max_queue=1000):
+    """
+    Générateur SSE pour un serveur synchrone. Le flux est fermé après
+    `max_seconds` pour libérer le thread ; le client se reconnecte avec Last-Event-ID.
+    """
+    q = queue.Queue(maxsize=max_queue)
+    overflow = []
+
+    def on_event(ev):
+        try:
+            q.put_nowait(ev)
+        except queue.Full:
+            overflow.append(ev.seq)
+
+    unsubscribe = bus.subscribe(course_id, on_event)  # avant la reprise : rien n'est perdu
+    try:
+        yield "retry: 3000\n\n"
+        msgs, last = replay(bus, course_id, last_event_id, dumps)
+        yield from msgs
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            if overflow:
+                # client trop lent : il reprendra depuis le dernier id reçu
+                return
+            try:
+                ev = q.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0.01)))
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            if ev.seq <= last:
+                continue
+            last = ev.seq
+            yield format_event(bus.format_id(ev), ev.type, dumps(ev.data))
+    finally:
+        unsubscribe()
@@ -1,7 +1,21 @@
-﻿from flask_sqlalchemy import SQLAlchemy
+﻿from sqlite3 import Connection as SQLiteConnection
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 
-db = SQLAlchemy()
+from app.replicas import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 cors = CORS
+
+# SQLite n'applique les ON DELETE CASCADE que si les clés étrangères sont activées
+# sur chaque connexion : les suppressions passives (passive_deletes) en dépendent.
+@event.listens_for(Engine, "connect")
+def _sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, SQLiteConnection):
+        cur = dbapi_connection.cursor()
+        cur.execute("PRAGMA foreign_keys=ON")
+        cur.close()
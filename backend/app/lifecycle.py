@@ -0,0 +1,35 @@
+﻿"""
+Démarrage en production (wsgi.py, gunicorn --preload).
+
+warm_up() fait une fois, dans le processus maître, tout ce que les workers
+peuvent partager en copie sur écriture (imports paresseux, configuration des
+mappers), puis gc.freeze() pour que le ramasse-miettes des workers ne parcoure
+plus ces objets et ne copie donc pas leurs pages.
+after_fork() réinitialise dans chaque worker ce qui ne doit pas être partagé :
+connexions du pool et époque du flux d'événements.
+"""
+import gc
+from importlib import import_module
+
+from sqlalchemy.orm import configure_mappers
+
+from app.extensions import db
+from app.events.bus import get_bus
+
+# chargés à la demande en développement, mais avant le fork en production
+PRELOAD_MODULES = ("app.scorm.builder",)
+
+def warm_up(app, freeze: bool = True):
+    for name in PRELOAD_MODULES:
+        import_module(name)
+    configure_mappers()  # moteurs déjà créés par db.init_app dans create_app
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+def after_fork(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            # abandonne les connexions héritées sans les fermer (elles restent au maître)
+            engine.dispose(close=False)
+        get_bus().after_fork()
@@ -0,0 +1,128 @@
+﻿import gzip
+import zlib
+from collections import OrderedDict
+from threading import Lock
+
+from flask import current_app, request
+
+try:  # dépendance optionnelle
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+class PrecompressedCache:
+    """LRU des représentations compressées, bornée par le nombre total d'octets."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, encoding):
+        with self._lock:
+            body = self._items.get((key, encoding))
+            if body is not None:
+                self._items.move_to_end((key, encoding))
+            return body
+
+    def put(self, key, encoding, body: bytes):
+        if len(body) > self.max_bytes // 8:
+            return
+        with self._lock:
+            old = self._items.pop((key, encoding), None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[(key, encoding)] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+def mark_immutable(response, key: str):
+    """
+    Déclare `response` immuable pour `key` (qui doit changer avec le contenu, ex.
+    id + version) : sa forme compressée est alors mise en cache et réutilisée.
+    """
+    response.compress_key = key
+    return response
+
+def _negotiate(accept, encodings):
+    best, best_q = None, 0
+    for enc in encodings:
+        q = accept.quality(enc)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+def choose_encoding(accept):
+    """Meilleur codage accepté par `accept` (en-tête Accept-Encoding analysé), ou None."""
+    return _negotiate(accept, ("br", "gzip") if brotli else ("gzip",))
+
+def compress_body(body: bytes, encoding: str, cfg, key=None, cache=None) -> bytes:
+    """Compresse `body`, en passant par `cache` quand la réponse est immuable (`key`)."""
+    compressed = cache.get(key, encoding) if key and cache else None
+    if compressed is None:
+        compressed = _compress(body, encoding, cfg)
+        if key and cache:
+            cache.put(key, encoding, compressed)
+    return compressed
+
+def _compress(body: bytes, encoding: str, cfg) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=cfg["COMPRESS_BR_QUALITY"])
+    return gzip.compress(body, compresslevel=cfg["COMPRESS_LEVEL"], mtime=0)
+
+def _compress_stream(chunks, encoding: str, cfg):
+    # chaque morceau est vidé (sync flush) pour que le client le reçoive aussitôt
+    if encoding == "br":
+        c = brotli.Compressor(quality=cfg["COMPRESS_BR_QUALITY"])
+        for chunk in chunks:
+            out = c.process(chunk) + c.flush()
+            if out:
+                yield out
+        yield c.finish()
+    else:
+        c = zlib.compressobj(cfg["COMPRESS_LEVEL"], zlib.DEFLATED, 31)
+        for chunk in chunks:
+            out = c.compress(chunk) + c.flush(zlib.Z_SYNC_FLUSH)
+            if out:
+                yield out
+        yield c.flush()
+
+def compress_response(response):
+    cfg = current_app.config
+    if (not cfg["COMPRESS_ENABLED"]
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in cfg["COMPRESS_MIMETYPES"]):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        if not cfg["COMPRESS_STREAMING"]:
+            return response
+        chunks = response.iter_encoded()
+        response.response = _compress_stream(chunks, encoding, cfg)
+        response.headers.pop("Content-Length", None)
+        response.direct_passthrough = False
+    else:
+        body = response.get_data()
+        if len(body) < cfg["COMPRESS_MIN_SIZE"]:
+            return response
+        response.set_data(compress_body(body, encoding, cfg, getattr(response, "compress_key", None),
+                                        current_app.extensions["compression_cache"]))
+
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # même contenu, autre représentation : l'ETag fort ne vaut plus
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_compression(app):
+    app.extensions["compression_cache"] = PrecompressedCache(app.config["COMPRESS_CACHE_MAX_BYTES"])
+    app.after_request(compress_response)
@@ -0,0 +1,262 @@
+﻿"""
+Profilage à la demande de requêtes isolées (middleware WSGI).
+
+Une requête est profilée si elle porte le jeton PROFILE_TOKEN (en-tête
+`X-Profile: <jeton>` ou `?_profile=<jeton>`), ou une fois sur
+PROFILE_SAMPLE_EVERY. Deux modes :
+- `cprofile` (défaut sur jeton) : profileur déterministe, temps exacts par
+  fonction mais requête ralentie ;
+- `sample` (défaut en échantillonnage, `X-Profile-Mode: sample`) : pile du
+  thread de la requête relevée toutes les PROFILE_INTERVAL_MS, surcoût faible.
+
+Chaque profil donne trois fichiers dans PROFILE_DIR : <id>.json (requête,
+statut, durée), <id>.pstats (pstats / snakeviz ; reconstitué depuis les
+échantillons en mode `sample`) et <id>.collapsed (piles repliées pour
+flamegraph.pl ou speedscope). Seuls les PROFILE_MAX_PROFILES derniers sont
+gardés ; /api/profiles les liste et les sert. L'identifiant est renvoyé dans
+l'en-tête X-Profile-Id.
+"""
+import cProfile
+import hmac
+import itertools
+import json
+import marshal
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, unquote_plus
+
+KINDS = ("json", "pstats", "collapsed")
+MODES = ("cprofile", "sample")
+# jamais échantillonnés : consultation des profils et flux SSE sans fin
+_SKIP_PREFIXES = ("/api/profiles",)
+_SKIP_SUFFIXES = ("/events",)
+# un seul cProfile actif à la fois par processus (Python ≥ 3.12) : les
+# demandes concurrentes passent en mode `sample`
+_cprofile_lock = threading.Lock()
+
+class StackSampler:
+    """Relève périodiquement la pile d'un thread (sys._current_frames)."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()  # pile (racine d'abord) -> nombre d'échantillons
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+def collapsed(stacks: Counter) -> str:
+    """Format « piles repliées » : `f1;f2;f3 nombre` par ligne."""
+    lines = []
+    for stack, count in stacks.most_common():
+        frames = ";".join(f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+        lines.append(f"{frames} {count}")
+    return "\n".join(lines) + "\n"
+
+def stats_from_samples(stacks: Counter, interval: float, duration: float) -> dict:
+    """
+    Table pstats (format de marshal.dump) reconstituée depuis des échantillons :
+    appels = échantillons, temps propre = échantillons en sommet de pile.
+    """
+    if not stacks:  # requête plus courte que l'intervalle (pstats refuse une table vide)
+        return {("~", 0, "<aucun échantillon>"): (1, 1, duration, duration, {})}
+    stats = {}
+
+    def entry(func):
+        return stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+
+    for stack, count in stacks.items():
+        seconds = count * interval
+        entry(stack[-1])[2] += seconds
+        for func in set(stack):  # récursion comptée une fois dans le temps cumulé
+            e = entry(func)
+            e[0] += count; e[1] += count; e[3] += seconds
+        for caller, callee in set(zip(stack, stack[1:])):
+            callers = entry(callee)[4]
+            cc, nc, tt, ct = callers.get(caller, (0, 0, 0.0, 0.0))
+            callers[caller] = (cc + count, nc + count, tt, ct + seconds)
+    return {func: (cc, nc, tt, ct, callers) for func, (cc, nc, tt, ct, callers) in stats.items()}
+
+class ProfileStore:
+    """Répertoire borné de profils (les plus anciens sont supprimés)."""
+
+    def __init__(self, directory: str, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def path(self, profile_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.{kind}")
+
+    def save(self, meta: dict, stats: dict, stacks: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{secrets.token_hex(4)}"  # tri chronologique
+        with open(self.path(profile_id, "pstats"), "wb") as f:
+            marshal.dump(stats, f)
+        with open(self.path(profile_id, "collapsed"), "w", encoding="utf-8") as f:
+            f.write(stacks)
+        # écrit en dernier : un profil n'est listé qu'une fois complet
+        with open(self.path(profile_id, "json"), "w", encoding="utf-8") as f:
+            json.dump({"id": profile_id, **meta}, f)
+        self._prune()
+        return profile_id
+
+    def ids(self) -> list:
+        """Identifiants, du plus récent au plus ancien."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((n[:-5] for n in names if n.endswith(".json")), reverse=True)
+
+    def list(self) -> list:
+        out = []
+        for profile_id in self.ids():
+            try:
+                with open(self.path(profile_id, "json"), encoding="utf-8") as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # supprimé entre-temps
+        return out
+
+    def _prune(self):
+        with self._lock:
+            for profile_id in self.ids()[self.max_profiles:]:
+                for kind in KINDS:
+                    try:
+                        os.remove(self.path(profile_id, kind))
+                    except FileNotFoundError:
+                        pass
+
+def token_matches(given, expected) -> bool:
+    return bool(expected and given) and hmac.compare_digest(given.encode(), expected.encode())
+
+def _query_param(environ, name):
+    qs = environ.get("QUERY_STRING", "")
+    if name not in qs:
+        return None
+    values = parse_qs(qs).get(name)
+    return values[0] if values else None
+
+_PROFILE_PARAMS = ("_profile", "_profile_mode")
+
+def _stored_query(environ):
+    """Query string enregistrée avec le profil, sans le jeton ni le mode de profilage."""
+    parts = environ.get("QUERY_STRING", "").split("&")
+    return "&".join(p for p in parts if p and unquote_plus(p.partition("=")[0]) not in _PROFILE_PARAMS)
+
+class ProfilingMiddleware:
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        cfg = app.config
+        self.token = cfg["PROFILE_TOKEN"]
+        self.sample_every = cfg["PROFILE_SAMPLE_EVERY"]
+        self.interval = cfg["PROFILE_INTERVAL_MS"] / 1000
+        self.store = app.extensions["profile_store"]
+        self.logger = app.logger
+        self._counter = itertools.count(1)
+
+    def _mode(self, environ):
+        """Mode de profilage demandé pour cette requête, ou None."""
+        given = environ.get("HTTP_X_PROFILE") or _query_param(environ, "_profile")
+        if given and token_matches(given, self.token):
+            mode = environ.get("HTTP_X_PROFILE_MODE") or _query_param(environ, "_profile_mode")
+            return mode if mode in MODES else "cprofile"
+        path = environ.get("PATH_INFO", "")
+        if (self.sample_every and next(self._counter) % self.sample_every == 0
+                and not path.startswith(_SKIP_PREFIXES) and not path.endswith(_SKIP_SUFFIXES)):
+            return "sample"
+        return None
+
+    def __call__(self, environ, start_response):
+        mode = self._mode(environ)
+        if mode is None:
+            return self.wsgi_app(environ, start_response)
+        return self._profile(environ, start_response, mode)
+
+    def _profile(self, environ, start_response, mode):
+        started_response, chunks = [], []
+
+        def start(status, headers, exc_info=None):
+            # réponse transmise après l'enregistrement, avec l'identifiant du profil
+            started_response[:] = [status, list(headers), exc_info]
+            return chunks.append
+
+        profiler = None
+        if mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        else:
+            mode = "sample"
+        sampler = StackSampler(threading.get_ident(), self.interval).start()
+        started = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            try:
+                # corps lu dans la requête : sa génération fait partie du profil
+                result = self.wsgi_app(environ, start)
+                try:
+                    chunks.extend(result)
+                finally:
+                    if hasattr(result, "close"):
+                        result.close()
+            finally:
+                if profiler:
+                    profiler.disable()
+        finally:
+            if profiler:
+                _cprofile_lock.release()
+            sampler.stop()
+        duration = time.perf_counter() - started
+
+        if profiler:
+            profiler.create_stats()
+            stats = profiler.stats
+        else:
+            stats = stats_from_samples(sampler.stacks, self.interval, duration)
+        status, headers, exc_info = started_response
+        meta = {
+            "method": environ.get("REQUEST_METHOD"),
+            "path": environ.get("PATH_INFO"),
+            "query": _stored_query(environ),
+            "status": int(status.split(" ", 1)[0]),
+            "duration_ms": round(duration * 1000, 1),
+            "mode": mode,
+            "samples": sum(sampler.stacks.values()),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        try:
+            headers.append(("X-Profile-Id", self.store.save(meta, stats, collapsed(sampler.stacks))))
+        except OSError:
+            self.logger.exception("Profil de %s %s non enregistré", meta["method"], meta["path"])
+        start_response(status, headers, exc_info)
+        return chunks
+
+def init_profiling(app):
+    directory = app.config["PROFILE_DIR"] or os.path.join(app.instance_path, "profiles")
+    app.extensions["profile_store"] = ProfileStore(directory, app.config["PROFILE_MAX_PROFILES"])
+    if app.config["PROFILE_TOKEN"] or app.config["PROFILE_SAMPLE_EVERY"]:
+        app.wsgi_app = ProfilingMiddleware(app.wsgi_app, app)
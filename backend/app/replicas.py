@@ -0,0 +1,119 @@
+﻿"""
+Routage des lectures vers des réplicas (binds SQLALCHEMY_BINDS listés dans DB_READ_BINDS).
+
+db.session est une RoutingSession : pendant une requête GET/HEAD, ses SELECT
+vont à un réplica choisi en tourniquet (un seul par requête, pour des lectures
+cohérentes entre elles) ; tout le reste va au primaire (bind par défaut) :
+écritures, requêtes POST/PATCH/DELETE, CLI, threads d'arrière-plan.
+
+Lire ses propres écritures :
+- dès qu'une session écrit (flush, UPDATE/INSERT/DELETE), elle ne lit plus que
+  sur le primaire ;
+- le client reçoit un cookie qui garde ses lectures sur le primaire pendant
+  DB_PRIMARY_PIN_SECONDS (retard de réplication) ;
+- les requêtes marquées `.execution_options(db_primary=True)` vont toujours au
+  primaire : les lectures mises en cache ou servies à l'éditeur (le front servi
+  depuis une autre origine n'envoie pas le cookie) n'y lisent qu'une version
+  par clé primaire (courses.version, chapters.updated_at) ; les données sont
+  lues sur le réplica, et relues sur le primaire si elles n'ont pas cette version.
+
+Un réplica en erreur de connexion est écarté pendant DB_REPLICA_RETRY_SECONDS
+et la lecture est rejouée sur un autre réplica, ou sur le primaire.
+"""
+import itertools
+import time
+
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc
+from sqlalchemy.sql import Select
+
+PIN_COOKIE = "db_primary"
+
+def primary(stmt):
+    """`stmt` toujours exécutée sur le primaire (lecture dont le résultat est mis en cache)."""
+    return stmt.execution_options(db_primary=True)
+
+class ReplicaPool:
+    """Réplicas disponibles : tourniquet et mise à l'écart temporaire après une erreur."""
+
+    def __init__(self, keys, retry_after: float):
+        self.keys = tuple(keys)
+        self.retry_after = retry_after
+        self._next = itertools.count()
+        self._down = {}  # clé -> instant (monotonic) de remise en service
+
+    def pick(self):
+        """Clé du prochain réplica disponible, ou None (lecture sur le primaire)."""
+        n = len(self.keys)
+        if not n:
+            return None
+        start, now = next(self._next), time.monotonic()
+        for i in range(n):
+            key = self.keys[(start + i) % n]
+            if self._down.get(key, 0) <= now:
+                return key
+        return None
+
+    def mark_down(self, key):
+        self._down[key] = time.monotonic() + self.retry_after
+
+    def status(self) -> dict:
+        """{clé: secondes avant remise en service (0 : disponible)}."""
+        now = time.monotonic()
+        return {key: max(0.0, self._down.get(key, 0) - now) for key in self.keys}
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or (clause is not None and not isinstance(clause, Select)):
+                self.info["db_wrote"] = True  # la session ne lit plus que sur le primaire
+                self.info.pop("db_replica_key", None)
+            elif (self.info.get("db_replica") and not self.info.get("db_wrote") and isinstance(clause, Select)
+                  and not clause.get_execution_options().get("db_primary")):
+                key = self.info.get("db_replica_key") or current_app.extensions["replicas"].pick()
+                if key is not None:
+                    self.info["db_replica_key"] = key
+                    return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._failover(super().execute, args, kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self._failover(super().scalar, args, kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self._failover(super().scalars, args, kwargs)
+
+    def _failover(self, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except (exc.OperationalError, exc.InterfaceError) as e:
+            key = self.info.pop("db_replica_key", None)
+            if key is None or self.info.get("db_wrote"):
+                raise
+            current_app.extensions["replicas"].mark_down(key)
+            current_app.logger.warning("Réplica %s écarté pendant %ss : %s", key,
+                                       current_app.config["DB_REPLICA_RETRY_SECONDS"], e.orig or e)
+            self.rollback()  # session en lecture seule : rien d'autre n'est perdu
+            return self._failover(fn, args, kwargs)
+
+def _route_request():
+    if request.method in ("GET", "HEAD") and not request.cookies.get(PIN_COOKIE):
+        current_app.extensions["sqlalchemy"].session.info["db_replica"] = True
+
+def _pin_client(response):
+    session = current_app.extensions["sqlalchemy"].session
+    if session.info.get("db_wrote"):
+        seconds = current_app.config["DB_PRIMARY_PIN_SECONDS"]
+        if seconds:
+            response.set_cookie(PIN_COOKIE, "1", max_age=seconds, httponly=True, samesite="Lax")
+    return response
+
+def init_replicas(app):
+    keys = app.config["DB_READ_BINDS"]
+    app.extensions["replicas"] = ReplicaPool(keys, app.config["DB_REPLICA_RETRY_SECONDS"])
+    if keys:
+        app.before_request(_route_request)
+        app.after_request(_pin_client)
@@ -1,48 +1,135 @@
-﻿from io import BytesIO
-from zipfile import ZipFile, ZIP_DEFLATED
+﻿import re
+from io import BytesIO
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 from markupsafe import Markup, escape
 from typing import Any
 
-from app.domain.models import Course, Lesson
+from app.content import html_pipeline
+from app.domain.models import Course, Lesson, Chapter
 
 def _xml_escape(s: str) -> str:
     return (s or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
 
-def build_scorm_zip(course: Course) -> BytesIO:
+def build_scorm_zip(course: Course, per_lesson: bool = False, media=None) -> BytesIO:
     """
-    Construit un package SCORM 1.2 minimal pour `course`.
-    - 1 SCO: index.html
+    Construit un package SCORM 1.2 minimal pour `course` (modèle ORM ou
+    instantané `app.cache.course_tree`, mêmes attributs).
+    - 1 SCO: index.html ; ou, si `per_lesson`, 1 SCO par leçon : lesson-<lesson_id>.html
+      et ses pages, scorm_api.js étant une ressource partagée (<dependency>)
     - pages chapitre: lesson-<lesson_id>-chapter-<chapter_id>.html
-    - pages quiz: quiz-<lesson_id>.html (si questions)
-    - imsmanifest.xml
+    - pages quiz: quiz-<lesson_id>.html (si questions) ; banque tirée côté
+      client depuis quiz-<lesson_id>-pool.js si le quiz a un draw_count
+    - imsmanifest.xml, écrit au fil de l'eau (un élément par leçon)
+    - avec `media` (app.scorm.media.MediaStore) : images des chapitres optimisées
+      dans media/, référencées par les ressources des leçons qui les affichent
     """
+    pages = _optimize_media(media, [ch for l in course.lessons for ch in l.chapters]) if media else {}
     mem = BytesIO()
     with ZipFile(mem, "w", ZIP_DEFLATED) as z:
         # wrapper API SCORM
         z.writestr("scorm_api.js", _SCORM_API_JS)
         # sommaire
-        z.writestr("index.html", _render_index(course))
-        # chapitres
+        if not per_lesson:
+            z.writestr("index.html", _render_index(course))
         for l in course.lessons:
+            home = "index.html"
+            if per_lesson:
+                home = _lesson_href(l)
+                z.writestr(home, _render_lesson_index(course, l))
             for ch in l.chapters:
-                z.writestr(f"lesson-{l.id}-chapter-{ch.id}.html", _render_chapter_page(course, l, ch))
-        # quiz par leçon (si présent)
-        for l in course.lessons:
-            if l.quiz and l.quiz.questions:
-                z.writestr(f"quiz-{l.id}.html", _render_quiz_page(course, l))
+                html = pages[ch.id][0] if pages else None
+                z.writestr(_chapter_href(l, ch), _render_chapter_page(course, l, ch, home, _ends_sco(l, ch, per_lesson), html))
+            # quiz de la leçon (si présent)
+            if _has_quiz(l):
+                if l.quiz.draw_count:
+                    z.writestr(f"quiz-{l.id}-pool.js", _render_quiz_pool(l.quiz))
+                z.writestr(f"quiz-{l.id}.html", _render_quiz_page(course, l, home))
+        # images déjà compressées : stockées sans deflate
+        for name in sorted({name for _, names in pages.values() for name in names}):
+            z.write(media.path(name), f"media/{name}", compress_type=ZIP_STORED)
         # manifest
-        z.writestr("imsmanifest.xml", _render_manifest(course))
+        with z.open("imsmanifest.xml", "w") as f:
+            for part in _iter_manifest(course, per_lesson, _lesson_media(course, pages)):
+                f.write(part.encode("utf-8"))
     mem.seek(0)
     return mem
 
+_PAGE = re.compile(r"lesson-(\d+)(?:-chapter-(\d+))?\.html|quiz-(\d+)(\.html|-pool\.js)")
+HTML, JS, XML = "text/html", "application/javascript", "application/xml"
+
+def render_page(course: Course, path: str, per_lesson: bool = False, media=None):
+    """
+    Un seul fichier du package, sans construire le zip : (contenu, type MIME),
+    ou None si `path` n'y figure pas. Seul ce qui est affiché est lu : le rendu
+    HTML d'un chapitre n'est chargé que pour sa propre page. Les fichiers de
+    media/ sont servis par le magasin `media` lui-même.
+    """
+    if path == "scorm_api.js":
+        return _SCORM_API_JS, JS
+    if path == "imsmanifest.xml":
+        pages = _optimize_media(media, [ch for l in course.lessons for ch in l.chapters]) if media else {}
+        return "".join(_iter_manifest(course, per_lesson, _lesson_media(course, pages))), XML
+    if path == "index.html":
+        return None if per_lesson else (_render_index(course), HTML)
+    m = _PAGE.fullmatch(path)
+    if not m:
+        return None
+    lesson_id = int(m.group(1) or m.group(3))
+    l = next((l for l in course.lessons if l.id == lesson_id), None)
+    if l is None:
+        return None
+    home = _lesson_href(l) if per_lesson else "index.html"
+    if m.group(2):
+        ch = next((ch for ch in l.chapters if ch.id == int(m.group(2))), None)
+        if ch is None:
+            return None
+        html = _optimize_media(media, [ch])[ch.id][0] if media else None
+        return _render_chapter_page(course, l, ch, home, _ends_sco(l, ch, per_lesson), html), HTML
+    if m.group(1):
+        return (_render_lesson_index(course, l), HTML) if per_lesson else None
+    if not _has_quiz(l):
+        return None
+    if m.group(4) == ".html":
+        return _render_quiz_page(course, l, home), HTML
+    return (_render_quiz_pool(l.quiz), JS) if l.quiz.draw_count else None
+
+def _optimize_media(media, chapters) -> dict:
+    """{chapter_id: (HTML réécrit, noms des fichiers de media/)}, en un seul passage du magasin."""
+    return dict(zip((ch.id for ch in chapters), media.process([_chapter_html(ch) for ch in chapters])))
+
+def _lesson_media(course, pages) -> dict:
+    """Fichiers de media/ affichés par chaque leçon."""
+    return {l.id: sorted({name for ch in l.chapters for name in pages[ch.id][1]}) for l in course.lessons} if pages else {}
+
+def _ends_sco(lesson, ch, per_lesson: bool) -> bool:
+    """Sans quiz, la dernière page d'une leçon termine son SCO (mode une leçon par SCO)."""
+    return per_lesson and ch is lesson.chapters[-1] and not _has_quiz(lesson)
+
+def _has_quiz(lesson) -> bool:
+    return bool(lesson.quiz and lesson.quiz.questions)
+
+def _lesson_href(lesson) -> str:
+    return f"lesson-{lesson.id}.html"
+
+def _chapter_href(lesson, ch) -> str:
+    return f"lesson-{lesson.id}-chapter-{ch.id}.html"
+
+def _lesson_files(lesson, media=()) -> list:
+    """Pages et images de la leçon dans le package (hors page d'entrée)."""
+    files = [_chapter_href(lesson, ch) for ch in lesson.chapters]
+    if _has_quiz(lesson):
+        if lesson.quiz.draw_count:
+            files.append(f"quiz-{lesson.id}-pool.js")
+        files.append(f"quiz-{lesson.id}.html")
+    return files + [f"media/{name}" for name in media]
+
 def _render_index(course: Course) -> str:
     items = []
     for l in course.lessons:
         items.append(f"<li><b>Leçon {l.index} — {escape(l.title or '')}</b><ul>")
         for ch in l.chapters:
-            href = f"lesson-{l.id}-chapter-{ch.id}.html"
-            items.append(f'<li><a href="{href}">Chapitre {ch.index}: {escape(ch.title or "")}</a></li>')
-        if l.quiz and l.quiz.questions:
+            items.append(f'<li><a href="{_chapter_href(l, ch)}">Chapitre {ch.index}: {escape(ch.title or "")}</a></li>')
+        if _has_quiz(l):
             items.append(f'<li><a href="quiz-{l.id}.html">Quiz de la leçon</a></li>')
         items.append("</ul></li>")
     toc = "\n".join(items)
@@ -72,8 +159,54 @@ try {{ ScormApi.init(); }} catch(e) {{ console.log(e); }}
 </body>
 </html>"""
 
-def _render_chapter_page(course: Course, lesson: Lesson, ch: Any) -> str:
-    html = ch.html_content or ""
+def _render_lesson_index(course: Course, lesson: Lesson) -> str:
+    items = [f'<li><a href="{_chapter_href(lesson, ch)}">Chapitre {ch.index}: {escape(ch.title or "")}</a></li>'
+             for ch in lesson.chapters]
+    if _has_quiz(lesson):
+        items.append(f'<li><a href="quiz-{lesson.id}.html">Quiz de la leçon</a></li>')
+    toc = "\n".join(items)
+    return f"""<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8" />
+<title>{escape(course.title)} — Leçon {lesson.index}</title>
+<script src="scorm_api.js"></script>
+<style>
+body{{font-family:system-ui,Segoe UI,Arial,sans-serif;max-width:900px;margin:24px auto;padding:12px}}
+a{{text-decoration:none}}
+a:hover{{text-decoration:underline}}
+.card{{border:1px solid #ddd;border-radius:10px;padding:12px;margin-bottom:12px}}
+</style>
+</head>
+<body>
+<h1>Leçon {lesson.index} — {escape(lesson.title or "")}</h1>
+<p>{escape(course.title)}</p>
+<div class="card">
+  <h2>Sommaire</h2>
+  <ol>{toc}</ol>
+</div>
+<script>
+try {{
+  ScormApi.init();
+  ScormApi.set("cmi.core.lesson_status", "incomplete");
+  ScormApi.commit();
+}} catch(e) {{ console.log(e); }}
+</script>
+</body>
+</html>"""
+
+def _chapter_html(ch: Any) -> str:
+    """Rendu du pipeline HTML, précalculé à l'enregistrement (recalculé si un modèle ORM n'est pas à jour)."""
+    html = ch.html_rendered
+    if isinstance(ch, Chapter) and (html is None or ch.pipeline_version != html_pipeline.PIPELINE_VERSION):
+        html = html_pipeline.render(ch.html_content)
+    return html or ""
+
+def _render_chapter_page(course: Course, lesson: Lesson, ch: Any, home: str = "index.html", done: bool = False,
+                         html: str = None) -> str:
+    if html is None:
+        html = _chapter_html(ch)
+    status = "completed" if done else "incomplete"
     return f"""<!DOCTYPE html>
 <html lang="fr">
 <head>
@@ -90,7 +223,7 @@ body{{font-family:system-ui,Segoe UI,Arial,sans-serif;max-width:900px;margin:24p
 </head>
 <body>
 <div class="nav">
-  <a class="btn" href="index.html">← Sommaire</a>
+  <a class="btn" href="{home}">← Sommaire</a>
 </div>
 <h1>Leçon {lesson.index} — {escape(lesson.title or "")}</h1>
 <h2>Chapitre {ch.index} — {escape(ch.title or "")}</h2>
@@ -100,26 +233,52 @@ body{{font-family:system-ui,Segoe UI,Arial,sans-serif;max-width:900px;margin:24p
 <script>
 try {{
   ScormApi.init();
-  ScormApi.set("cmi.core.lesson_status", "incomplete");
+  ScormApi.set("cmi.core.lesson_status", "{status}");
   ScormApi.commit();
 }} catch(e) {{ console.log(e); }}
 </script>
 </body>
 </html>"""
 
-def _render_quiz_page(course: Course, lesson: Lesson) -> str:
-    # données quiz -> JSON
-    payload = []
-    for qq in lesson.quiz.questions:
-        payload.append({
-            "id": qq.id,
-            "index": qq.index,
-            "text": qq.text,
-            "type": qq.type,
-            "options": [{"id": op.id, "text": op.text, "is_correct": op.is_correct} for op in qq.options],
-        })
+def _render_quiz_pool(quiz) -> str:
+    """
+    Banque compacte pour le tirage côté client :
+    POOL = {draw, stratify, tags, q: [[id, texte, "s"|"m", n° de tag|-1, [[id, texte, 0|1], …]], …]}
+    """
+    import json
+    tags = sorted({q.tag for q in quiz.questions if q.tag})
+    tag_no = {t: i for i, t in enumerate(tags)}
+    pool = {
+        "draw": quiz.draw_count,
+        "stratify": bool(quiz.stratify_by_tag),
+        "tags": tags,
+        "q": [[qq.id, qq.text, "m" if qq.type == "multiple" else "s", tag_no.get(qq.tag, -1),
+               [[op.id, op.text, 1 if op.is_correct else 0] for op in qq.options]]
+              for qq in quiz.questions],
+    }
+    return "var POOL=" + json.dumps(pool, ensure_ascii=False, separators=(",", ":")) + ";\n"
+
+def _render_quiz_page(course: Course, lesson: Lesson, home: str = "index.html") -> str:
     import json
-    data = json.dumps(payload, ensure_ascii=False)
+    quiz = lesson.quiz
+    if quiz.draw_count:
+        # questions tirées à chaque tentative depuis quiz-<id>-pool.js
+        pool_script = f'<script src="quiz-{lesson.id}-pool.js"></script>\n'
+        data = "null"
+    else:
+        # données quiz -> JSON
+        payload = []
+        for qq in quiz.questions:
+            payload.append({
+                "id": qq.id,
+                "index": qq.index,
+                "text": qq.text,
+                "type": qq.type,
+                "options": [{"id": op.id, "text": op.text, "is_correct": op.is_correct} for op in qq.options],
+            })
+        pool_script = ""
+        data = json.dumps(payload, ensure_ascii=False)
+    shuffle = "true" if quiz.shuffle_options else "false"
     pass_threshold = 0.7  # 70%
 
     return f"""<!DOCTYPE html>
@@ -128,7 +287,7 @@ def _render_quiz_page(course: Course, lesson: Lesson) -> str:
 <meta charset="utf-8" />
 <title>{escape(course.title)} — Quiz leçon {lesson.index}</title>
 <script src="scorm_api.js"></script>
-<style>
+{pool_script}<style>
 body{{font-family:system-ui,Segoe UI,Arial,sans-serif;max-width:900px;margin:24px auto;padding:12px}}
 .card{{border:1px solid #ddd;border-radius:10px;padding:12px;margin-bottom:12px}}
 .btn{{padding:6px 10px;border:1px solid #ccc;border-radius:8px;background:#f7f7f7;cursor:pointer}}
@@ -139,13 +298,20 @@ body{{font-family:system-ui,Segoe UI,Arial,sans-serif;max-width:900px;margin:24p
 </style>
 </head>
 <body>
-<a class="btn" href="index.html">← Sommaire</a>
+<a class="btn" href="{home}">← Sommaire</a>
 <h1>Quiz — Leçon {lesson.index} : {escape(lesson.title or "")}</h1>
 <div id="app" class="card"></div>
 
 <script>
-var QUESTIONS = {data};
+var BANK = {data};
+var SHUFFLE = {shuffle};
+var QUESTIONS = [];
 var PASS = {pass_threshold};
+{_QUIZ_DRAW_JS}
+function newAttempt() {{
+  QUESTIONS = prepareQuestions(BANK, SHUFFLE);
+  render(false, {{}});
+}}
 
 function $(sel) {{ return document.querySelector(sel); }}
 
@@ -213,7 +379,7 @@ function render(checked, answers) {{
   if (gradeBtn) gradeBtn.addEventListener('click', function() {{ doGrade(answers); }});
 
   var retryBtn = $('#retry');
-  if (retryBtn) retryBtn.addEventListener('click', function() {{ render(false, {{}}); }});
+  if (retryBtn) retryBtn.addEventListener('click', function() {{ newAttempt(); }});
 }}
 
 function doGrade(answers) {{
@@ -243,13 +409,18 @@ function doGrade(answers) {{
   }} catch(e) {{ console.log(e); }}
 }}
 
-render(false, {{}});
+newAttempt();
 </script>
 </body>
 </html>"""
 
-def _render_manifest(course: Course) -> str:
-    return f"""<?xml version="1.0" encoding="UTF-8"?>
+def _iter_manifest(course: Course, per_lesson: bool, media=None):
+    """
+    imsmanifest.xml par morceaux : l'en-tête, puis un <item> et une <resource>
+    par leçon. `media` : fichiers de media/ de chaque leçon (_lesson_media).
+    """
+    media = media or {}
+    yield f"""<?xml version="1.0" encoding="UTF-8"?>
 <manifest identifier="MANIFEST_{course.id}" version="1.2"
   xmlns="http://www.imsproject.org/xsd/imscp_rootv1p1p2"
   xmlns:adlcp="http://www.adlnet.org/xsd/adlcp_rootv1p2"
@@ -259,7 +430,9 @@ def _render_manifest(course: Course) -> str:
   <organizations default="ORG1">
     <organization identifier="ORG1">
       <title>{_xml_escape(course.title)}</title>
-      <item identifier="ITEM1" identifierref="RES1" isvisible="true">
+"""
+    if not per_lesson:
+        yield f"""      <item identifier="ITEM1" identifierref="RES1" isvisible="true">
         <title>{_xml_escape(course.title)} — Module</title>
       </item>
     </organization>
@@ -268,9 +441,93 @@ def _render_manifest(course: Course) -> str:
     <resource identifier="RES1" type="webcontent" adlcp:scormtype="sco" href="index.html">
       <file href="index.html"/>
       <file href="scorm_api.js"/>
-    </resource>
+"""
+        for l in course.lessons:
+            yield "".join(f'      <file href="{href}"/>\n' for href in _lesson_files(l))
+        # une image affichée par plusieurs leçons n'est listée qu'une fois
+        shared = sorted({name for names in media.values() for name in names})
+        yield "".join(f'      <file href="media/{name}"/>\n' for name in shared)
+        yield """    </resource>
   </resources>
 </manifest>"""
+        return
+
+    for l in course.lessons:
+        yield f"""      <item identifier="ITEM_L{l.id}" identifierref="RES_L{l.id}" isvisible="true">
+        <title>Leçon {l.index} — {_xml_escape(l.title)}</title>
+      </item>
+"""
+    yield """    </organization>
+  </organizations>
+  <resources>
+    <resource identifier="RES_SHARED" type="webcontent" adlcp:scormtype="asset">
+      <file href="scorm_api.js"/>
+    </resource>
+"""
+    for l in course.lessons:
+        files = "".join(f'      <file href="{href}"/>\n' for href in [_lesson_href(l)] + _lesson_files(l, media.get(l.id, ())))
+        yield f"""    <resource identifier="RES_L{l.id}" type="webcontent" adlcp:scormtype="sco" href="{_lesson_href(l)}">
+{files}      <dependency identifierref="RES_SHARED"/>
+    </resource>
+"""
+    yield """  </resources>
+</manifest>"""
+
+# Tirage côté client, même algorithme que app.services.question_pool :
+# répartition par tag au plus forts restes, puis échantillon sans remise.
+_QUIZ_DRAW_JS = r"""
+function shuffleArray(a) {
+  for (var i = a.length - 1; i > 0; i--) {
+    var j = Math.floor(Math.random() * (i + 1)); var t = a[i]; a[i] = a[j]; a[j] = t;
+  }
+  return a;
+}
+function sampleArray(a, k) {
+  a = a.slice();
+  for (var i = 0; i < k; i++) {
+    var j = i + Math.floor(Math.random() * (a.length - i)); var t = a[i]; a[i] = a[j]; a[j] = t;
+  }
+  return a.slice(0, k);
+}
+function drawFromPool(pool) {
+  var all = pool.q, n = Math.min(pool.draw || all.length, all.length), picked = [];
+  var strata = {}, keys = [], i;
+  if (pool.stratify) {
+    for (i = 0; i < all.length; i++) {
+      var t = all[i][3];
+      if (!strata[t]) { strata[t] = []; keys.push(t); }
+      strata[t].push(i);
+    }
+  }
+  if (keys.length > 1) {
+    var quotas = {}, rests = [], used = 0;
+    keys.forEach(function(t) {
+      var exact = n * strata[t].length / all.length;
+      quotas[t] = Math.floor(exact); used += quotas[t];
+      rests.push([exact - quotas[t], strata[t].length, t]);
+    });
+    rests.sort(function(a, b) { return (b[0] - a[0]) || (b[1] - a[1]); });
+    for (i = 0; used < n; i++, used++) quotas[rests[i][2]]++;
+    keys.forEach(function(t) { picked = picked.concat(sampleArray(strata[t], quotas[t])); });
+    shuffleArray(picked);
+  } else {
+    for (i = 0; i < all.length; i++) picked.push(i);
+    picked = sampleArray(picked, n);
+  }
+  return picked.map(function(k, pos) {
+    var q = all[k];
+    return {id: q[0], index: pos + 1, text: q[1], type: q[2] === "m" ? "multiple" : "single",
+            options: q[4].map(function(o) { return {id: o[0], text: o[1], is_correct: o[2] === 1}; })};
+  });
+}
+function prepareQuestions(bank, shuffle) {
+  var qs = (typeof POOL !== "undefined") ? drawFromPool(POOL) : bank;
+  if (!shuffle) return qs;
+  return qs.map(function(q) {
+    return {id: q.id, index: q.index, text: q.text, type: q.type, options: shuffleArray(q.options.slice())};
+  });
+}
+"""
 
 _SCORM_API_JS = r"""(function(global){
   var api = null; var inited = false;
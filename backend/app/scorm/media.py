@@ -0,0 +1,198 @@
+﻿"""
+Optimisation des images des packages SCORM exportés.
+
+Les images matricielles collées dans les chapitres (src="data:image/…") sont
+extraites en fichiers media/<clé>.<ext> du package (les SVG, qui peuvent
+contenir des scripts, restent en ligne), réduites à MEDIA_MAX_WIDTH et
+réencodées (WebP, ou JPEG / PNG selon la transparence) quand le résultat est
+plus léger. Les <img> reçoivent width/height (pas de décalage à l'affichage)
+et loading="lazy", sauf la première image de la page.
+
+L'encodage se fait dans un pool de processus et les résultats sont gardés sur
+disque (MEDIA_CACHE_DIR), indexés par l'empreinte de la source et des
+réglages : un export suivant ne réencode rien. Sans Pillow (dépendance
+optionnelle), les images sont extraites telles quelles.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from html import escape, unescape
+from io import BytesIO
+from urllib.parse import unquote_to_bytes
+
+from flask import current_app
+
+try:  # dépendance optionnelle
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover
+    Image = ImageOps = None
+
+MEDIA_VERSION = 1  # à incrémenter à chaque changement d'encodage
+# types extraits en fichiers
+_EXT = {"image/png": "png", "image/jpeg": "jpg", "image/gif": "gif", "image/webp": "webp",
+        "image/avif": "avif", "image/bmp": "bmp"}
+_IMG = re.compile(r"<img\b[^>]*>")
+_ATTR = re.compile(r'([a-zA-Z_:][-a-zA-Z0-9_:.]*)="([^"]*)"')
+_DATA_URI = re.compile(r"data:(image/[a-zA-Z0-9.+-]+)((?:;[^,;]*)*?)(;base64)?,(.*)", re.S | re.I)
+_NAME = re.compile(r"[0-9a-f]{32}\.[a-z]{3,4}")
+
+Media = namedtuple("Media", "name width height")
+
+def encode(source: bytes, mimetype: str, max_width: int, fmt: str, quality: int):
+    """(données, extension, largeur, hauteur) ; exécutée dans un processus du pool."""
+    ext = _EXT[mimetype]
+    if Image is None:
+        return source, ext, None, None
+    try:
+        img = Image.open(BytesIO(source))
+        if getattr(img, "is_animated", False):  # GIF / WebP animés conservés
+            return source, ext, img.width, img.height
+        img = ImageOps.exif_transpose(img)
+    except Exception:  # image illisible (ou trop grande) : gardée telle quelle
+        return source, ext, None, None
+    resized = img.width > max_width
+    if resized:
+        img = img.resize((max_width, max(1, round(img.height * max_width / img.width))), Image.Resampling.LANCZOS)
+    alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    out = BytesIO()
+    if fmt == "webp":
+        img.convert("RGBA" if alpha else "RGB").save(out, "WEBP", quality=quality, method=4)
+        out_ext = "webp"
+    elif alpha:
+        img.convert("RGBA").save(out, "PNG", optimize=True)
+        out_ext = "png"
+    else:
+        img.convert("RGB").save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        out_ext = "jpg"
+    if not resized and out.tell() >= len(source):
+        return source, ext, img.width, img.height  # déjà plus léger que le réencodage
+    return out.getvalue(), out_ext, img.width, img.height
+
+def _decode(src: str):
+    """(octets, type MIME) d'une URI data:image à extraire, ou None."""
+    m = _DATA_URI.fullmatch(src.strip())
+    if not m or m.group(1).lower() not in _EXT:
+        return None
+    mimetype, is_base64, payload = m.group(1).lower(), m.group(3), m.group(4)
+    try:
+        data = base64.b64decode(payload, validate=False) if is_base64 else unquote_to_bytes(payload)
+    except (binascii.Error, ValueError):
+        return None
+    return (data, mimetype) if data else None
+
+def _attrs(tag: str) -> dict:
+    return {name.lower(): unescape(value) for name, value in _ATTR.findall(tag)}
+
+class MediaStore:
+    """Images optimisées sur disque : <clé>.<ext> et <clé>.json (dimensions)."""
+
+    def __init__(self, directory: str, max_width: int, fmt: str, quality: int, workers: int = 0):
+        self.directory = directory
+        self.max_width, self.fmt, self.quality = max_width, fmt, quality
+        self.workers = workers or os.cpu_count() or 1
+        self._settings = f"{MEDIA_VERSION}:{max_width}:{fmt}:{quality}".encode()
+
+    def key(self, data: bytes) -> str:
+        return hashlib.sha256(self._settings + b"\0" + data).hexdigest()[:32]
+
+    def path(self, name: str) -> str:
+        """Fichier d'un média, ou None si `name` n'est pas un nom produit par le magasin."""
+        return os.path.join(self.directory, name) if _NAME.fullmatch(name) else None
+
+    def lookup(self, key: str):
+        try:
+            with open(os.path.join(self.directory, f"{key}.json"), encoding="utf-8") as f:
+                return Media(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _save(self, key: str, data: bytes, ext: str, width, height) -> Media:
+        media = Media(f"{key}.{ext}", width, height)
+        os.makedirs(self.directory, exist_ok=True)
+        for name, content in ((media.name, data), (f"{key}.json", json.dumps(media._asdict()).encode())):
+            tmp = os.path.join(self.directory, f".{name}.{os.getpid()}")
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, os.path.join(self.directory, name))  # <clé>.json en dernier : entrée complète
+        return media
+
+    def optimize(self, sources: dict) -> dict:
+        """{clé: (octets, type MIME)} -> {clé: Media} ; seules les clés absentes du disque sont encodées."""
+        found = {}
+        for key in sources:
+            media = self.lookup(key)
+            if media:
+                found[key] = media
+        missing = [key for key in sources if key not in found]
+        if not missing:
+            return found
+        args = ([sources[k][0] for k in missing], [sources[k][1] for k in missing], [self.max_width] * len(missing),
+                [self.fmt] * len(missing), [self.quality] * len(missing))
+        workers = min(self.workers, len(missing))
+        if workers > 1 and Image is not None:
+            with ProcessPoolExecutor(workers) as pool:
+                results = list(pool.map(encode, *args))
+        else:
+            results = map(encode, *args)
+        for key, (data, ext, width, height) in zip(missing, results):
+            found[key] = self._save(key, data, ext, width, height)
+        return found
+
+    def process(self, pages: list) -> list:
+        """
+        HTML de plusieurs pages -> [(HTML réécrit, noms des médias utilisés)],
+        toutes les images à encoder l'étant en un seul passage du pool.
+        """
+        found = []  # par page : {src: clé}
+        sources = {}
+        for html in pages:
+            srcs = {}
+            for tag in _IMG.findall(html):
+                src = _attrs(tag).get("src", "")
+                if src[:5].lower() == "data:" and src not in srcs:
+                    decoded = _decode(src)
+                    if decoded:
+                        srcs[src] = self.key(decoded[0])
+                        sources.setdefault(srcs[src], decoded)
+            found.append(srcs)
+        media = self.optimize(sources)
+        return [self._rewrite(html, {src: media[key] for src, key in srcs.items()}) for html, srcs in zip(pages, found)]
+
+    def _rewrite(self, html: str, media: dict):
+        used = []
+        first = True
+
+        def img(m):
+            nonlocal first
+            attrs = _attrs(m.group(0))
+            found = media.get(attrs.get("src"))
+            if found:
+                attrs["src"] = f"media/{found.name}"
+                used.append(found.name)
+                if found.width and "width" not in attrs and "height" not in attrs:
+                    attrs["width"], attrs["height"] = str(found.width), str(found.height)
+            # la première image est souvent visible d'emblée : chargée sans attendre
+            if not first:
+                attrs.setdefault("loading", "lazy")
+            attrs.setdefault("decoding", "async")
+            first = False
+            return "<img" + "".join(f' {n}="{escape(v, quote=True)}"' for n, v in attrs.items()) + ">"
+
+        return _IMG.sub(img, html), sorted(set(used))
+
+def get_media_store():
+    """Magasin de l'application, ou None si l'optimisation est désactivée (MEDIA_OPTIMIZE=0)."""
+    cfg = current_app.config
+    if not cfg["MEDIA_OPTIMIZE"]:
+        return None
+    store = current_app.extensions.get("media_store")
+    if store is None:
+        store = current_app.extensions["media_store"] = MediaStore(
+            cfg["MEDIA_CACHE_DIR"] or os.path.join(current_app.instance_path, "media"),
+            cfg["MEDIA_MAX_WIDTH"], cfg["MEDIA_FORMAT"], cfg["MEDIA_QUALITY"], cfg["MEDIA_WORKERS"])
+    return store
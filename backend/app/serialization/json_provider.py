@@ -0,0 +1,54 @@
+﻿from flask.json.provider import DefaultJSONProvider
+
+try:  # dépendance optionnelle
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Encodeur stdlib sans tri des clés ni échappement ASCII (JSON_SORT_KEYS est respecté)."""
+    ensure_ascii = False
+    sort_keys = False
+
+class OrjsonProvider(StdlibJSONProvider):
+    """
+    Encodeur orjson. Les dates passent par `default` comme avec l'encodeur stdlib,
+    pour que la sortie ne change pas selon le backend installé. Les appels avec des
+    options propres à la stdlib (indent, sort_keys, …) y sont délégués.
+    """
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def _dumpb(self, obj) -> bytes:
+        return orjson.dumps(obj, default=self.default, option=self.option)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs or self.sort_keys:
+            return super().dumps(obj, **kwargs)
+        return self._dumpb(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self.sort_keys or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumpb(obj), mimetype=self.mimetype)
+
+JSON_BACKENDS = {"stdlib": StdlibJSONProvider, "orjson": OrjsonProvider}
+
+def init_json(app):
+    """Installe le provider JSON choisi par JSON_BACKEND (auto|orjson|stdlib)."""
+    name = app.config.get("JSON_BACKEND", "auto")
+    if name == "auto":
+        name = "orjson" if orjson else "stdlib"
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("JSON_BACKEND=orjson mais le paquet orjson n'est pas installé.")
+    if name not in JSON_BACKENDS:
+        raise RuntimeError(f"JSON_BACKEND inconnu : {name!r}.")
+    provider = JSON_BACKENDS[name](app)
+    provider.sort_keys = bool(app.config.get("JSON_SORT_KEYS", False))
+    app.json = provider
+    return provider
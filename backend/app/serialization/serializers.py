@@ -0,0 +1,130 @@
+﻿from sqlalchemy import and_, case, null
+
+from app.content import html_pipeline
+from app.domain.models import Course, Lesson, Chapter, ChapterRevision, Quiz, Question, AnswerOption
+
+# Chaque sérialiseur est associé aux colonnes qu'il lit : les services les
+# sélectionnent telles quelles (lignes Core, sans objets ORM). Les fonctions
+# n'utilisent que l'accès par attribut et acceptent donc aussi les modèles ORM.
+
+COURSE_SUMMARY_COLUMNS = (
+    Course.id, Course.title, Course.lesson_count, Course.has_certification,
+    Course.chapter_count, Course.question_count, Course.option_count, Course.html_bytes,
+    Course.created_at, Course.updated_at,
+)
+
+def course_summary(c) -> dict:
+    return {
+        "id": c.id,
+        "title": c.title,
+        "lesson_count": c.lesson_count,
+        "has_certification": c.has_certification,
+        "chapter_count": c.chapter_count,
+        "question_count": c.question_count,
+        "option_count": c.option_count,
+        "html_bytes": c.html_bytes,
+        "created_at": c.created_at.isoformat(),
+        "updated_at": c.updated_at.isoformat(),
+    }
+
+COURSE_HEAD_COLUMNS = (Course.id, Course.title, Course.lesson_count, Course.has_certification, Course.archive_file)
+LESSON_COLUMNS = (Lesson.id, Lesson.index, Lesson.title)
+CHAPTER_HEAD_COLUMNS = (Chapter.id, Chapter.lesson_id, Chapter.index, Chapter.title)
+
+def course_detail(c, lessons, chapters) -> dict:
+    """`chapters` : tous les chapitres du cours, triés par index (regroupés ici par leçon)."""
+    by_lesson = {}
+    for ch in chapters:
+        by_lesson.setdefault(ch.lesson_id, []).append({
+            "id": ch.id,
+            "index": ch.index,
+            "title": ch.title,
+        })
+    return {
+        "id": c.id,
+        "title": c.title,
+        "lesson_count": c.lesson_count,
+        "has_certification": c.has_certification,
+        "lessons": [{
+            "id": l.id,
+            "index": l.index,
+            "title": l.title,
+            "chapters": by_lesson.get(l.id, []),
+        } for l in lessons],
+    }
+
+# html_hash : base des deltas envoyés par l'éditeur (PATCH avec base_hash)
+CHAPTER_COLUMNS = CHAPTER_HEAD_COLUMNS + (Chapter.html_content, Chapter.html_hash)
+
+def chapter_detail(ch) -> dict:
+    return {
+        "id": ch.id,
+        "lesson_id": ch.lesson_id,
+        "index": ch.index,
+        "title": ch.title,
+        "html_content": ch.html_content,
+        "html_hash": ch.html_hash,
+    }
+
+# Rendu du pipeline HTML ; la source n'est lue que si le rendu manque ou date
+# d'une autre version du pipeline (ligne pas encore retraitée).
+RENDITION_COLUMNS = (Chapter.html_rendered, case(
+    (and_(Chapter.pipeline_version == html_pipeline.PIPELINE_VERSION, Chapter.html_rendered.is_not(None)), null()),
+    else_=Chapter.html_content,
+).label("stale_source"))
+
+def rendition(row) -> str:
+    if row.stale_source is not None:
+        return html_pipeline.render(row.stale_source)
+    return row.html_rendered or ""
+
+CHAPTER_RENDERED_COLUMNS = CHAPTER_HEAD_COLUMNS + RENDITION_COLUMNS
+
+def chapter_rendered(ch) -> dict:
+    return {
+        "id": ch.id,
+        "lesson_id": ch.lesson_id,
+        "index": ch.index,
+        "title": ch.title,
+        "html_rendered": rendition(ch),
+    }
+
+REVISION_COLUMNS = (ChapterRevision.rev, ChapterRevision.kind, ChapterRevision.title,
+                    ChapterRevision.size, ChapterRevision.created_at)
+
+def revision_summary(r) -> dict:
+    return {
+        "rev": r.rev,
+        "kind": r.kind,
+        "title": r.title,
+        "size": r.size,
+        "created_at": r.created_at.isoformat(),
+    }
+
+QUIZ_COLUMNS = (Quiz.id, Quiz.lesson_id, Quiz.title, Quiz.draw_count, Quiz.stratify_by_tag, Quiz.shuffle_options)
+QUESTION_COLUMNS = (Question.id, Question.index, Question.text, Question.type, Question.tag)
+OPTION_COLUMNS = (AnswerOption.id, AnswerOption.question_id, AnswerOption.text, AnswerOption.is_correct)
+
+def quiz_detail(qz, questions, options) -> dict:
+    """`options` : toutes les options du quiz, triées par id (regroupées ici par question)."""
+    by_question = {}
+    for op in options:
+        by_question.setdefault(op.question_id, []).append({
+            "id": op.id, "text": op.text, "is_correct": op.is_correct
+        })
+    return {
+        "id": qz.id,
+        "lesson_id": qz.lesson_id,
+        "title": qz.title,
+        "draw_count": qz.draw_count,
+        "stratify_by_tag": qz.stratify_by_tag,
+        "shuffle_options": qz.shuffle_options,
+        "questions": [{
+            "id": qu.id,
+            "index": qu.index,
+            "text": qu.text,
+            "type": qu.type,
+            "tag": qu.tag,
+            "options": by_question.get(qu.id, []),
+        } for qu in questions],
+    }
@@ -0,0 +1,247 @@
+﻿"""
+Archivage des cours inactifs hors des tables principales (`flask archive …`).
+
+Un cours sans modification depuis N jours est archivé : le HTML de ses
+chapitres (source et rendu) et ses quiz, questions et options sont écrits dans
+un fichier d'ARCHIVE_DIR (app.archive.blob). Le cours et ses leçons restent en
+place, les chapitres aussi mais vidés de leur HTML (ids, titres et historique
+conservés) ; les ids des quiz, questions et options sont gardés dans
+archived_rows. Les lectures (instantanés, chapitres, export) passent alors par
+le fichier ; la première écriture réhydrate le cours dans sa transaction et le
+fichier est supprimé après le commit.
+
+Les dates de modification sont conservées dans les deux sens : archiver ou
+réhydrater un cours ne change ni ses ETag ni son ancienneté.
+"""
+import os
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.domain.models import Course, Lesson, Chapter, Quiz, Question, AnswerOption, ArchivedRow
+from app.archive import blob
+from app.cache import course_tree
+
+# tables archivées en lignes entières, de la racine vers les feuilles : (modèle, clé vers le parent)
+_ROW_TABLES = ((Quiz, None), (Question, "quiz_id"), (AnswerOption, "question_id"))
+
+class _Modified(Exception):
+    """Le cours a été modifié pendant son archivage."""
+
+def _directory() -> str:
+    return blob.get_readers().directory
+
+def cold_courses(days: int, limit=None) -> list:
+    """Ids des cours non archivés dont aucune ligne (cours, leçons, chapitres, quiz…) n'a changé depuis `days` jours."""
+    touched = db.union_all(
+        db.select(Course.id.label("course_id"), Course.updated_at.label("at")),
+        db.select(Lesson.course_id, Lesson.updated_at),
+        db.select(Lesson.course_id, Chapter.updated_at).join(Chapter, Chapter.lesson_id == Lesson.id),
+        db.select(Lesson.course_id, Quiz.updated_at).join(Quiz, Quiz.lesson_id == Lesson.id),
+        db.select(Lesson.course_id, Question.updated_at).join(Quiz, Quiz.lesson_id == Lesson.id)
+        .join(Question, Question.quiz_id == Quiz.id),
+        db.select(Lesson.course_id, AnswerOption.updated_at).join(Quiz, Quiz.lesson_id == Lesson.id)
+        .join(Question, Question.quiz_id == Quiz.id).join(AnswerOption, AnswerOption.question_id == Question.id),
+    ).subquery()
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    q = (db.select(touched.c.course_id).join(Course, Course.id == touched.c.course_id)
+         .where(Course.archive_file.is_(None))
+         .group_by(touched.c.course_id).having(db.func.max(touched.c.at) < cutoff)
+         .order_by(touched.c.course_id).limit(limit))
+    return db.session.scalars(q).all()
+
+def _apply_unchanged(stmt, rows):
+    """
+    Exécute `stmt` (conditionné par b_id et b_at) pour chaque ligne non
+    modifiée depuis sa lecture ; _Modified si l'une a changé entre-temps.
+    """
+    if not rows:
+        return
+    res = db.session.execute(stmt, [{"b_id": r.id, "b_at": r.updated_at} for r in rows])
+    if res.rowcount != len(rows) and db.session.get_bind().dialect.supports_sane_multi_rowcount:
+        raise _Modified
+
+def archive_course(course_id: int) -> bool:
+    """Archive un cours et commite ; False s'il est absent, déjà archivé ou modifié pendant l'opération."""
+    course = db.session.execute(db.select(Course.id, Course.archive_file).where(Course.id == course_id)).first()
+    if course is None or course.archive_file:
+        return False
+    in_course = db.select(Lesson.id).where(Lesson.course_id == course_id)
+    chapters = db.session.execute(
+        db.select(Chapter.id, Chapter.updated_at, Chapter.html_content, Chapter.html_rendered, Chapter.pipeline_version)
+        .where(Chapter.lesson_id.in_(in_course))).all()
+    quizzes = db.session.execute(
+        db.select(Quiz.__table__).where(Quiz.lesson_id.in_(in_course)).order_by(Quiz.id)).all()
+    in_quizzes = [qz.id for qz in quizzes]
+    questions = db.session.execute(
+        db.select(Question.__table__).where(Question.quiz_id.in_(in_quizzes)).order_by(Question.index)).all()
+    options = db.session.execute(
+        db.select(AnswerOption.__table__).join(Question, AnswerOption.question_id == Question.id)
+        .where(Question.quiz_id.in_(in_quizzes)).order_by(AnswerOption.id)).all()
+
+    frames = {"quiz": {model.__tablename__: blob.dump_rows(model, rows)
+                       for model, rows in ((Quiz, quizzes), (Question, questions), (AnswerOption, options))}}
+    for ch in chapters:
+        frames[f"chapter-{ch.id}"] = {"html_content": ch.html_content, "html_rendered": ch.html_rendered,
+                                      "pipeline_version": ch.pipeline_version}
+    name = blob.write(_directory(), course_id, frames)
+    try:
+        b_id, b_at = db.bindparam("b_id"), db.bindparam("b_at")
+        _apply_unchanged(db.update(Chapter.__table__).where(Chapter.id == b_id, Chapter.updated_at == b_at)
+                         .values(html_content="", html_rendered=None, updated_at=b_at), chapters)
+        for model, rows in ((AnswerOption, options), (Question, questions), (Quiz, quizzes)):
+            _apply_unchanged(db.delete(model.__table__).where(model.id == b_id, model.updated_at == b_at), rows)
+        index = [{"course_id": course_id, "kind": model.__tablename__, "row_id": r.id}
+                 for model, rows in ((Quiz, quizzes), (Question, questions), (AnswerOption, options)) for r in rows]
+        if index:
+            db.session.execute(db.insert(ArchivedRow.__table__), index)
+        db.session.execute(db.update(Course).where(Course.id == course_id)
+                           .values(archived_at=datetime.utcnow(), archive_file=name, updated_at=Course.updated_at))
+        course_tree.mark_dirty(course_id)
+        db.session.commit()
+    except BaseException as e:
+        db.session.rollback()
+        _remove(name)
+        if isinstance(e, _Modified):
+            return False
+        raise
+    return True
+
+def archive_cold(days: int, limit=None, progress=None) -> int:
+    """Archive les cours inactifs depuis `days` jours ; renvoie le nombre de cours archivés."""
+    done = 0
+    for course_id in cold_courses(days, limit):
+        if archive_course(course_id):
+            done += 1
+            if progress:
+                progress(course_id)
+    return done
+
+def _restore_rows(model, rows, fk=None, parent_ids=None) -> dict:
+    """
+    Réinsère `rows` avec leurs ids d'origine ; un id repris entre-temps (SQLite
+    réutilise les plus grands ids libérés) est remplacé. Renvoie {ancien id: nouvel id}.
+    """
+    rows = [r._asdict() for r in rows]
+    if fk and parent_ids:
+        for r in rows:
+            r[fk] = parent_ids.get(r[fk], r[fk])
+    taken = set(db.session.scalars(db.select(model.id).where(model.id.in_([r["id"] for r in rows])))) if rows else set()
+    free = [r for r in rows if r["id"] not in taken]
+    if free:
+        db.session.execute(db.insert(model.__table__), free)
+    moved = {}
+    for r in rows:
+        if r["id"] in taken:
+            old = r.pop("id")
+            moved[old] = db.session.execute(db.insert(model.__table__).values(**r)).inserted_primary_key[0]
+            current_app.logger.warning("%s %s réhydraté sous l'id %s (id repris entre-temps)", model.__tablename__, old, moved[old])
+    return moved
+
+def rehydrate(course_id: int) -> bool:
+    """
+    Remet le contenu d'un cours archivé dans les tables, dans la transaction
+    courante (sans commit) ; False si le cours n'est pas archivé.
+    """
+    name = db.session.scalar(db.select(Course.archive_file).where(Course.id == course_id))
+    if not name:
+        return False
+    try:
+        reader = blob.get_readers().get(name)
+    except FileNotFoundError:
+        raise ValueError(f"Archive du cours {course_id} introuvable ({name}).") from None
+    chapter_ids = db.session.scalars(
+        db.select(Chapter.id).join(Lesson, Chapter.lesson_id == Lesson.id).where(Lesson.course_id == course_id)).all()
+    contents = []
+    for chapter_id in chapter_ids:
+        data = reader.frame(f"chapter-{chapter_id}")
+        if data is not None:
+            contents.append({"b_id": chapter_id, "b_html": data["html_content"],
+                             "b_rendered": data["html_rendered"], "b_version": data["pipeline_version"]})
+    if contents:
+        db.session.execute(
+            db.update(Chapter.__table__).where(Chapter.id == db.bindparam("b_id"))
+            .values(html_content=db.bindparam("b_html"), html_rendered=db.bindparam("b_rendered"),
+                    pipeline_version=db.bindparam("b_version"), updated_at=Chapter.updated_at),
+            contents)
+    moved = None
+    for (model, fk), rows in zip(_ROW_TABLES, blob.quiz_rows(name)):
+        moved = _restore_rows(model, rows, fk, moved)
+    db.session.execute(db.delete(ArchivedRow).where(ArchivedRow.course_id == course_id))
+    db.session.execute(db.update(Course).where(Course.id == course_id)
+                       .values(archived_at=None, archive_file=None, updated_at=Course.updated_at))
+    db.session.expire_all()  # objets ORM déjà chargés : relus avec le contenu réhydraté
+    course_tree.mark_dirty(course_id)
+    drop_files(name)
+    return True
+
+def _archived_course_of(model, entity_id: int):
+    """Cours archivé contenant l'entité, ou None."""
+    if model is Course:
+        q = db.select(Course.id).where(Course.id == entity_id)
+    elif model is Lesson:
+        q = db.select(Course.id).join(Lesson, Lesson.course_id == Course.id).where(Lesson.id == entity_id)
+    elif model is Chapter:
+        q = (db.select(Course.id).join(Lesson, Lesson.course_id == Course.id)
+             .join(Chapter, Chapter.lesson_id == Lesson.id).where(Chapter.id == entity_id))
+    else:
+        # une ligne présente dans sa table n'est pas archivée, même si son id l'a été
+        return db.session.scalar(
+            db.select(ArchivedRow.course_id)
+            .where(ArchivedRow.kind == model.__tablename__, ArchivedRow.row_id == entity_id,
+                   ~db.select(model.id).where(model.id == entity_id).exists()).limit(1))
+    return db.session.scalar(q.where(Course.archive_file.is_not(None)))
+
+def rehydrate_containing(model, entity_id: int) -> bool:
+    """Avant une écriture : réhydrate le cours archivé qui contient l'entité (`model`, `entity_id`), s'il y en a un."""
+    course_id = _archived_course_of(model, entity_id)
+    return rehydrate(course_id) if course_id else False
+
+def drop_files(*names):
+    """Supprime ces fichiers d'archive après le commit de la transaction courante."""
+    db.session.info.setdefault("archive_drop", set()).update(n for n in names if n)
+
+def _remove(name: str):
+    if has_app_context():
+        blob.get_readers().discard(name)
+    try:
+        os.remove(os.path.join(_directory(), name))
+    except FileNotFoundError:
+        pass
+    except OSError as e:  # encore projeté ailleurs (Windows) : supprimé par `flask archive gc`
+        current_app.logger.warning("Fichier d'archive %s non supprimé : %s", name, e)
+
+def gc() -> int:
+    """Supprime les fichiers d'ARCHIVE_DIR qu'aucun cours ne référence ; renvoie leur nombre."""
+    try:
+        names = {n for n in os.listdir(_directory()) if n.endswith(".arc")}
+    except FileNotFoundError:
+        return 0
+    used = set(db.session.scalars(db.select(Course.archive_file).where(Course.archive_file.is_not(None))))
+    for name in names - used:
+        _remove(name)
+    return len(names - used)
+
+def status() -> dict:
+    count, oldest = db.session.execute(
+        db.select(db.func.count(Course.id), db.func.min(Course.archived_at)).where(Course.archive_file.is_not(None))).one()
+    directory = _directory()
+    try:
+        size = sum(os.path.getsize(os.path.join(directory, n)) for n in os.listdir(directory) if n.endswith(".arc"))
+    except FileNotFoundError:
+        size = 0
+    return {"archived_courses": count, "oldest_archived_at": oldest, "bytes": size, "directory": directory}
+
+@event.listens_for(Session, "after_commit")
+def _drop_after_commit(session):
+    names = session.info.pop("archive_drop", None)
+    if names and has_app_context():
+        for name in names:
+            _remove(name)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _keep_on_rollback(session, previous_transaction):
+    session.info.pop("archive_drop", None)
@@ -0,0 +1,86 @@
+﻿"""
+Retraitement en masse des rendus HTML des chapitres (`flask content reprocess`).
+
+À lancer après une montée de PIPELINE_VERSION (ou une migration ajoutant des
+chapitres sans rendu) : les chapitres sont parcourus par lots d'ids croissants,
+rendus dans un pool de processus puis écrits par un UPDATE groupé. Les rendus
+sont indexés par le hash du HTML source : un contenu déjà rendu par la version
+courante (copies de cours, chapitres identiques) est réutilisé sans recalcul.
+L'UPDATE est conditionné par le html_hash lu : un chapitre enregistré entre la
+lecture et l'écriture garde son rendu (calculé à l'enregistrement) et est
+compté comme ignoré. Les cours archivés (app.services.archive_service) sont
+ignorés : leurs rendus périmés sont recalculés à la lecture, puis ici après
+réhydratation.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from app.extensions import db
+from app.domain.models import Course, Lesson, Chapter
+from app.cache import course_tree
+from app.content import html_pipeline
+from app.services import text_delta
+
+def _stale():
+    return db.or_(Chapter.pipeline_version.is_(None),
+                  Chapter.pipeline_version != html_pipeline.PIPELINE_VERSION,
+                  Chapter.html_rendered.is_(None))
+
+def _known(hashes) -> dict:
+    """Rendus à jour déjà stockés pour ces hashes de source."""
+    rows = db.session.execute(
+        db.select(Chapter.html_hash, Chapter.html_rendered)
+        .where(Chapter.html_hash.in_(hashes), Chapter.pipeline_version == html_pipeline.PIPELINE_VERSION,
+               Chapter.html_rendered.is_not(None))
+    )
+    return dict(rows.all())
+
+def reprocess(workers=None, force: bool = False, batch_size: int = 500, progress=None) -> tuple:
+    """
+    Recalcule les rendus périmés (tous si `force`) ; renvoie (chapitres mis à
+    jour, chapitres ignorés car modifiés pendant le rendu). `workers` :
+    processus de rendu (défaut : nombre de CPU, 1 : dans le processus courant).
+    """
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    done, skipped, last_id = 0, 0, 0
+    b_id, b_hash = db.bindparam("b_id"), db.bindparam("b_hash")
+    stmt = (db.update(Chapter.__table__)
+            .where(Chapter.id == b_id, Chapter.html_hash.is_not_distinct_from(b_hash)))
+    try:
+        while True:
+            q = (db.select(Chapter.id, Lesson.course_id, Chapter.html_content, Chapter.html_hash)
+                 .join(Lesson, Chapter.lesson_id == Lesson.id).join(Course, Lesson.course_id == Course.id)
+                 .where(Chapter.id > last_id, Course.archive_file.is_(None)).order_by(Chapter.id).limit(batch_size))
+            rows = db.session.execute(q if force else q.where(_stale())).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            hashes = [text_delta.content_hash(r.html_content) for r in rows]
+            rendered = {} if force else _known(set(hashes))
+            todo = {h: r.html_content for h, r in zip(hashes, rows) if h not in rendered}
+            if todo:
+                chunk = max(1, len(todo) // (workers * 4))
+                results = pool.map(html_pipeline.render, todo.values(), chunksize=chunk) if pool \
+                    else map(html_pipeline.render, todo.values())
+                rendered.update(zip(todo, results))
+            db.session.execute(stmt, [
+                {"b_id": r.id, "b_hash": r.html_hash, "html_rendered": rendered[h], "html_hash": h,
+                 "pipeline_version": html_pipeline.PIPELINE_VERSION}
+                for h, r in zip(hashes, rows)
+            ])
+            # les lignes non modifiées par l'UPDATE ont un autre hash (ou un
+            # rendu courant, écrit par l'enregistrement concurrent)
+            now = dict(db.session.execute(
+                db.select(Chapter.id, Chapter.html_hash).where(Chapter.id.in_([r.id for r in rows]))).all())
+            changed = sum(now.get(r.id) != h for h, r in zip(hashes, rows))
+            course_tree.mark_dirty(*{r.course_id for r in rows})
+            db.session.commit()
+            done += len(rows) - changed
+            skipped += changed
+            if progress:
+                progress(done)
+    finally:
+        if pool:
+            pool.shutdown()
+    return done, skipped
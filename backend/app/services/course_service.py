@@ -1,5 +1,69 @@
-﻿from app.extensions import db
-from app.domain.models import Course, Lesson, Chapter, Quiz, Question, AnswerOption
+﻿from collections import namedtuple
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.domain.models import Course, Lesson, Chapter, Quiz, Question, AnswerOption, ArchivedRow
+from app.serialization import serializers as S
+from app.cache import course_tree
+from app.events import bus as events
+from app.services import revision_service, question_pool, text_delta, archive_service
+from app.content import html_pipeline
+from app.replicas import primary
+from app.archive import blob
+
+# --- Compteurs dénormalisés (Course / Lesson) ---
+def _nbytes(html) -> int:
+    return len((html or "").encode("utf-8"))
+
+def _nbytes_delta(old: str, ops) -> int:
+    """Variation de taille UTF-8 produite par `ops`, sans réencoder tout le HTML."""
+    return sum(_nbytes(text) - _nbytes(old[start:end]) for start, end, text in ops)
+
+def _html_bytes_expr():
+    # taille en octets côté SQL : length(text) compte des caractères, et un CAST
+    # en bytea interpréterait les antislashs du HTML sous PostgreSQL
+    if db.session.get_bind().dialect.name == "sqlite":  # octet_length() : SQLite >= 3.43
+        return db.func.length(db.cast(Chapter.html_content, db.LargeBinary))
+    return db.func.octet_length(Chapter.html_content)
+
+def _bump_counters(course_id: int, lesson_id: int, **deltas):
+    """Ajoute `deltas` aux compteurs de la leçon et du cours, dans la transaction courante."""
+    course_tree.mark_dirty(course_id)
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    for model, pk in ((Lesson, lesson_id), (Course, course_id)):
+        db.session.execute(db.update(model).where(model.id == pk)
+                           .values({k: getattr(model, k) + v for k, v in deltas.items()}))
+
+def _owner_ids(model, entity_id: int):
+    """(course_id, lesson_id) propriétaires d'un chapitre, quiz, question ou option."""
+    q = db.select(Lesson.course_id, Lesson.id)
+    if model is Chapter:
+        q = q.join(Chapter, Chapter.lesson_id == Lesson.id).where(Chapter.id == entity_id)
+    else:
+        q = q.join(Quiz, Quiz.lesson_id == Lesson.id)
+        if model is Quiz:
+            q = q.where(Quiz.id == entity_id)
+        else:
+            q = q.join(Question, Question.quiz_id == Quiz.id)
+            if model is Question:
+                q = q.where(Question.id == entity_id)
+            else:
+                q = q.join(AnswerOption, AnswerOption.question_id == Question.id).where(AnswerOption.id == entity_id)
+    return db.session.execute(q).first()
+
+def get_stats() -> dict:
+    row = db.session.execute(db.select(
+        db.func.count(Course.id),
+        db.func.coalesce(db.func.sum(Course.lesson_count), 0),
+        db.func.coalesce(db.func.sum(Course.chapter_count), 0),
+        db.func.coalesce(db.func.sum(Course.question_count), 0),
+        db.func.coalesce(db.func.sum(Course.option_count), 0),
+        db.func.coalesce(db.func.sum(Course.html_bytes), 0),
+    )).one()
+    keys = ("course_count", "lesson_count", "chapter_count", "question_count", "option_count", "html_bytes")
+    return dict(zip(keys, (int(v) for v in row)))
 
 # --- Courses / Lessons / Chapters (déjà connus) ---
 def create_course(title: str, lesson_count: int, has_certification: bool) -> Course:
@@ -15,23 +79,149 @@ def create_course(title: str, lesson_count: int, has_certification: bool) -> Cou
     db.session.commit()
     return c
 
+# --- Lectures ---
+# Les lectures sont écrites comme des « plans » : des générateurs qui produisent
+# leurs requêtes et reçoivent les résultats. `_run` les exécute sur la session
+# synchrone ; app.aio les exécute tels quels sur le moteur asynchrone.
+_run = course_tree.run_plan
+
+def plan_list_courses():
+    return (yield db.select(*S.COURSE_SUMMARY_COLUMNS).order_by(Course.created_at.desc())).all()
+
+def plan_course_tree_rows(course_id: int, on_primary: bool = True, stamp=None):
+    """
+    (cours, leçons, chapitres) ; `on_primary=False` : lus là où la session route
+    la requête. None si le cours manque, ou n'est pas à `stamp` (date de
+    création, version).
+    """
+    route = primary if on_primary else (lambda stmt: stmt)
+    course = (yield route(db.select(*S.COURSE_HEAD_COLUMNS, Course.created_at, Course.version)
+                          .where(Course.id == course_id))).first()
+    if course is None or (stamp is not None and (course.created_at, course.version) != stamp):
+        return None
+    lessons = (yield route(db.select(*S.LESSON_COLUMNS)
+               .where(Lesson.course_id == course_id).order_by(Lesson.index))).all()
+    chapters = (yield route(db.select(*S.CHAPTER_HEAD_COLUMNS).join(Lesson, Chapter.lesson_id == Lesson.id)
+                .where(Lesson.course_id == course_id).order_by(Chapter.index))).all()
+    return course, lessons, chapters
+
+def plan_course_snapshot(course_id: int):
+    # l'instantané est gardé jusqu'à la prochaine modification : sa clé (date de
+    # création, version) est lue sur le primaire ; l'arbre est lu sur un réplica
+    # pendant un GET, et relu sur le primaire si le réplica n'a pas cette version
+    stamp = (yield primary(db.select(Course.created_at, Course.version).where(Course.id == course_id))).first()
+    if stamp is None:
+        return None
+    cache = course_tree.get_cache()
+    snap = cache.lookup(course_id, *stamp)
+    if snap is not None:
+        return snap
+    snap = yield from _plan_build_snapshot(course_id, tuple(stamp), on_primary=False)
+    if snap is None:
+        snap = yield from _plan_build_snapshot(course_id, None, on_primary=True)
+        if snap is None:
+            return None
+    cache.store(snap)
+    return snap
+
+def _plan_build_snapshot(course_id: int, stamp, on_primary: bool):
+    """Instantané lu entièrement au même endroit ; None si le cours manque ou n'est pas à `stamp`."""
+    route = primary if on_primary else (lambda stmt: stmt)
+    rows = yield from plan_course_tree_rows(course_id, on_primary, stamp)
+    if rows is None:
+        return None
+    stamp = (rows[0].created_at, rows[0].version)
+    archived = blob.quiz_rows(rows[0].archive_file) if rows[0].archive_file else None
+    if archived is not None:
+        return course_tree.build_snapshot(stamp, *rows, *archived)
+    if rows[0].archive_file and not on_primary:
+        return None  # réhydraté depuis : le réplica n'a pas forcément les quiz restaurés
+    in_course = db.select(Lesson.id).where(Lesson.course_id == course_id)
+    quizzes = (yield route(db.select(*S.QUIZ_COLUMNS).where(Quiz.lesson_id.in_(in_course)).order_by(Quiz.id))).all()
+    quiz_ids = [qz.id for qz in quizzes]
+    questions = options = []
+    if quiz_ids:
+        questions = (yield route(db.select(Question.quiz_id, *S.QUESTION_COLUMNS)
+                     .where(Question.quiz_id.in_(quiz_ids)).order_by(Question.index))).all()
+        options = (yield route(db.select(*S.OPTION_COLUMNS).join(Question, AnswerOption.question_id == Question.id)
+                   .where(Question.quiz_id.in_(quiz_ids)).order_by(AnswerOption.id))).all()
+    return course_tree.build_snapshot(stamp, *rows, quizzes, questions, options)
+
+def plan_quiz_snapshot_by_lesson(lesson_id: int):
+    course_id = course_tree.get_cache().course_id_for_lesson(lesson_id)
+    if course_id is None:
+        course_id = (yield db.select(Lesson.course_id).where(Lesson.id == lesson_id)).scalar()
+        if course_id is None:
+            return None
+    snap = yield from plan_course_snapshot(course_id)
+    lesson = snap.lesson(lesson_id) if snap else None
+    return lesson.quiz if lesson else None
+
+def plan_quiz_draw(lesson_id: int, count=None, seed=None):
+    qz = yield from plan_quiz_snapshot_by_lesson(lesson_id)
+    if qz is None:
+        return None
+    seed, drawn = question_pool.draw(qz, count, seed)
+    return qz, seed, drawn
+
+def plan_chapter_row(chapter_id: int, rendered: bool = False):
+    columns = (*(S.CHAPTER_RENDERED_COLUMNS if rendered else S.CHAPTER_COLUMNS), Chapter.updated_at)
+    if rendered:
+        return (yield from course_tree.plan_chapter(chapter_id, columns))
+    # Le HTML source est celui de l'éditeur, base de ses deltas (base_hash), et le
+    # front servi depuis une autre origine n'envoie pas le cookie db_primary : la
+    # date de modification est lue sur le primaire, la ligne sur un réplica
+    # seulement s'il l'a déjà.
+    updated_at = (yield primary(db.select(Chapter.updated_at).where(Chapter.id == chapter_id))).scalar()
+    if updated_at is None:
+        return None
+    return (yield from course_tree.plan_chapter(chapter_id, columns, lambda row: row.updated_at == updated_at))
+
 def list_courses():
-    return Course.query.order_by(Course.created_at.desc()).all()
+    return _run(plan_list_courses())
+
+def get_course_tree_rows(course_id: int):
+    """(cours, leçons, chapitres) en lignes Core, sans html_content ; None si absent."""
+    return _run(plan_course_tree_rows(course_id))
+
+def get_course_snapshot(course_id: int):
+    """Instantané immuable de l'arbre du cours, servi par le cache (None si absent)."""
+    return _run(plan_course_snapshot(course_id))
+
+def get_quiz_snapshot_by_lesson(lesson_id: int):
+    """Quiz de la leçon tiré de l'instantané du cours (None si leçon ou quiz absent)."""
+    return _run(plan_quiz_snapshot_by_lesson(lesson_id))
 
-def get_course_detail(course_id: int):
-    return Course.query.filter_by(id=course_id).first()
+def draw_quiz_by_lesson(lesson_id: int, count=None, seed=None):
+    """(quiz, seed, [(question, options)]) tirés de l'instantané ; None si la leçon n'a pas de quiz."""
+    return _run(plan_quiz_draw(lesson_id, count, seed))
+
+def get_chapter_row(chapter_id: int, rendered: bool = False):
+    """Chapitre en ligne Core : HTML source, ou rendu du pipeline si `rendered` ; None si absent."""
+    return _run(plan_chapter_row(chapter_id, rendered))
 
 def add_chapter(lesson_id: int, title: str, html_content: str):
+    archive_service.rehydrate_containing(Lesson, lesson_id)
     lesson = Lesson.query.get(lesson_id)
     if not lesson:
         raise ValueError("Lesson introuvable.")
     next_index = (lesson.chapters[-1].index + 1) if lesson.chapters else 1
     ch = Chapter(lesson_id=lesson_id, index=next_index, title=(title or "").strip(), html_content=html_content or "")
-    db.session.add(ch); db.session.commit()
+    _render_html(ch)
+    db.session.add(ch); db.session.flush()
+    _bump_counters(lesson.course_id, lesson_id, chapter_count=1, html_bytes=_nbytes(ch.html_content))
+    revision_service.record(ch.id, ch.title, ch.html_content)
+    events.emit(lesson.course_id, "chapter.added", id=ch.id, lesson_id=lesson_id, index=ch.index, title=ch.title)
+    db.session.commit()
     return ch
 
-def get_chapter(chapter_id: int):
-    return Chapter.query.get(chapter_id)
+def _render_html(ch):
+    """Met à jour le rendu du chapitre, sauf s'il correspond déjà à ce HTML et à cette version du pipeline."""
+    h = text_delta.content_hash(ch.html_content)
+    if ch.html_hash == h and ch.pipeline_version == html_pipeline.PIPELINE_VERSION and ch.html_rendered is not None:
+        return
+    ch.html_rendered = html_pipeline.render(ch.html_content)
+    ch.html_hash, ch.pipeline_version = h, html_pipeline.PIPELINE_VERSION
 
 def update_course(course_id: int, *, title=None, has_certification=None):
     c = Course.query.get(course_id)
@@ -43,7 +233,10 @@ def update_course(course_id: int, *, title=None, has_certification=None):
         if c.title != t: c.title = t; changed = True
     if has_certification is not None and c.has_certification != bool(has_certification):
         c.has_certification = bool(has_certification); changed = True
-    if changed: db.session.commit()
+    if changed:
+        course_tree.mark_dirty(c.id)
+        events.emit(c.id, "course.updated", id=c.id, title=c.title, has_certification=c.has_certification)
+        db.session.commit()
     return c
 
 def update_lesson(lesson_id: int, *, title=None):
@@ -54,65 +247,354 @@ def update_lesson(lesson_id: int, *, title=None):
         t = (title or "").strip()
         if not t: raise ValueError("Titre de la leçon requis.")
         if l.title != t: l.title = t; changed = True
-    if changed: db.session.commit()
+    if changed:
+        course_tree.mark_dirty(l.course_id)
+        events.emit(l.course_id, "lesson.updated", id=l.id, title=l.title)
+        db.session.commit()
     return l
 
+def _locked_chapter(chapter_id: int):
+    """Chapitre verrouillé (SELECT … FOR UPDATE) jusqu'au commit, relu même s'il est déjà en session."""
+    return db.session.scalar(db.select(Chapter).where(Chapter.id == chapter_id)
+                             .with_for_update().execution_options(populate_existing=True))
+
+def _revision_clash(chapter_id: int):
+    """ChapterConflict après un (chapter_id, rev) déjà pris : une autre écriture est passée entre-temps."""
+    db.session.rollback()
+    html = db.session.scalar(db.select(Chapter.html_content).where(Chapter.id == chapter_id))
+    return ChapterConflict(text_delta.content_hash(html or ""))
+
 def update_chapter(chapter_id: int, *, title=None, html_content=None):
-    ch = Chapter.query.get(chapter_id)
+    """
+    Remplace titre et/ou HTML (None : inchangé). La ligne est verrouillée jusqu'au
+    commit pour numéroter la révision ; sans verrou de ligne (SQLite), un
+    enregistrement simultané qui prend le même numéro lève ChapterConflict.
+    """
+    archive_service.rehydrate_containing(Chapter, chapter_id)
+    ch = _locked_chapter(chapter_id)
     if not ch: return None
+    try:
+        return _save_chapter(ch, title, html_content)
+    except IntegrityError:
+        raise _revision_clash(chapter_id)
+
+class ChapterConflict(Exception):
+    """Le HTML du chapitre n'est plus celui sur lequel le delta a été calculé."""
+
+    def __init__(self, html_hash: str):
+        super().__init__("Le chapitre a été modifié depuis la version de base.")
+        self.html_hash = html_hash
+
+def patch_chapter_html(chapter_id: int, base_hash, *, ops=None, diff=None, title=None):
+    """
+    Applique au HTML un delta calculé par l'éditeur sur la version de hash
+    `base_hash` (text_delta.content_hash) : opérations text_delta `ops`, ou diff
+    unifié `diff`. ChapterConflict si le HTML a changé depuis ; None si absent.
+    La ligne est verrouillée (SELECT … FOR UPDATE) entre la vérification du hash
+    et l'écriture ; sans verrou de ligne (SQLite), deux enregistrements simultanés
+    se heurtent sur le numéro de révision et le second part aussi en conflit.
+    """
+    if not isinstance(base_hash, str) or not base_hash:
+        raise ValueError("base_hash requis pour un delta.")
+    if (ops is None) == (diff is None):
+        raise ValueError("Indiquer html_delta ou html_diff.")
+    if ops is not None and not isinstance(ops, list):
+        raise ValueError("html_delta doit être une liste d'opérations [début, fin, texte].")
+    if diff is not None and not isinstance(diff, str):
+        raise ValueError("html_diff doit être un texte.")
+    archive_service.rehydrate_containing(Chapter, chapter_id)
+    ch = _locked_chapter(chapter_id)
+    if not ch: return None
+    current = text_delta.content_hash(ch.html_content)
+    if base_hash != current:
+        db.session.rollback()
+        raise ChapterConflict(current)
+    if diff is not None:
+        ops = text_delta.from_unified(ch.html_content, diff)
+    try:
+        return _save_chapter(ch, title, text_delta.apply(ch.html_content, ops), ops)
+    except IntegrityError:
+        raise _revision_clash(chapter_id)
+
+def _save_chapter(ch, title, html_content, ops=None):
+    """Enregistre titre et HTML (None : inchangé) ; `ops` : delta déjà connu de l'ancien HTML vers le nouveau."""
     changed = False
+    previous = (ch.title, ch.html_content)
     if title is not None:
         t = (title or "").strip()
         if not t: raise ValueError("Titre du chapitre requis.")
         if ch.title != t: ch.title = t; changed = True
+    html_changed = False
     if html_content is not None and ch.html_content != html_content:
-        ch.html_content = html_content; changed = True
-    if changed: db.session.commit()
+        delta = _nbytes_delta(ch.html_content, ops) if ops is not None else _nbytes(html_content) - _nbytes(ch.html_content)
+        ch.html_content = html_content; changed = html_changed = True
+        _bump_counters(ch.lesson.course_id, ch.lesson_id, html_bytes=delta)
+    else:
+        ops = None
+    if changed:
+        _render_html(ch)
+        rev = revision_service.record(ch.id, ch.title, ch.html_content, previous, ops)
+        course_tree.mark_dirty(ch.lesson.course_id)
+        events.emit(ch.lesson.course_id, "chapter.updated", id=ch.id, lesson_id=ch.lesson_id,
+                    title=ch.title, html_changed=html_changed, rev=rev)
+        db.session.commit()
     return ch
 
+def restore_chapter_revision(chapter_id: int, rev: int):
+    """Rétablit le titre et le HTML d'une révision ; crée une nouvelle révision. None si introuvable."""
+    found = revision_service.get_revision(chapter_id, rev)
+    if not found: return None
+    meta, html = found
+    return update_chapter(chapter_id, title=meta.title or None, html_content=html)
+
+# --- Duplication ---
+# (modèle, colonne vers le parent, modèle parent), du haut vers le bas de l'arbre.
+# tables dont les lignes d'un cours archivé sont dans son fichier (ids dans archived_rows)
+_ARCHIVED = (Quiz, Question, AnswerOption)
+
+_CLONE_TREE = (
+    (Lesson, "course_id", Course),
+    (Chapter, "lesson_id", Lesson),
+    (Quiz, "lesson_id", Lesson),
+    (Question, "quiz_id", Quiz),
+    (AnswerOption, "question_id", Question),
+)
+
+def clone_course(course_id: int, title=None):
+    """
+    Duplique un cours et tout son arbre par des INSERT … SELECT ensemblistes.
+    Les ids des lignes copiées d'une table sont décalés de max(id) + 1 - min(id
+    des lignes source) : ils suivent le max de la table (et des ids archivés,
+    pour ne pas les reprendre) au lieu de le doubler à chaque copie. Les clés
+    étrangères sont remappées avec le décalage du parent, sans charger d'objets
+    ORM. Renvoie l'id du nouveau cours, ou None si la
+    source n'existe pas. Une source archivée reste archivée : le HTML de ses
+    chapitres et ses quiz sont lus dans son fichier d'archive.
+    """
+    models = (Course,) + tuple(m for m, _, _ in _CLONE_TREE)
+    _lock_tables(models)
+    name = db.session.scalar(db.select(Course.archive_file).where(Course.id == course_id))
+    archived = _archived_tree(course_id, name) if name else None
+    scope = {Course: db.select(Course.id).where(Course.id == course_id)}
+    for model, fk, parent in _CLONE_TREE:
+        scope[model] = db.select(model.id).where(getattr(model, fk).in_(scope[parent]))
+    archived_ids = {m: db.select(ArchivedRow.row_id.label("id")).where(ArchivedRow.kind == m.__tablename__)
+                    for m in _ARCHIVED}
+    agg = lambda f, ids: db.select(db.func.coalesce(f(ids.subquery().c.id), 0)).scalar_subquery()
+    row = db.session.execute(db.select(
+        db.select(Course.title).where(Course.id == course_id).scalar_subquery(),
+        *[agg(db.func.max, db.select(m.id)) for m in models],
+        *[agg(db.func.max, archived_ids[m]) for m in _ARCHIVED],
+        *[agg(db.func.min, scope[m]) for m in models],
+    )).one()
+    n, k = len(models), len(_ARCHIVED)
+    src_title, tops = row[0], dict(zip(models, row[1:1 + n]))
+    for m, top in zip(_ARCHIVED, row[1 + n:1 + n + k]):
+        tops[m] = max(tops[m], top)
+    offsets = {m: tops[m] + 1 - low for m, low in zip(models, row[1 + n + k:])}
+    if src_title is None:
+        return None
+    if title is None:
+        title = f"{src_title} (copie)"
+    title = (title or "").strip()[:255]
+    if not title:
+        raise ValueError("Le titre est requis.")
+
+    now = datetime.utcnow()
+    _insert_clone(Course, offsets[Course], None, 0, scope[Course], now,
+                  {"title": title, "archived_at": None, "archive_file": None})
+    for model, fk, parent in _CLONE_TREE:
+        if archived and model in archived.rows:
+            offsets[model] = _insert_archived_clone(model, archived.rows[model], fk, offsets[parent], now, tops[model])
+        else:
+            _insert_clone(model, offsets[model], fk, offsets[parent], scope[model], now)
+    if archived and archived.chapters:
+        db.session.execute(
+            db.update(Chapter.__table__).where(Chapter.id == db.bindparam("b_id"))
+            .values(html_content=db.bindparam("b_html"), html_rendered=db.bindparam("b_rendered"),
+                    pipeline_version=db.bindparam("b_version")),
+            [dict(c, b_id=c["b_id"] + offsets[Chapter]) for c in archived.chapters])
+    _sync_sequences(models)
+    db.session.commit()
+    return course_id + offsets[Course]
+
+_ArchivedTree = namedtuple("_ArchivedTree", "rows chapters")
+
+def _archived_tree(course_id: int, name: str):
+    """Quiz, questions, options et HTML des chapitres d'un cours archivé, lus dans son fichier sans le réhydrater."""
+    try:
+        reader = blob.get_readers().get(name)
+    except FileNotFoundError:
+        raise ValueError(f"Archive du cours {course_id} introuvable ({name}).") from None
+    quiz = reader.frame("quiz")
+    rows = {model: blob.load_rows(model, quiz[model.__tablename__]) for model in (Quiz, Question, AnswerOption)}
+    chapters = []
+    chapter_ids = db.session.scalars(
+        db.select(Chapter.id).join(Lesson, Chapter.lesson_id == Lesson.id).where(Lesson.course_id == course_id))
+    for chapter_id in chapter_ids:
+        data = reader.frame(f"chapter-{chapter_id}")
+        if data is not None:
+            chapters.append({"b_id": chapter_id, "b_html": data["html_content"],
+                             "b_rendered": data["html_rendered"], "b_version": data["pipeline_version"]})
+    return _ArchivedTree(rows, chapters)
+
+def _insert_archived_clone(model, rows, fk, parent_offset, now, top) -> int:
+    """Insère les copies de lignes archivées (même décalage que _insert_clone) ; renvoie le décalage des ids."""
+    if not rows:
+        return 0
+    offset = top + 1 - min(r.id for r in rows)
+    copies = []
+    for r in rows:
+        values = r._asdict()
+        values["id"] += offset
+        values[fk] += parent_offset
+        values["created_at"] = values["updated_at"] = now
+        copies.append(values)
+    db.session.execute(db.insert(model.__table__), copies)
+    return offset
+
+def _insert_clone(model, offset, fk, parent_offset, ids, now, overrides=None):
+    table = model.__table__
+    overrides = overrides or {}
+    exprs = []
+    for col in table.c:
+        if col.name == "id":
+            exprs.append(col + offset)
+        elif col.name == fk:
+            exprs.append(col + parent_offset)
+        elif col.name in ("created_at", "updated_at"):
+            exprs.append(db.literal(now, db.DateTime))
+        elif col.name in overrides:
+            exprs.append(db.literal(overrides[col.name], col.type))
+        else:
+            exprs.append(col)
+    sel = db.select(*exprs).where(table.c.id.in_(ids))
+    db.session.execute(db.insert(table).from_select([c.name for c in table.c], sel))
+
+def _lock_tables(models):
+    # PostgreSQL : les décalages lus (max(id)) restent valables jusqu'au commit,
+    # ni autre copie ni insertion concurrente (SQLite sérialise déjà les écritures).
+    if db.session.get_bind().dialect.name != "postgresql":
+        return
+    db.session.execute(db.text(
+        "LOCK TABLE " + ", ".join(m.__tablename__ for m in models) + " IN EXCLUSIVE MODE"))
+
+def _sync_sequences(models):
+    # Les ids explicites ne font pas avancer les séquences PostgreSQL.
+    if db.session.get_bind().dialect.name != "postgresql":
+        return
+    for m in models:
+        t = m.__tablename__
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{t}', 'id'), (SELECT max(id) FROM {t}))"))
+
+# Les suppressions passent par un DELETE unique : les enfants sont supprimés par
+# les clés étrangères ON DELETE CASCADE, sans charger l'arbre ORM en mémoire.
+# DELETE … RETURNING : seuls les cours réellement supprimés émettent un événement.
 def delete_course(course_id: int) -> bool:
-    c = Course.query.get(course_id)
-    if not c: return False
-    db.session.delete(c); db.session.commit()
-    return True
+    row = db.session.execute(
+        db.delete(Course).where(Course.id == course_id).returning(Course.archive_file)).first()
+    course_tree.discard_after_commit(course_id)
+    if row:
+        archive_service.drop_files(row.archive_file)
+        events.emit(course_id, "course.deleted", id=course_id)
+    db.session.commit()
+    return row is not None
+
+def delete_courses(course_ids) -> int:
+    ids = {int(i) for i in course_ids or []}
+    if not ids:
+        return 0
+    if len(ids) > 1000:
+        raise ValueError("1000 cours maximum par suppression.")
+    rows = db.session.execute(
+        db.delete(Course).where(Course.id.in_(ids)).returning(Course.id, Course.archive_file)).all()
+    course_tree.discard_after_commit(*ids)
+    archive_service.drop_files(*(r.archive_file for r in rows))
+    for r in sorted(rows, key=lambda r: r.id):
+        events.emit(r.id, "course.deleted", id=r.id)
+    db.session.commit()
+    return len(rows)
 
 def delete_chapter(chapter_id: int) -> bool:
-    ch = Chapter.query.get(chapter_id)
-    if not ch: return False
-    db.session.delete(ch); db.session.commit()
+    archive_service.rehydrate_containing(Chapter, chapter_id)
+    row = db.session.execute(
+        db.select(Lesson.course_id, Lesson.id, _html_bytes_expr())
+        .join(Chapter, Chapter.lesson_id == Lesson.id).where(Chapter.id == chapter_id)).first()
+    if not row: return False
+    course_id, lesson_id, nbytes = row
+    db.session.execute(db.delete(Chapter).where(Chapter.id == chapter_id))
+    _bump_counters(course_id, lesson_id, chapter_count=-1, html_bytes=-(nbytes or 0))
+    events.emit(course_id, "chapter.deleted", id=chapter_id, lesson_id=lesson_id)
+    db.session.commit()
     return True
 
 # --- Quiz / Questions / Options ---
 def get_or_create_quiz_for_lesson(lesson_id: int, title: str = "Quiz"):
+    archive_service.rehydrate_containing(Lesson, lesson_id)
     lesson = Lesson.query.get(lesson_id)
     if not lesson:
         raise ValueError("Lesson introuvable.")
     if lesson.quiz:
         return lesson.quiz
     qz = Quiz(lesson_id=lesson_id, title=title)
-    db.session.add(qz); db.session.commit()
+    db.session.add(qz); db.session.flush()
+    course_tree.mark_dirty(lesson.course_id)
+    events.emit(lesson.course_id, "quiz.created", id=qz.id, lesson_id=lesson_id, title=qz.title)
+    db.session.commit()
     return qz
 
-def get_quiz_by_lesson(lesson_id: int):
-    lesson = Lesson.query.get(lesson_id)
-    if not lesson:
-        return None
-    return lesson.quiz
+def update_quiz(quiz_id: int, *, title=None, draw_count=None, stratify_by_tag=None, shuffle_options=None):
+    """`draw_count` : 0 pour revenir à toutes les questions."""
+    archive_service.rehydrate_containing(Quiz, quiz_id)
+    qz = Quiz.query.get(quiz_id)
+    if not qz: return None
+    changed = False
+    if title is not None:
+        t = (title or "").strip()
+        if not t: raise ValueError("Titre du quiz requis.")
+        if qz.title != t: qz.title = t; changed = True
+    if draw_count is not None:
+        if not isinstance(draw_count, int) or isinstance(draw_count, bool) or draw_count < 0:
+            raise ValueError("draw_count doit être un entier positif.")
+        n = draw_count or None
+        if qz.draw_count != n: qz.draw_count = n; changed = True
+    for name, value in (("stratify_by_tag", stratify_by_tag), ("shuffle_options", shuffle_options)):
+        if value is not None and getattr(qz, name) != bool(value):
+            setattr(qz, name, bool(value)); changed = True
+    if changed:
+        course_tree.mark_dirty(qz.lesson.course_id)
+        events.emit(qz.lesson.course_id, "quiz.updated", id=qz.id, lesson_id=qz.lesson_id, title=qz.title,
+                    draw_count=qz.draw_count, stratify_by_tag=qz.stratify_by_tag, shuffle_options=qz.shuffle_options)
+        db.session.commit()
+    return qz
+
+def _clean_tag(tag):
+    t = (tag or "").strip()
+    if len(t) > 64: raise ValueError("Tag trop long (64 caractères max).")
+    return t or None
 
-def add_question(quiz_id: int, text: str, qtype: str = "single"):
+def add_question(quiz_id: int, text: str, qtype: str = "single", tag=None):
+    archive_service.rehydrate_containing(Quiz, quiz_id)
     quiz = Quiz.query.get(quiz_id)
     if not quiz:
         raise ValueError("Quiz introuvable.")
     if (qtype or "single") not in {"single","multiple"}:
         raise ValueError("Type de question invalide.")
     next_index = (quiz.questions[-1].index + 1) if quiz.questions else 1
-    q = Question(quiz_id=quiz_id, index=next_index, text=(text or "").strip(), type=qtype or "single")
+    q = Question(quiz_id=quiz_id, index=next_index, text=(text or "").strip(), type=qtype or "single", tag=_clean_tag(tag))
     if not q.text:
         raise ValueError("Le texte de la question est requis.")
-    db.session.add(q); db.session.commit()
+    db.session.add(q)
+    _bump_counters(quiz.lesson.course_id, quiz.lesson_id, question_count=1)
+    events.emit(quiz.lesson.course_id, "question.added", id=q.id, quiz_id=quiz_id, lesson_id=quiz.lesson_id,
+                index=q.index, text=q.text, type=q.type, tag=q.tag)
+    db.session.commit()
     return q
 
-def update_question(question_id: int, *, text=None, qtype=None):
+def update_question(question_id: int, *, text=None, qtype=None, tag=None):
+    """`tag` : "" pour le retirer."""
+    archive_service.rehydrate_containing(Question, question_id)
     q = Question.query.get(question_id)
     if not q: return None
     changed = False
@@ -124,26 +606,47 @@ def update_question(question_id: int, *, text=None, qtype=None):
         if qtype not in {"single","multiple"}:
             raise ValueError("Type invalide.")
         if q.type != qtype: q.type = qtype; changed = True
-    if changed: db.session.commit()
+    if tag is not None:
+        t = _clean_tag(tag)
+        if q.tag != t: q.tag = t; changed = True
+    if changed:
+        course_id, lesson_id = _owner_ids(Question, question_id)
+        course_tree.mark_dirty(course_id)
+        events.emit(course_id, "question.updated", id=q.id, quiz_id=q.quiz_id, lesson_id=lesson_id,
+                    text=q.text, type=q.type, tag=q.tag)
+        db.session.commit()
     return q
 
 def delete_question(question_id: int) -> bool:
-    q = Question.query.get(question_id)
-    if not q: return False
-    db.session.delete(q); db.session.commit()
+    archive_service.rehydrate_containing(Question, question_id)
+    owners = _owner_ids(Question, question_id)
+    if not owners: return False
+    n_options = db.session.execute(
+        db.select(db.func.count(AnswerOption.id)).where(AnswerOption.question_id == question_id)).scalar()
+    db.session.execute(db.delete(Question).where(Question.id == question_id))
+    _bump_counters(*owners, question_count=-1, option_count=-n_options)
+    events.emit(owners[0], "question.deleted", id=question_id, lesson_id=owners[1])
+    db.session.commit()
     return True
 
 def add_option(question_id: int, text: str, is_correct: bool = False):
+    archive_service.rehydrate_containing(Question, question_id)
     q = Question.query.get(question_id)
     if not q:
         raise ValueError("Question introuvable.")
     opt = AnswerOption(question_id=question_id, text=(text or "").strip(), is_correct=bool(is_correct))
     if not opt.text:
         raise ValueError("Texte de réponse requis.")
-    db.session.add(opt); db.session.commit()
+    db.session.add(opt)
+    course_id, lesson_id = _owner_ids(Question, question_id)
+    _bump_counters(course_id, lesson_id, option_count=1)
+    events.emit(course_id, "option.added", id=opt.id, question_id=question_id, lesson_id=lesson_id,
+                text=opt.text, is_correct=opt.is_correct)
+    db.session.commit()
     return opt
 
 def update_option(option_id: int, *, text=None, is_correct=None):
+    archive_service.rehydrate_containing(AnswerOption, option_id)
     o = AnswerOption.query.get(option_id)
     if not o: return None
     changed = False
@@ -153,11 +656,20 @@ def update_option(option_id: int, *, text=None, is_correct=None):
         if o.text != t: o.text = t; changed = True
     if is_correct is not None and bool(is_correct) != o.is_correct:
         o.is_correct = bool(is_correct); changed = True
-    if changed: db.session.commit()
+    if changed:
+        course_id, lesson_id = _owner_ids(AnswerOption, option_id)
+        course_tree.mark_dirty(course_id)
+        events.emit(course_id, "option.updated", id=o.id, question_id=o.question_id, lesson_id=lesson_id,
+                    text=o.text, is_correct=o.is_correct)
+        db.session.commit()
     return o
 
 def delete_option(option_id: int) -> bool:
-    o = AnswerOption.query.get(option_id)
-    if not o: return False
-    db.session.delete(o); db.session.commit()
+    archive_service.rehydrate_containing(AnswerOption, option_id)
+    owners = _owner_ids(AnswerOption, option_id)
+    if not owners: return False
+    db.session.execute(db.delete(AnswerOption).where(AnswerOption.id == option_id))
+    _bump_counters(*owners, option_count=-1)
+    events.emit(owners[0], "option.deleted", id=option_id, lesson_id=owners[1])
+    db.session.commit()
     return True
@@ -0,0 +1,56 @@
+"""
+Tirage aléatoire de questions dans la banque d'un quiz.
+
+Le tirage travaille sur l'instantané du quiz (cache des arbres de cours) : ses
+questions forment un tableau et `strata` donne, pour chaque tag, les positions
+correspondantes. Tirer N questions coûte O(N) (random.sample sur un range),
+sans ORDER BY random() ni lecture de la table. Le même algorithme est repris
+côté client dans la page quiz de l'export SCORM (app.scorm.builder).
+"""
+import random
+import secrets
+
+def allocate(sizes: dict, n: int) -> dict:
+    """Répartit `n` tirages entre les strates au prorata de leur taille (plus forts restes)."""
+    total = sum(sizes.values())
+    if not total:
+        return {}
+    quotas, rests = {}, []
+    for key, size in sizes.items():
+        exact = n * size / total
+        quotas[key] = int(exact)
+        rests.append((exact - quotas[key], size, key))
+    missing = n - sum(quotas.values())
+    rests.sort(key=lambda r: (-r[0], -r[1]))
+    for _, _, key in rests[:missing]:
+        quotas[key] += 1
+    return quotas
+
+def draw(quiz, count=None, seed=None):
+    """
+    (seed, [(question, options)]) : `count` questions (défaut quiz.draw_count,
+    sinon toutes) dans un ordre aléatoire, stratifiées par tag si le quiz le
+    demande, options mélangées si shuffle_options. Le même `seed` redonne le
+    même tirage tant que la banque n'a pas changé.
+    """
+    if seed is None:
+        seed = secrets.randbits(32)
+    rng = random.Random(seed)
+    questions = quiz.questions
+    n = min(count or quiz.draw_count or len(questions), len(questions))
+    if quiz.stratify_by_tag and len(quiz.strata) > 1:
+        picked = []
+        quotas = allocate({tag: len(pos) for tag, pos in quiz.strata.items()}, n)
+        for tag, positions in quiz.strata.items():
+            picked += [positions[i] for i in rng.sample(range(len(positions)), quotas[tag])]
+        rng.shuffle(picked)
+    else:
+        picked = rng.sample(range(len(questions)), n)
+    drawn = []
+    for i in picked:
+        q = questions[i]
+        options = list(q.options)
+        if quiz.shuffle_options:
+            rng.shuffle(options)
+        drawn.append((q, options))
+    return seed, drawn
@@ -0,0 +1,225 @@
+﻿"""
+Historique des chapitres (modèle ChapterRevision).
+
+Chaque enregistrement du HTML ajoute une révision : un instantané complet toutes
+les REVISIONS_SNAPSHOT_EVERY révisions, sinon un delta compressé (text_delta)
+par rapport à la précédente. Reconstruire une révision lit donc au plus K
+lignes : l'instantané de sa chaîne et les deltas qui le suivent.
+
+L'historique d'un chapitre commence à sa création, ou à sa première
+modification pour les chapitres antérieurs et les copies (clone_course). Le
+compactage (arrière-plan toutes les REVISIONS_COMPACT_EVERY révisions, ou
+`flask revisions compact`) garde les REVISIONS_KEEP_RECENT dernières révisions,
+une par jour au-delà, et réencode les anciennes chaînes ; la chaîne courante,
+sur laquelle s'appuient les nouveaux deltas, n'est jamais réécrite.
+"""
+from queue import Queue
+from threading import Lock, Thread
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.domain.models import Chapter, ChapterRevision
+from app.serialization import serializers as S
+from app.services import text_delta
+
+# --- Écriture ---
+def _head(chapter_id: int):
+    return db.session.execute(
+        db.select(ChapterRevision.rev, ChapterRevision.base_rev, ChapterRevision.content_hash)
+        .where(ChapterRevision.chapter_id == chapter_id)
+        .order_by(ChapterRevision.rev.desc()).limit(1)
+    ).first()
+
+def _row(chapter_id, rev, base_rev, kind, title, html, content_hash, data, created_at=None):
+    row = ChapterRevision(chapter_id=chapter_id, rev=rev, base_rev=base_rev, kind=kind, title=title or "",
+                          size=len(html), content_hash=content_hash, data=data)
+    if created_at is not None:  # compactage : date d'origine conservée
+        row.created_at = created_at
+    return row
+
+def _snapshot(chapter_id, rev, title, html, content_hash, created_at=None):
+    return _row(chapter_id, rev, rev, "snapshot", title, html, content_hash, text_delta.pack_text(html), created_at)
+
+def _encode(chapter_id, rev, base_rev, title, previous_html, html, content_hash, created_at=None, ops=None):
+    """Delta depuis `previous_html` (`ops` s'il est déjà connu), ou instantané si la chaîne est pleine ou le delta trop gros."""
+    if rev - base_rev < current_app.config["REVISIONS_SNAPSHOT_EVERY"]:
+        if ops is None:
+            ops = text_delta.compute(previous_html, html)
+        if 2 * sum(len(op[2]) for op in ops) <= len(html):
+            return _row(chapter_id, rev, base_rev, "delta", title, html, content_hash,
+                        text_delta.pack_ops(ops), created_at)
+    return _snapshot(chapter_id, rev, title, html, content_hash, created_at)
+
+def record(chapter_id: int, title: str, html: str, previous=None, ops=None) -> int:
+    """
+    Ajoute la révision (title, html) dans la transaction courante et renvoie son
+    numéro. `previous` (titre, HTML) est le contenu remplacé : il sert de base au
+    delta, et de révision initiale si le chapitre n'a pas encore d'historique.
+    `ops` : opérations text_delta de l'ancien HTML vers `html`, si déjà connues.
+    """
+    head = _head(chapter_id)
+    content_hash = text_delta.content_hash(html)
+    prev_title, prev_html = previous or (None, None)
+    prev_hash = text_delta.content_hash(prev_html) if prev_html is not None else None
+    if head is None:
+        if prev_html is None:
+            db.session.add(_snapshot(chapter_id, 1, title, html, content_hash))
+            return 1
+        db.session.add(_snapshot(chapter_id, 1, prev_title, prev_html, prev_hash))
+        head = (1, 1, prev_hash)
+    rev, base_rev, head_hash = head
+    rev += 1
+    if prev_hash is None or head_hash != prev_hash:
+        # HTML modifié hors de course_service : pas de base fiable pour un delta
+        db.session.add(_snapshot(chapter_id, rev, title, html, content_hash))
+    else:
+        db.session.add(_encode(chapter_id, rev, base_rev, title, prev_html, html, content_hash, ops=ops))
+    every = current_app.config["REVISIONS_COMPACT_EVERY"]
+    if every and rev % every == 0:
+        db.session.info.setdefault("compact_chapters", set()).add(chapter_id)
+    return rev
+
+# --- Lecture ---
+def _exists(chapter_id: int) -> bool:
+    return db.session.scalar(db.select(Chapter.id).where(Chapter.id == chapter_id)) is not None
+
+def list_revisions(chapter_id: int, before=None, limit: int = 50):
+    """Métadonnées des révisions, de la plus récente à la plus ancienne (sans les données) ; None si le chapitre n'existe pas."""
+    if not _exists(chapter_id):
+        return None
+    q = (db.select(*S.REVISION_COLUMNS).where(ChapterRevision.chapter_id == chapter_id)
+         .order_by(ChapterRevision.rev.desc()).limit(limit))
+    if before is not None:
+        q = q.where(ChapterRevision.rev < before)
+    return db.session.execute(q).all()
+
+def last_rev(chapter_id: int):
+    head = _head(chapter_id)
+    return head.rev if head else None
+
+def get_revision(chapter_id: int, rev: int):
+    """(métadonnées, HTML) de la révision `rev`, ou None ; lit l'instantané de sa chaîne et au plus K-1 deltas."""
+    base = (db.select(ChapterRevision.base_rev)
+            .where(ChapterRevision.chapter_id == chapter_id, ChapterRevision.rev == rev).scalar_subquery())
+    rows = db.session.execute(
+        db.select(*S.REVISION_COLUMNS, ChapterRevision.data)
+        .where(ChapterRevision.chapter_id == chapter_id, ChapterRevision.base_rev == base,
+               ChapterRevision.rev <= rev)
+        .order_by(ChapterRevision.rev)
+    ).all()
+    if not rows or rows[-1].rev != rev:
+        return None
+    html = text_delta.unpack_text(rows[0].data)
+    for r in rows[1:]:
+        html = text_delta.apply(html, text_delta.unpack_ops(r.data))
+    return rows[-1], html
+
+def diff(chapter_id: int, from_rev: int, to_rev: int, fmt: str = "unified"):
+    """Différence entre deux révisions : diff unifié (lignes) ou opérations text_delta ; None si l'une manque."""
+    a, b = get_revision(chapter_id, from_rev), get_revision(chapter_id, to_rev)
+    if a is None or b is None:
+        return None
+    if fmt == "ops":
+        return text_delta.compute(a[1], b[1])
+    return text_delta.to_unified(a[1], b[1], fromfile=f"rev {from_rev}", tofile=f"rev {to_rev}")
+
+# --- Compactage ---
+def _kept(revs, keep_recent: int):
+    """Numéros conservés parmi `revs` (rev, created_at) triés : les récents, puis la dernière de chaque jour."""
+    revs = list(revs)
+    recent = {r for r, _ in revs[-keep_recent:]} if keep_recent else set()
+    last_of_day = {}
+    for r, created_at in revs:
+        last_of_day[created_at.date()] = r
+    return recent | set(last_of_day.values())
+
+def compact(chapter_id: int) -> int:
+    """Compacte l'historique du chapitre (hors chaîne courante) ; renvoie le nombre de révisions supprimées."""
+    head = _head(chapter_id)
+    if head is None:
+        return 0
+    C = ChapterRevision
+    old = db.session.execute(
+        db.select(C.rev, C.created_at).where(C.chapter_id == chapter_id).order_by(C.rev)
+    ).all()
+    kept = _kept(old, current_app.config["REVISIONS_KEEP_RECENT"]) | {r for r, _ in old if r >= head.base_rev}
+    dropped = [r for r, _ in old if r not in kept]
+    if not dropped:
+        return 0
+
+    rows = db.session.execute(
+        db.select(C.rev, C.kind, C.title, C.content_hash, C.created_at, C.data)
+        .where(C.chapter_id == chapter_id, C.rev < head.base_rev).order_by(C.rev)
+    ).all()
+    rewritten, html, prev_html, base_rev = [], None, None, None
+    for r in rows:
+        html = text_delta.unpack_text(r.data) if r.kind == "snapshot" else text_delta.apply(html, text_delta.unpack_ops(r.data))
+        if r.rev not in kept:
+            continue
+        if base_rev is None:
+            new = _snapshot(chapter_id, r.rev, r.title, html, r.content_hash, r.created_at)
+        else:
+            new = _encode(chapter_id, r.rev, base_rev, r.title, prev_html, html, r.content_hash, r.created_at)
+        base_rev, prev_html = new.base_rev, html
+        rewritten.append(new)
+
+    db.session.execute(db.delete(C).where(C.chapter_id == chapter_id, C.rev < head.base_rev))
+    db.session.add_all(rewritten)
+    db.session.commit()
+    return len(dropped)
+
+def compact_all() -> int:
+    total = 0
+    for chapter_id in db.session.scalars(db.select(ChapterRevision.chapter_id).distinct()).all():
+        total += compact(chapter_id)
+    return total
+
+class RevisionCompactor:
+    """File de compactage traitée par un thread d'arrière-plan, démarré à la première demande (après un fork éventuel)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = Lock()
+        self._queue = Queue()
+        self._pending = set()
+        self._thread = None
+
+    def submit(self, chapter_id: int):
+        with self._lock:
+            if chapter_id in self._pending:
+                return
+            self._pending.add(chapter_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name="revision-compactor", daemon=True)
+                self._thread.start()
+        self._queue.put(chapter_id)
+
+    def _run(self):
+        while True:
+            chapter_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(chapter_id)
+            with self.app.app_context():
+                try:
+                    compact(chapter_id)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception("Compactage de l'historique du chapitre %s impossible", chapter_id)
+
+@event.listens_for(Session, "after_commit")
+def _schedule_compaction(session):
+    chapter_ids = session.info.pop("compact_chapters", None)
+    if chapter_ids and has_app_context():
+        compactor = current_app.extensions["revision_compactor"]
+        for chapter_id in chapter_ids:
+            compactor.submit(chapter_id)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_compaction(session, previous_transaction):
+    session.info.pop("compact_chapters", None)
+
+def init_revisions(app):
+    app.extensions["revision_compactor"] = RevisionCompactor(app)
@@ -0,0 +1,153 @@
+﻿"""
+Deltas texte sous forme d'opérations de remplacement (« splices »).
+
+Une opération est un triplet [début, fin, texte] en indices de caractères de
+l'ancien texte : old[début:fin] est remplacé par `texte`. Les opérations d'un
+delta sont triées et ne se chevauchent pas. Le calcul découpe le HTML en
+balises / mots / espaces après avoir retiré le préfixe et le suffixe communs,
+ce qui garde les modifications locales (cas courant) quasi linéaires.
+
+Les indices sont ceux des chaînes Python (points de code), aussi pour les
+deltas envoyés par l'éditeur (PATCH /api/chapters/<id>), qui peut aussi
+envoyer un diff unifié (from_unified ; to_unified produit le même format).
+"""
+import hashlib
+import json
+import re
+import zlib
+from difflib import SequenceMatcher, unified_diff
+
+_TOKENS = re.compile(r"<[^>]*>|\s+|[^<\s]+|<")
+_LINES = re.compile(r"[^\n]*\n|[^\n]+")
+_HUNK = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# au-delà (produit des nombres de jetons), SequenceMatcher ignore les jetons
+# trop fréquents : le delta peut être moins fin, mais le temps reste borné
+_MAX_EXACT_WORK = 4_000_000
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+def compute(old: str, new: str) -> list:
+    """Opérations transformant `old` en `new`."""
+    if old == new:
+        return []
+    start = _common_length(old, new)
+    n = min(len(old), len(new)) - start
+    end = _common_length(old[::-1][:n], new[::-1][:n])
+    a, b = old[start:len(old) - end], new[start:len(new) - end]
+    if not a or not b:
+        return [[start, start + len(a), b]]
+    ta, tb = _TOKENS.findall(a), _TOKENS.findall(b)
+    pa, pb = _offsets(ta), _offsets(tb)
+    ops = []
+    exact = len(ta) * len(tb) <= _MAX_EXACT_WORK
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, ta, tb, autojunk=not exact).get_opcodes():
+        if tag != "equal":
+            ops.append([start + pa[i1], start + pa[i2], b[pb[j1]:pb[j2]]])
+    return ops
+
+def _common_length(a: str, b: str) -> int:
+    """Longueur du préfixe commun (dichotomie sur des comparaisons de tranches)."""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _offsets(tokens) -> list:
+    pos, out = 0, [0]
+    for t in tokens:
+        pos += len(t)
+        out.append(pos)
+    return out
+
+def apply(old: str, ops) -> str:
+    """Applique des opérations ; ValueError si elles sont invalides pour `old`."""
+    parts, pos = [], 0
+    for op in ops:
+        if not isinstance(op, (list, tuple)) or len(op) != 3:
+            raise ValueError("Opération de delta invalide.")
+        start, end, text = op
+        if not (isinstance(start, int) and isinstance(end, int) and isinstance(text, str)):
+            raise ValueError("Opération de delta invalide.")
+        if start < pos or end < start or end > len(old):
+            raise ValueError("Opérations de delta hors limites ou non ordonnées.")
+        parts.append(old[pos:start]); parts.append(text)
+        pos = end
+    parts.append(old[pos:])
+    return "".join(parts)
+
+def from_unified(old: str, diff: str) -> list:
+    """
+    Opérations équivalentes à un diff unifié (lignes séparées par \\n) appliqué à
+    `old` ; ValueError si le diff est invalide ou si son contexte ne correspond
+    pas exactement à `old` (pas d'application approximative).
+    """
+    lines = _LINES.findall(old)
+    starts = _offsets(lines)
+    patch = _LINES.findall(diff)
+    ops, pos, i = [], 0, 0
+    while i < len(patch) and not patch[i].startswith("@@"):  # en-têtes --- / +++
+        i += 1
+    while i < len(patch):
+        m = _HUNK.match(patch[i])
+        if not m:
+            raise ValueError("Diff unifié invalide.")
+        old_count = 1 if m[2] is None else int(m[2])
+        new_count = 1 if m[4] is None else int(m[4])
+        first = int(m[1]) - 1 if old_count else int(m[1])  # -N,0 : insertion après la ligne N
+        if first < pos or first + old_count > len(lines):
+            raise ValueError("Blocs du diff hors limites ou non ordonnés.")
+        i += 1
+        a, b, last = [], [], None
+        while old_count or new_count or (i < len(patch) and patch[i].startswith("\\")):
+            if i >= len(patch):
+                raise ValueError("Diff unifié tronqué.")
+            line = patch[i]; i += 1
+            tag, text = (" ", line) if line in ("\n", "\r\n") else (line[:1], line[1:])
+            if tag == "\\":  # « \ No newline at end of file » : s'applique à la ligne précédente
+                for side in (a if last in (" ", "-") else None, b if last in (" ", "+") else None):
+                    if side and side[-1].endswith("\n"):
+                        side[-1] = side[-1][:-1]
+                continue
+            if tag not in " -+" or (tag in " -" and not old_count) or (tag in " +" and not new_count):
+                raise ValueError("Diff unifié invalide.")
+            if tag in " -":
+                a.append(text); old_count -= 1
+            if tag in " +":
+                b.append(text); new_count -= 1
+            last = tag
+        if "".join(lines[first:first + len(a)]) != "".join(a):
+            raise ValueError("Le diff ne correspond pas au HTML de base.")
+        end = first + len(a)
+        ops.append([starts[first], starts[end], "".join(b)])
+        pos = end
+    return ops
+
+def to_unified(old: str, new: str, fromfile: str = "", tofile: str = "") -> str:
+    """
+    Diff unifié de `old` à `new`, lignes découpées sur \n comme from_unified ;
+    une dernière ligne sans \n est suivie de « \\ No newline at end of file ».
+    """
+    out = []
+    for line in unified_diff(_LINES.findall(old), _LINES.findall(new), fromfile, tofile):
+        out.append(line)
+        if not line.endswith("\n"):
+            out.append("\n\\ No newline at end of file\n")
+    return "".join(out)
+
+# --- Stockage compact ---
+def pack_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+def unpack_text(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+def pack_ops(ops) -> bytes:
+    return zlib.compress(json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+def unpack_ops(data: bytes) -> list:
+    return json.loads(zlib.decompress(data))
@@ -0,0 +1,8 @@
+﻿"""
+Point d'entrée ASGI : uvicorn asgi:app --port 5001
+(dépendances : uvicorn, et aiosqlite ou asyncpg selon la base)
+"""
+from app import create_app
+from app.aio.application import create_asgi_app
+
+app = create_asgi_app(create_app())
@@ -0,0 +1,92 @@
+"""
+Part de la sérialisation JSON dans courses.detail et quizzes.by_lesson.
+
+    python bench/bench_json.py [--lessons 20] [--chapters 25] [--questions 40] [--repeat 20]
+
+Compare l'ancien chemin (objets ORM + encodeur stdlib par défaut de Flask) au
+nouveau (lignes Core + provider configuré par JSON_BACKEND), sur une base
+SQLite temporaire.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _seed(db, lessons, chapters, questions, options=4):
+    from app.domain.models import Course, Lesson, Chapter, Quiz, Question, AnswerOption
+    html = "<p>" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40 + "</p>"
+    c = Course(title="Bench", lesson_count=lessons)
+    db.session.add(c); db.session.flush()
+    for i in range(1, lessons + 1):
+        l = Lesson(course_id=c.id, index=i, title=f"Leçon {i}")
+        db.session.add(l); db.session.flush()
+        db.session.add_all(Chapter(lesson_id=l.id, index=k, title=f"Chapitre {k}", html_content=html)
+                           for k in range(1, chapters + 1))
+        qz = Quiz(lesson_id=l.id); db.session.add(qz); db.session.flush()
+        for k in range(1, questions + 1):
+            q = Question(quiz_id=qz.id, index=k, text=f"Question {k} ?" * 3)
+            db.session.add(q); db.session.flush()
+            db.session.add_all(AnswerOption(question_id=q.id, text=f"Réponse {m}", is_correct=m == 0)
+                               for m in range(options))
+    db.session.commit()
+    return c.id, l.id
+
+def _best(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lessons", type=int, default=20)
+    ap.add_argument("--chapters", type=int, default=25)
+    ap.add_argument("--questions", type=int, default=40)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "bench.db")
+    from flask.json.provider import DefaultJSONProvider
+    from app import create_app
+    from app.extensions import db
+    from app.domain.models import Course, Lesson
+    from app.serialization import serializers as S
+    from app.services import course_service
+
+    app = create_app()
+    legacy = DefaultJSONProvider(app)
+    with app.app_context():
+        db.create_all()
+        course_id, lesson_id = _seed(db, args.lessons, args.chapters, args.questions)
+
+        def orm_detail():
+            db.session.expunge_all()
+            c = db.session.get(Course, course_id)
+            return S.course_detail(c, c.lessons, [ch for l in c.lessons for ch in l.chapters])
+
+        def orm_quiz():
+            db.session.expunge_all()
+            qz = db.session.get(Lesson, lesson_id).quiz
+            return S.quiz_detail(qz, qz.questions, [op for qu in qz.questions for op in qu.options])
+
+        cases = {
+            "courses.detail": (orm_detail, lambda: S.course_detail(*course_service.get_course_tree_rows(course_id))),
+            "quizzes.by_lesson": (orm_quiz, lambda: S.quiz_detail(*course_service.get_quiz_rows_by_lesson(lesson_id))),
+        }
+        print(f"backend JSON: {type(app.json).__name__}")
+        print(f"{'endpoint':<20}{'chemin':<8}{'charge ms':>11}{'encode ms':>11}{'part %':>8}{'octets':>10}")
+        for name, (before, after) in cases.items():
+            for label, load, provider in (("avant", before, legacy), ("après", after, app.json)):
+                payload = load()
+                t_load = _best(load, args.repeat)
+                t_enc = _best(lambda: provider.response(payload).get_data(), args.repeat)
+                size = len(provider.response(payload).get_data())
+                share = 100 * t_enc / (t_load + t_enc)
+                print(f"{name:<20}{label:<8}{t_load:>11.2f}{t_enc:>11.2f}{share:>8.1f}{size:>10}")
+
+if __name__ == "__main__":
+    main()
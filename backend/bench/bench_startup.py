@@ -0,0 +1,110 @@
+"""
+Coût de démarrage d'un worker.
+
+    python bench/bench_startup.py [--repeat 10]
+
+- à froid : nouvel interpréteur, `import app`, create_app() puis première
+  requête (cas d'un démarrage sans --preload ou d'une montée en charge) ;
+- après fork : maître préchargé comme wsgi.py (create_app + warm_up), puis
+  fork d'un worker jusqu'à sa première réponse (recyclage des workers sous
+  gunicorn --preload), avec ou sans gc.freeze(). Sous Linux, la mémoire privée
+  (Private_Dirty) du worker après un passage du ramasse-miettes est indiquée.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COLD = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+a = app.create_app()
+t2 = time.perf_counter()
+assert a.test_client().get("/api/courses").status_code == 200
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "first_request": t3 - t2,
+                  "modules": len(sys.modules), "builder": "app.scorm.builder" in sys.modules,
+                  "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+def _private_dirty_kb():
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Private_Dirty:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+def _cold(repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", COLD], cwd=ROOT, env=os.environ,
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    med = {k: statistics.median(r[k] for r in runs) for k in ("import", "create_app", "first_request")}
+    print(f"à froid        : import {med['import']*1000:7.1f} ms  create_app {med['create_app']*1000:6.1f} ms  "
+          f"1re requête {med['first_request']*1000:6.1f} ms  total {sum(med.values())*1000:7.1f} ms")
+    print(f"                 {runs[0]['modules']} modules, builder SCORM chargé : {runs[0]['builder']}, "
+          f"maxrss {runs[0]['maxrss_kb'] // 1024} Mo")
+
+def _forked(app, repeat, label):
+    from app.lifecycle import after_fork
+    times, dirty = [], []
+    for _ in range(repeat):
+        r, w = os.pipe()
+        t0 = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            after_fork(app)
+            ok = app.test_client().get("/api/courses").status_code == 200
+            elapsed = time.perf_counter() - t0
+            gc.collect()
+            os.write(w, json.dumps({"t": elapsed if ok else None, "dirty": _private_dirty_kb()}).encode())
+            os._exit(0)
+        os.close(w)
+        with os.fdopen(r) as f:
+            res = json.loads(f.read())
+        os.waitpid(pid, 0)
+        times.append(res["t"]); dirty.append(res["dirty"])
+    line = f"fork {label:9} : 1re réponse {statistics.median(times)*1000:6.1f} ms"
+    if dirty[0] is not None:
+        line += f"  Private_Dirty {statistics.median(dirty) / 1024:5.1f} Mo"
+    print(line)
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--repeat", type=int, default=10)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        from app import create_app
+        from app.extensions import db
+        from app.lifecycle import warm_up
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+        _cold(args.repeat)
+
+        if hasattr(os, "fork"):
+            warm_up(app, freeze=False)
+            _forked(app, args.repeat, "sans gel")
+            gc.freeze()
+            _forked(app, args.repeat, "gc.freeze")
+            gc.unfreeze()
+
+if __name__ == "__main__":
+    main()
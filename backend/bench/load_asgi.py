@@ -0,0 +1,146 @@
+"""
+Tenue en charge du mode ASGI : connexions lentes et rapides mélangées.
+
+    python bench/load_asgi.py [--sse 2000] [--uploads 50] [--gets 500] [--port 5099]
+
+Lance `uvicorn asgi:app` sur une base SQLite temporaire, ouvre `--sse` flux
+d'événements et `--uploads` envois de chapitre volontairement lents (le corps
+arrive par petits morceaux), puis mesure la latence des GET rapides et le
+délai de diffusion d'un événement à tous les abonnés.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def _seed(url):
+    os.environ["DATABASE_URL"] = url
+    from app import create_app
+    from app.extensions import db
+    from app.domain.models import Course, Lesson, Chapter
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        c = Course(title="Charge", lesson_count=3)
+        db.session.add(c); db.session.flush()
+        for i in range(1, 4):
+            l = Lesson(course_id=c.id, index=i, title=f"Leçon {i}")
+            db.session.add(l); db.session.flush()
+            db.session.add_all(Chapter(lesson_id=l.id, index=k, title=f"Chapitre {k}", html_content="<p>x</p>")
+                               for k in range(1, 6))
+        db.session.commit()
+        return c.id, db.session.scalar(db.select(Chapter.id).limit(1))
+
+async def _request(port, method, path, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(body)}\r\n"
+                 f"Content-Type: application/json\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    await reader.read()
+    writer.close()
+    return status
+
+async def _sse_client(port, course_id, ready, received, stop):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /api/courses/{course_id}/events HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    await writer.drain()
+    try:
+        while not stop.is_set():
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b"event: ready"):
+                ready.release()
+            elif line.startswith(b"event: chapter.updated"):
+                received.append(time.perf_counter())
+    finally:
+        writer.close()
+
+async def _slow_upload(port, chapter_id, stop, chunk=64, delay=0.5):
+    body = json.dumps({"html_content": "<p>" + "y" * 4096 + "</p>"}).encode()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"PATCH /api/chapters/{chapter_id} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(body)}\r\n"
+                 f"Content-Type: application/json\r\n\r\n".encode())
+    for i in range(0, len(body), chunk):
+        if stop.is_set():
+            break
+        writer.write(body[i:i + chunk]); await writer.drain()
+        await asyncio.sleep(delay)
+    writer.close()
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+async def _run(args, course_id, chapter_id):
+    stop = asyncio.Event()
+    ready = asyncio.Semaphore(0)
+    received = []
+    slow = [asyncio.create_task(_sse_client(args.port, course_id, ready, received, stop)) for _ in range(args.sse)]
+    for _ in range(args.sse):
+        await asyncio.wait_for(ready.acquire(), 30)
+    slow += [asyncio.create_task(_slow_upload(args.port, chapter_id, stop)) for _ in range(args.uploads)]
+    print(f"{args.sse} flux SSE et {args.uploads} envois lents ouverts")
+
+    paths = ["/api/courses", f"/api/courses/{course_id}", f"/api/chapters/{chapter_id}"]
+    latencies = []
+    for i in range(args.gets):
+        t = time.perf_counter()
+        status = await _request(args.port, "GET", paths[i % len(paths)])
+        latencies.append(time.perf_counter() - t)
+        assert status == 200, status
+    print(f"GET rapides : p50={_pct(latencies, .5):.1f} ms  p99={_pct(latencies, .99):.1f} ms  max={max(latencies)*1000:.1f} ms")
+
+    t = time.perf_counter()
+    status = await _request(args.port, "PATCH", f"/api/chapters/{chapter_id}", b'{"title":"diffuse"}')
+    assert status == 200, status
+    deadline = time.monotonic() + 30
+    while len(received) < args.sse and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    if received:
+        print(f"diffusion : {len(received)}/{args.sse} abonnés, dernier après {(max(received) - t)*1000:.1f} ms")
+
+    stop.set()
+    for task in slow:
+        task.cancel()
+    await asyncio.gather(*slow, return_exceptions=True)
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--sse", type=int, default=2000)
+    p.add_argument("--uploads", type=int, default=50)
+    p.add_argument("--gets", type=int, default=500)
+    p.add_argument("--port", type=int, default=5099)
+    args = p.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, 2 * (args.sse + args.uploads) + 256))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        course_id, chapter_id = _seed(url)
+        env = dict(os.environ, DATABASE_URL=url)
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(args.port),
+                                   "--log-level", "warning", "--backlog", str(args.sse + 256)], cwd=ROOT, env=env)
+        try:
+            for _ in range(100):
+                try:
+                    asyncio.run(_request(args.port, "GET", "/api/stats")); break
+                except OSError:
+                    time.sleep(0.1)
+            asyncio.run(_run(args, course_id, chapter_id))
+        finally:
+            server.terminate(); server.wait()
+
+if __name__ == "__main__":
+    main()
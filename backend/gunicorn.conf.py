@@ -0,0 +1,37 @@
+﻿"""
+Configuration gunicorn : gunicorn -c gunicorn.conf.py wsgi:app
+
+L'application est chargée une fois dans le maître (preload_app) puis partagée
+par les workers ; post_fork remet à zéro ce qui est propre à chaque processus.
+"""
+import os
+
+# plusieurs workers : flux d'événements partagés par la base (app.events.bus),
+# lu par create_app au préchargement, après ce fichier
+os.environ.setdefault("EVENTS_BACKEND", "database")
+
+bind = os.getenv("BIND", "0.0.0.0:5001")
+workers = int(os.getenv("WEB_CONCURRENCY", str(2 * (os.cpu_count() or 1) + 1)))
+# worker_class gthread : un flux SSE occupe un thread (préférer asgi.py s'ils sont nombreux)
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = True
+# recyclage des workers (fuites mémoire) : peu coûteux grâce au préchargement
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+timeout = 60
+graceful_timeout = 30
+
+def on_starting(server):
+    # le backend "memory" ne diffuse qu'aux abonnés de son propre worker : un
+    # éditeur ne verrait pas les modifications traitées par un autre
+    from wsgi import app
+    if server.cfg.workers > 1 and app.config["EVENTS_BACKEND"] == "memory":
+        raise RuntimeError(
+            "EVENTS_BACKEND=memory ne fonctionne qu'avec un seul worker : utiliser "
+            "EVENTS_BACKEND=database (défaut) ou un backend partagé \"module:Classe\", ou WEB_CONCURRENCY=1."
+        )
+
+def post_fork(server, worker):
+    from wsgi import app
+    from app.lifecycle import after_fork
+    after_fork(app)
@@ -0,0 +1,33 @@
+"""chapter html rendition
+
+Revision ID: 3c8c3e694440
+Revises: f08d3baa3964
+Create Date: 2026-10-19 17:51:34.718932
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8c3e694440'
+down_revision = 'f08d3baa3964'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rendus calculés ensuite par `flask content reprocess`
+    op.add_column('chapters', sa.Column('html_rendered', sa.Text(), nullable=True))
+    op.add_column('chapters', sa.Column('html_hash', sa.String(length=64), nullable=True))
+    op.add_column('chapters', sa.Column('pipeline_version', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_chapters_html_hash'), 'chapters', ['html_hash'], unique=False)
+
+
+def downgrade():
+    # pas de batch_alter_table : la recréation de la table déclencherait les
+    # ON DELETE CASCADE sous SQLite (foreign_keys=ON)
+    op.drop_index(op.f('ix_chapters_html_hash'), table_name='chapters')
+    op.drop_column('chapters', 'pipeline_version')
+    op.drop_column('chapters', 'html_hash')
+    op.drop_column('chapters', 'html_rendered')
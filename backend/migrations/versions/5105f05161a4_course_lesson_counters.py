@@ -0,0 +1,66 @@
+"""course and lesson counters
+
+Revision ID: 5105f05161a4
+Revises: dbbe7e156f7e
+Create Date: 2026-10-19 09:12:04.118342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5105f05161a4'
+down_revision = 'dbbe7e156f7e'
+branch_labels = None
+depends_on = None
+
+COUNTERS = ('chapter_count', 'question_count', 'option_count', 'html_bytes')
+
+
+def upgrade():
+    for table in ('courses', 'lessons'):
+        for name in COUNTERS:
+            op.add_column(table, sa.Column(name, sa.Integer(), nullable=False, server_default='0'))
+
+    # backfill depuis les tables existantes
+    courses = sa.table('courses', sa.column('id'), *[sa.column(n) for n in COUNTERS])
+    lessons = sa.table('lessons', sa.column('id'), sa.column('course_id'), *[sa.column(n) for n in COUNTERS])
+    chapters = sa.table('chapters', sa.column('lesson_id'), sa.column('html_content'))
+    quizzes = sa.table('quizzes', sa.column('id'), sa.column('lesson_id'))
+    questions = sa.table('questions', sa.column('id'), sa.column('quiz_id'))
+    options = sa.table('answer_options', sa.column('question_id'))
+
+    def scalar(q):
+        return sa.func.coalesce(q.scalar_subquery(), 0)
+
+    # octets (et non caractères) ; pas de CAST en bytea, qui interprète les antislashs
+    if op.get_context().dialect.name == 'sqlite':
+        html_bytes = sa.func.length(sa.cast(chapters.c.html_content, sa.LargeBinary))
+    else:
+        html_bytes = sa.func.octet_length(chapters.c.html_content)
+
+    op.execute(lessons.update().values(
+        chapter_count=scalar(sa.select(sa.func.count()).where(chapters.c.lesson_id == lessons.c.id)),
+        html_bytes=scalar(sa.select(sa.func.sum(html_bytes))
+                          .where(chapters.c.lesson_id == lessons.c.id)),
+        question_count=scalar(sa.select(sa.func.count())
+                              .select_from(questions.join(quizzes, questions.c.quiz_id == quizzes.c.id))
+                              .where(quizzes.c.lesson_id == lessons.c.id)),
+        option_count=scalar(sa.select(sa.func.count())
+                            .select_from(options.join(questions, options.c.question_id == questions.c.id)
+                                         .join(quizzes, questions.c.quiz_id == quizzes.c.id))
+                            .where(quizzes.c.lesson_id == lessons.c.id)),
+    ))
+    op.execute(courses.update().values(**{
+        n: scalar(sa.select(sa.func.sum(lessons.c[n])).where(lessons.c.course_id == courses.c.id))
+        for n in COUNTERS
+    }))
+
+
+def downgrade():
+    # pas de batch_alter_table : la recréation de `lessons` déclencherait les
+    # ON DELETE CASCADE sous SQLite (foreign_keys=ON)
+    for table in ('lessons', 'courses'):
+        for name in reversed(COUNTERS):
+            op.drop_column(table, name)
@@ -0,0 +1,26 @@
+"""course version
+
+Revision ID: de75c2aecd27
+Revises: 6d7038e782de
+Create Date: 2026-10-19 18:30:58.533266
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'de75c2aecd27'
+down_revision = '6d7038e782de'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('courses', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    # pas de batch_alter_table : la recréation de `courses` déclencherait les
+    # ON DELETE CASCADE sous SQLite (foreign_keys=ON)
+    op.drop_column('courses', 'version')
@@ -0,0 +1,32 @@
+"""question pools
+
+Revision ID: f08d3baa3964
+Revises: 8c6b42001923
+Create Date: 2026-10-19 17:44:58.711495
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f08d3baa3964'
+down_revision = '8c6b42001923'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('questions', sa.Column('tag', sa.String(length=64), nullable=True))
+    op.add_column('quizzes', sa.Column('draw_count', sa.Integer(), nullable=True))
+    op.add_column('quizzes', sa.Column('stratify_by_tag', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('quizzes', sa.Column('shuffle_options', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    # pas de batch_alter_table : la recréation des tables déclencherait les
+    # ON DELETE CASCADE sous SQLite (foreign_keys=ON)
+    op.drop_column('quizzes', 'shuffle_options')
+    op.drop_column('quizzes', 'stratify_by_tag')
+    op.drop_column('quizzes', 'draw_count')
+    op.drop_column('questions', 'tag')
@@ -0,0 +1,40 @@
+﻿import pytest
+
+from app import create_app
+from app.config import Config
+from app.extensions import db
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(Config, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    app = create_app()
+    with app.app_context():
+        db.create_all(bind_key=None)  # les réplicas d'un test précédent restent connus de db.metadatas
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def seed(client):
+    """Crée un cours de `lessons` leçons, chacune avec chapitres, quiz, questions et options ; renvoie son id."""
+    def seed(lessons=2, chapters=2, questions=2, options=3, title="Cours"):
+        course_id = client.post("/api/courses", json={"title": title, "lesson_count": lessons}).get_json()["id"]
+        for lesson in client.get(f"/api/courses/{course_id}").get_json()["lessons"]:
+            for k in range(chapters):
+                client.post("/api/chapters/add", json={"lesson_id": lesson["id"], "title": f"ch{k}",
+                                                       "html_content": f"<p>chapitre {k} é</p>"})
+            if not questions:
+                continue
+            quiz = client.post("/api/quizzes/create-for-lesson", json={"lesson_id": lesson["id"]}).get_json()
+            for k in range(questions):
+                q = client.post("/api/questions/add", json={"quiz_id": quiz["id"], "text": f"q{k}"}).get_json()
+                for m in range(options):
+                    client.post("/api/options/add", json={"question_id": q["id"], "text": f"o{m}", "is_correct": m == 0})
+        return course_id
+    return seed
@@ -0,0 +1,58 @@
+﻿import io
+import os
+import zipfile
+
+from app.domain.models import Course
+from app.extensions import db
+from app.services import archive_service
+
+def _state(client, course_id):
+    d = client.get(f"/api/courses/{course_id}").get_json()
+    out = {"detail": d}
+    for lesson in d["lessons"]:
+        out[f"quiz-{lesson['id']}"] = client.get(f"/api/quizzes/by-lesson/{lesson['id']}").get_json()
+        for ch in lesson["chapters"]:
+            for view in ("", "?view=rendered"):
+                r = client.get(f"/api/chapters/{ch['id']}{view}")
+                out[f"chapter-{ch['id']}{view}"] = (r.get_json(), r.headers["ETag"])
+    z = zipfile.ZipFile(io.BytesIO(client.get(f"/api/export/scorm/{course_id}").data))
+    out["zip"] = {n: z.read(n) for n in z.namelist() if n != "imsmanifest.xml"}
+    return out
+
+def _files(app):
+    directory = app.config["ARCHIVE_DIR"]
+    return [n for n in os.listdir(directory) if n.endswith(".arc")] if os.path.isdir(directory) else []
+
+def test_archived_course_reads_like_the_original(app, client, seed):
+    course_id = seed()
+    before = _state(client, course_id)
+    with app.app_context():
+        assert archive_service.cold_courses(-1) == [course_id]
+        assert archive_service.archive_course(course_id)
+        assert not archive_service.archive_course(course_id)
+    assert len(_files(app)) == 1
+    assert _state(client, course_id) == before
+
+def test_first_write_rehydrates(app, client, seed):
+    course_id = seed()
+    before = _state(client, course_id)
+    with app.app_context():
+        archive_service.archive_course(course_id)
+    lesson = before["detail"]["lessons"][1]
+    question = before[f"quiz-{lesson['id']}"]["questions"][0]
+    assert client.patch(f"/api/questions/{question['id']}", json={"text": "modifiée"}).status_code == 200
+    with app.app_context():
+        assert db.session.get(Course, course_id).archive_file is None
+    assert _files(app) == []
+    after = client.get(f"/api/quizzes/by-lesson/{lesson['id']}").get_json()
+    assert after["questions"][0]["text"] == "modifiée"
+    assert after["questions"][1] == before[f"quiz-{lesson['id']}"]["questions"][1]
+    chapter = lesson["chapters"][0]
+    assert client.get(f"/api/chapters/{chapter['id']}").get_json() == before[f"chapter-{chapter['id']}"][0]
+
+def test_deleting_an_archived_course_removes_its_file(app, client, seed):
+    course_id = seed(1, 1, 1)
+    with app.app_context():
+        archive_service.archive_course(course_id)
+    assert client.delete(f"/api/courses/{course_id}").status_code == 204
+    assert _files(app) == []
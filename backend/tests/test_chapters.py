@@ -0,0 +1,43 @@
+﻿from app.services import revision_service
+
+def _first_chapter(client, course_id):
+    chapter_id = client.get(f"/api/courses/{course_id}").get_json()["lessons"][0]["chapters"][0]["id"]
+    return chapter_id, client.get(f"/api/chapters/{chapter_id}").get_json()
+
+def _stale_head(monkeypatch):
+    # une autre écriture a pris le numéro de révision entre la lecture de la tête et l'INSERT
+    head = revision_service._head
+    monkeypatch.setattr(revision_service, "_head", lambda chapter_id: (head(chapter_id)[0] - 1,) + head(chapter_id)[1:])
+
+def test_delta_patch_applies_on_base_hash(client, seed):
+    chapter_id, ch = _first_chapter(client, seed(1, 1, 0))
+    r = client.patch(f"/api/chapters/{chapter_id}", json={"base_hash": ch["html_hash"], "html_delta": [[0, 0, "<p>A</p>"]]})
+    assert r.status_code == 200 and r.get_json()["html_hash"] != ch["html_hash"]
+    assert client.get(f"/api/chapters/{chapter_id}").get_json()["html_content"] == "<p>A</p>" + ch["html_content"]
+
+def test_delta_patch_on_stale_base_hash_is_a_conflict(client, seed):
+    chapter_id, ch = _first_chapter(client, seed(1, 1, 0))
+    r = client.patch(f"/api/chapters/{chapter_id}", json={"html_content": "<p>autre</p>"})
+    current = r.get_json()["html_hash"]
+    r = client.patch(f"/api/chapters/{chapter_id}", json={"base_hash": ch["html_hash"], "html_delta": [[0, 0, "x"]]})
+    assert r.status_code == 409 and r.get_json()["html_hash"] == current
+    assert client.get(f"/api/chapters/{chapter_id}").get_json()["html_content"] == "<p>autre</p>"
+
+def test_revision_clash_is_a_conflict(client, seed, monkeypatch):
+    chapter_id, ch = _first_chapter(client, seed(1, 1, 0))
+    _stale_head(monkeypatch)
+    r = client.patch(f"/api/chapters/{chapter_id}", json={"base_hash": ch["html_hash"], "html_delta": [[0, 0, "x"]]})
+    assert r.status_code == 409 and r.get_json()["html_hash"] == ch["html_hash"]
+    r = client.patch(f"/api/chapters/{chapter_id}", json={"html_content": "<p>complet</p>"})
+    assert r.status_code == 409
+    assert client.get(f"/api/chapters/{chapter_id}").get_json()["html_content"] == ch["html_content"]
+    monkeypatch.undo()
+    assert client.patch(f"/api/chapters/{chapter_id}", json={"html_content": "<p>complet</p>"}).status_code == 200
+
+def test_chapter_etag_is_shared_by_source_and_rendered_views(client, seed):
+    chapter_id, _ = _first_chapter(client, seed(1, 1, 0))
+    for view in ("", "?view=rendered"):
+        etag = client.get(f"/api/chapters/{chapter_id}{view}").headers["ETag"]
+        assert client.get(f"/api/chapters/{chapter_id}{view}", headers={"If-None-Match": etag}).status_code == 304
+    client.patch(f"/api/chapters/{chapter_id}", json={"html_content": "<p>v2</p>"})
+    assert client.get(f"/api/chapters/{chapter_id}", headers={"If-None-Match": etag}).status_code == 200
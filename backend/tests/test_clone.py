@@ -0,0 +1,57 @@
+﻿from app.domain.models import Course
+from app.extensions import db
+from app.services import archive_service
+
+def _quizzes(client, course_id):
+    lessons = client.get(f"/api/courses/{course_id}").get_json()["lessons"]
+    quizzes = [client.get(f"/api/quizzes/by-lesson/{lesson['id']}").get_json() for lesson in lessons]
+    return [[(q["text"], [(o["text"], o["is_correct"]) for o in q["options"]]) for q in qz["questions"]] for qz in quizzes]
+
+def _chapters(client, course_id):
+    lessons = client.get(f"/api/courses/{course_id}").get_json()["lessons"]
+    return [(ch["title"], client.get(f"/api/chapters/{ch['id']}").get_json()["html_content"])
+            for lesson in lessons for ch in lesson["chapters"]]
+
+def test_clone_copies_the_tree_under_new_ids(client, seed):
+    source = seed()
+    r = client.post(f"/api/courses/{source}/clone", json={})
+    assert r.status_code == 201
+    copy = r.get_json()["id"]
+    a, b = client.get(f"/api/courses/{source}").get_json(), client.get(f"/api/courses/{copy}").get_json()
+    assert b["title"] == "Cours (copie)"
+    assert not {l["id"] for l in a["lessons"]} & {l["id"] for l in b["lessons"]}
+    for lesson in b["lessons"]:
+        for ch in lesson["chapters"]:
+            assert client.get(f"/api/chapters/{ch['id']}").get_json()["lesson_id"] == lesson["id"]
+    assert _chapters(client, copy) == _chapters(client, source)
+    assert _quizzes(client, copy) == _quizzes(client, source)
+    # les ids suivants restent libres
+    assert client.post("/api/courses", json={"title": "N"}).get_json()["id"] == copy + 1
+
+def test_clone_title(client, seed):
+    source = seed(1, 1, 0)
+    r = client.post(f"/api/courses/{source}/clone", json={"title": " Nouveau "})
+    assert client.get(f"/api/courses/{r.get_json()['id']}").get_json()["title"] == "Nouveau"
+    for bad in (["x"], 3, {"a": 1}):
+        assert client.post(f"/api/courses/{source}/clone", json={"title": bad}).status_code == 400
+    assert client.post(f"/api/courses/{source}/clone", json={"title": "  "}).status_code == 400
+    assert client.post("/api/courses/999/clone").status_code == 404
+
+def test_clone_of_an_archived_course_leaves_it_archived(app, client, seed):
+    source = seed()
+    chapters, quizzes = _chapters(client, source), _quizzes(client, source)
+    with app.app_context():
+        assert archive_service.archive_course(source)
+    copy = client.post(f"/api/courses/{source}/clone", json={"title": "Copie"}).get_json()["id"]
+    with app.app_context():
+        assert db.session.get(Course, source).archive_file
+        assert db.session.get(Course, copy).archive_file is None
+    assert _chapters(client, copy) == chapters and _quizzes(client, copy) == quizzes
+    # la réhydratation de la source retrouve ses ids
+    lesson = client.get(f"/api/courses/{source}").get_json()["lessons"][0]
+    quiz_id = client.get(f"/api/quizzes/by-lesson/{lesson['id']}").get_json()["id"]
+    assert client.patch(f"/api/chapters/{lesson['chapters'][0]['id']}", json={"title": "t"}).status_code == 200
+    with app.app_context():
+        assert db.session.get(Course, source).archive_file is None
+    assert client.get(f"/api/quizzes/by-lesson/{lesson['id']}").get_json()["id"] == quiz_id
+    assert _quizzes(client, source) == quizzes
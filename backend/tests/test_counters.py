@@ -0,0 +1,42 @@
+﻿from app.domain.models import Course
+from app.extensions import db
+
+COUNTERS = ("chapter_count", "question_count", "option_count", "html_bytes")
+
+def _assert_counters(app, client):
+    totals = dict.fromkeys(COUNTERS, 0)
+    with app.app_context():
+        for course in db.session.scalars(db.select(Course)):
+            chapters = [ch for l in course.lessons for ch in l.chapters]
+            questions = [q for l in course.lessons if l.quiz for q in l.quiz.questions]
+            real = {"chapter_count": len(chapters), "question_count": len(questions),
+                    "option_count": sum(len(q.options) for q in questions),
+                    "html_bytes": sum(len(ch.html_content.encode()) for ch in chapters)}
+            assert {k: getattr(course, k) for k in COUNTERS} == real
+            assert {k: sum(getattr(l, k) for l in course.lessons) for k in COUNTERS} == real
+            for k in COUNTERS:
+                totals[k] += real[k]
+    stats = client.get("/api/stats").get_json()
+    assert {k: stats[k] for k in COUNTERS} == totals
+
+def test_counters_follow_writes(app, client, seed):
+    course_id = seed()
+    seed(1)
+    _assert_counters(app, client)
+    lessons = client.get(f"/api/courses/{course_id}").get_json()["lessons"]
+    chapter_id = lessons[0]["chapters"][0]["id"]
+    client.patch(f"/api/chapters/{chapter_id}", json={"html_content": "<p>ééé plus long</p>"})
+    _assert_counters(app, client)
+    ch = client.get(f"/api/chapters/{chapter_id}").get_json()
+    client.patch(f"/api/chapters/{chapter_id}", json={"base_hash": ch["html_hash"], "html_delta": [[0, 0, "<p>à</p>"]]})
+    _assert_counters(app, client)
+    client.delete(f"/api/chapters/{lessons[0]['chapters'][1]['id']}")
+    _assert_counters(app, client)
+    quiz = client.get(f"/api/quizzes/by-lesson/{lessons[1]['id']}").get_json()
+    client.delete(f"/api/options/{quiz['questions'][0]['options'][0]['id']}")
+    client.delete(f"/api/questions/{quiz['questions'][1]['id']}")
+    _assert_counters(app, client)
+    client.post(f"/api/courses/{course_id}/clone")
+    _assert_counters(app, client)
+    client.delete(f"/api/courses/{course_id}")
+    _assert_counters(app, client)
@@ -0,0 +1,58 @@
+﻿import io
+import zipfile
+
+from app import create_app
+
+def test_reused_course_id_does_not_serve_the_deleted_tree(client):
+    first = client.post("/api/courses", json={"title": "Cours A", "lesson_count": 2}).get_json()["id"]
+    assert client.get(f"/api/courses/{first}").get_json()["title"] == "Cours A"
+    assert client.delete(f"/api/courses/{first}").status_code == 204
+    second = client.post("/api/courses", json={"title": "Cours B", "lesson_count": 1}).get_json()["id"]
+    assert second == first  # SQLite reprend le plus grand id libéré
+    d = client.get(f"/api/courses/{second}").get_json()
+    assert d["title"] == "Cours B" and len(d["lessons"]) == 1
+
+def test_reused_id_is_detected_without_eviction(app, client):
+    # suppression par un autre processus : le cache local n'a rien vu
+    first = client.post("/api/courses", json={"title": "Cours A", "lesson_count": 1}).get_json()["id"]
+    client.get(f"/api/courses/{first}")
+    other = create_app().test_client()
+    assert other.delete(f"/api/courses/{first}").status_code == 204
+    assert other.post("/api/courses", json={"title": "Cours B", "lesson_count": 1}).get_json()["id"] == first
+    assert client.get(f"/api/courses/{first}").get_json()["title"] == "Cours B"
+
+def test_deletes_discard_snapshots_after_commit(app, client, seed):
+    a, b, c = seed(1, 1, 0), seed(1, 1, 0), seed(1, 1, 0)
+    for course_id in (a, b, c):
+        client.get(f"/api/courses/{course_id}")
+    cache = app.extensions["course_tree_cache"]
+    client.delete(f"/api/courses/{a}")
+    client.post("/api/courses/bulk-delete", json={"ids": [b, 999]})
+    assert set(cache._items) == {c}
+
+def test_writes_from_another_process_invalidate(client, seed):
+    course_id = seed(1, 1, 1)
+    lesson_id = client.get(f"/api/courses/{course_id}").get_json()["lessons"][0]["id"]
+    client.get(f"/api/quizzes/by-lesson/{lesson_id}")
+    other = create_app().test_client()
+    assert other.patch(f"/api/courses/{course_id}", json={"title": "Renommé"}).status_code == 200
+    assert client.get(f"/api/courses/{course_id}").get_json()["title"] == "Renommé"
+    question = client.get(f"/api/quizzes/by-lesson/{lesson_id}").get_json()["questions"][0]
+    other.patch(f"/api/questions/{question['id']}", json={"text": "autre"})
+    assert client.get(f"/api/quizzes/by-lesson/{lesson_id}").get_json()["questions"][0]["text"] == "autre"
+
+def test_lazy_loads_are_counted_and_evicted(app, client, seed):
+    a, b = seed(2, 3, 1), seed(2, 3, 1)
+    cache = app.extensions["course_tree_cache"]
+    for course_id in (a, b):
+        client.get(f"/api/courses/{course_id}")
+    before = cache._nbytes
+    z = zipfile.ZipFile(io.BytesIO(client.get(f"/api/export/scorm/{a}").data))
+    assert any(b"chapitre 0" in z.read(n) for n in z.namelist())
+    assert cache._nbytes > before
+    assert cache._nbytes == sum(s.nbytes for s in cache._items.values())
+    # l'export a servi a en dernier : b, le moins récent, est évincé dès que la limite est dépassée
+    cache.max_bytes = cache._items[a].nbytes + 1
+    cache._items[a].grow(0)
+    assert list(cache._items) == [a]
+    assert cache._nbytes == cache._items[a].nbytes
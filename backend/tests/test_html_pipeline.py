@@ -0,0 +1,79 @@
+﻿import pytest
+
+from app.content.html_pipeline import render
+
+@pytest.mark.parametrize("href", [
+    "javascript:alert(1)",
+    " JavaScript:alert(1)",
+    "JAVASCRIPT:alert(1)",
+    "jav&#x09;ascript:alert(1)",
+    "jav&#9;ascript:alert(1)",
+    "java\nscript:alert(1)",
+    "java&#x0A;script:alert(1)",
+    "java\rscript:alert(1)",
+    "java\x00script:alert(1)",
+    "&#x01;javascript:alert(1)",
+    "vbscript:msgbox(1)",
+    "data:text/html,<script>alert(1)</script>",
+])
+def test_unsafe_href_is_removed(href):
+    assert render(f'<a href="{href}">lien</a>') == "lien"
+
+@pytest.mark.parametrize("html, expected", [
+    ('<a href="/cours/1">r</a>', '<a href="/cours/1">r</a>'),
+    ('<a href="#s2">r</a>', '<a href="#s2">r</a>'),
+    ('<a href="mailto:a@b.fr">r</a>', '<a href="mailto:a@b.fr">r</a>'),
+    ('<a href="https://e.org/a\tb">r</a>', '<a href="https://e.org/ab" target="_blank" rel="noopener noreferrer">r</a>'),
+])
+def test_safe_href_is_kept(html, expected):
+    assert render(html) == expected
+
+def test_external_link_target_is_forced():
+    out = render('<a href="http://e.org" target="_self" rel="opener">r</a>')
+    assert out == '<a href="http://e.org" target="_blank" rel="noopener noreferrer">r</a>'
+
+def test_data_url_only_for_images():
+    assert render('<img src="data:image/png;base64,AAA">') == '<img src="data:image/png;base64,AAA" alt="">'
+    assert render('<img src="data:text/html,x">') == '<img alt="">'
+    assert render('<video src="data:image/png;base64,AAA"></video>') == "<video></video>"
+
+@pytest.mark.parametrize("html, expected", [
+    ('<p onclick="alert(1)" onmouseover="x">t</p>', "<p>t</p>"),
+    ('<p style="color: red; background: url(javascript:x)">t</p>', '<p style="color: red">t</p>'),
+    ('<p style="width: expression(alert(1))">t</p>', "<p>t</p>"),
+    ('<p class="MsoNormal note">t</p>', '<p class="note">t</p>'),
+    ('<img src="/a.png" onerror="alert(1)">', '<img src="/a.png" alt="">'),
+    ('<p ONCLICK="alert(1)" Style="COLOR: red">t</p>', '<p style="color: red">t</p>'),
+    ('<img src="/a.png" srcset="javascript:alert(1) 1x">', '<img src="/a.png" alt="">'),
+    ('<a href="/a" xlink:href="javascript:alert(1)">r</a>', '<a href="/a">r</a>'),
+    ('<video src="/v.mp4" poster="javascript:alert(1)"></video>', '<video src="/v.mp4"></video>'),
+    ('<p data-x="1" id="i">t</p>', "<p>t</p>"),
+])
+def test_unsafe_attributes_are_removed(html, expected):
+    assert render(html) == expected
+
+def test_dropped_elements_lose_their_content():
+    assert render("<p>a<script>alert(1)</script><style>p{}</style>b</p>") == "<p>ab</p>"
+
+@pytest.mark.parametrize("html, expected", [
+    ("<div><p>a<script>alert(1)</div><p>suite</p>", "<div><p>a</p></div><p>suite</p>"),
+    ("<p>a<style>p{}</p><p>suite</p>", "<p>a</p><p>suite</p>"),
+    ("<p>a<svg><svg></svg>b</p><p>suite</p>", "<p>a</p><p>suite</p>"),
+    ("<p>a</p><script>alert(1)", "<p>a</p>"),
+])
+def test_unclosed_dropped_element_ends_with_its_parent(html, expected):
+    assert render(html) == expected
+
+def test_form_is_unwrapped():
+    html = '<form action="/x"><p>Nom <input name="n"></p><button>OK</button></form><p>fin</p>'
+    assert render(html) == "<p>Nom</p><p>fin</p>"
+
+def test_word_markup_is_normalized():
+    html = '<p class="MsoNormal"><span style="mso-bidi-font-family:x"><b>gras</b></span> <i>it</i></p>'
+    assert render(html) == "<p><strong>gras</strong> <em>it</em></p>"
+
+def test_render_is_idempotent():
+    html = ('<h2 onclick="x">T</h2><p class="MsoNormal">a <a href="https://e.org">lien</a>'
+            '<img src="data:image/png;base64,AAA"></p><ul><li><b>un</b></li></ul>')
+    out = render(html)
+    assert render(out) == out
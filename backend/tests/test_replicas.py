@@ -0,0 +1,74 @@
+﻿import collections
+import sqlite3
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from app.config import Config
+from app.extensions import db
+
+@pytest.fixture
+def replicated(tmp_path, monkeypatch, app, seed):
+    """(app, client, course_id, hits) avec deux réplicas SQLite copiés du primaire, titres "R1" et "R2"."""
+    binds = {f"replica{i}": {"url": f"sqlite:///{tmp_path / f'r{i}.db'}"} for i in (1, 2)}
+    seed(1, 2, 1)
+    monkeypatch.setattr(Config, "SQLALCHEMY_BINDS", binds)
+    monkeypatch.setattr(Config, "DB_READ_BINDS", tuple(binds))
+    replicated = create_app()
+    assert replicated.test_cli_runner().invoke(args=["replicas", "sync"]).exit_code == 0
+    for i in (1, 2):
+        con = sqlite3.connect(tmp_path / f"r{i}.db")
+        con.execute("UPDATE courses SET title = ?", (f"R{i}",))
+        con.commit()
+        con.close()
+    hits = collections.Counter()
+    with replicated.app_context():
+        for key, engine in db.engines.items():
+            event.listen(engine, "before_cursor_execute", lambda *a, key=key, **kw: hits.update([key]))
+    yield replicated, replicated.test_client(), 1, hits
+    with replicated.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+def test_reads_are_spread_over_replicas(replicated):
+    _, client, _, _ = replicated
+    titles = {client.get("/api/courses").get_json()[0]["title"] for _ in range(4)}
+    assert titles == {"R1", "R2"}
+
+def test_snapshot_checks_its_version_on_the_primary(replicated):
+    app, client, course_id, hits = replicated
+    assert client.get(f"/api/courses/{course_id}").get_json()["title"] in ("R1", "R2")
+    assert hits[None] == 1 and len(hits) == 2
+    # réplicas en retard : le primaire a une version plus récente
+    app.extensions["course_tree_cache"].clear()
+    with app.app_context():
+        db.session.execute(db.text("UPDATE courses SET version = version + 1"))
+        db.session.commit()
+    assert client.get(f"/api/courses/{course_id}").get_json()["title"] == "Cours"
+
+def test_writes_pin_the_client_to_the_primary(replicated):
+    _, client, course_id, _ = replicated
+    r = client.patch(f"/api/courses/{course_id}", json={"title": "P2"})
+    assert "db_primary=1" in r.headers["Set-Cookie"]
+    assert client.get("/api/courses").get_json()[0]["title"] == "P2"
+    client.delete_cookie("db_primary")
+    assert client.get("/api/courses").get_json()[0]["title"] in ("R1", "R2")
+    r = client.post("/api/chapters/add", json={"lesson_id": 999, "title": "x"})
+    assert r.status_code == 400 and "Set-Cookie" not in r.headers
+
+def test_editor_source_falls_back_to_the_primary(replicated):
+    app, client, _, hits = replicated
+    with app.app_context():
+        chapter_id = db.session.scalar(db.text("SELECT min(id) FROM chapters"))
+    hits.clear()
+    client.get(f"/api/chapters/{chapter_id}")
+    assert hits[None] == 1 and len(hits) == 2
+    with app.app_context():
+        db.session.execute(db.text("UPDATE chapters SET html_content = '<p>new</p>', updated_at = '2030-01-01 00:00:00' "
+                                   "WHERE id = :id"), {"id": chapter_id})
+        db.session.commit()
+    assert client.get(f"/api/chapters/{chapter_id}").get_json()["html_content"] == "<p>new</p>"
+    hits.clear()
+    client.get(f"/api/chapters/{chapter_id}?view=rendered")
+    assert None not in hits
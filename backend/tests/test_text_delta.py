@@ -0,0 +1,89 @@
+﻿import random
+
+import pytest
+
+from app.services import text_delta
+
+HTML = "<h2>Titre</h2>\n<p>Premier <strong>paragraphe</strong> é.</p>\n<ul><li>un</li><li>deux</li></ul>\n"
+
+@pytest.mark.parametrize("new", [
+    HTML,
+    "",
+    HTML.replace("Premier", "Second"),
+    HTML.replace("<li>deux</li>", ""),
+    "<p>début</p>\n" + HTML + "<p>fin</p>",
+    HTML.replace("é", "\U0001f600"),
+])
+def test_compute_apply_round_trip(new):
+    ops = text_delta.compute(HTML, new)
+    assert text_delta.apply(HTML, ops) == new
+    assert (ops == []) == (new == HTML)
+
+def test_compute_keeps_local_edits_small():
+    new = HTML.replace("paragraphe", "bloc")
+    assert text_delta.compute(HTML, new) == [[HTML.index("paragraphe"), HTML.index("paragraphe") + 10, "bloc"]]
+
+def test_compute_apply_random_edits():
+    rnd = random.Random(44)
+    pieces = ["<p>", "</p>", " ", "\n", "mot", "é", "<br>", "\U0001f600", "a"]
+    for _ in range(300):
+        old = "".join(rnd.choice(pieces) for _ in range(rnd.randrange(30)))
+        new = "".join(rnd.choice(pieces) for _ in range(rnd.randrange(30)))
+        assert text_delta.apply(old, text_delta.compute(old, new)) == new
+
+@pytest.mark.parametrize("ops", [
+    [[0, 99, "x"]],
+    [[5, 2, "x"]],
+    [[4, 6, "x"], [2, 3, "y"]],
+    [[0, 1]],
+    [["0", 1, "x"]],
+    ["abc"],
+])
+def test_apply_rejects_invalid_ops(ops):
+    with pytest.raises(ValueError):
+        text_delta.apply("abcdefgh", ops)
+
+def test_from_unified_git_diff():
+    old = "a\nb\nc\nd\ne\nf\ng\nh\n"
+    diff = ("diff --git a/x b/x\n--- a/x\n+++ b/x\n"
+            "@@ -1,2 +1,2 @@\n-a\n+A\n b\n"
+            "@@ -7,0 +8 @@ f\n+G\n")
+    assert text_delta.apply(old, text_delta.from_unified(old, diff)) == "A\nb\nc\nd\ne\nf\ng\nG\nh\n"
+
+def test_from_unified_no_newline_markers():
+    diff = "--- a\n+++ b\n@@ -1,2 +1,2 @@\n x\n-y\n\\ No newline at end of file\n+z\n"
+    assert text_delta.apply("x\ny", text_delta.from_unified("x\ny", diff)) == "x\nz\n"
+
+@pytest.mark.parametrize("diff", [
+    "@@ -1 +1 @@\n-autre\n+b\n",          # contexte différent
+    "@@ -5 +5 @@\n-a\n+b\n",              # hors limites
+    "@@ -2 +2 @@\n-b\n+B\n@@ -1 +1 @@\n-a\n+A\n",  # blocs non ordonnés
+    "@@ -1,2 +1,2 @@\n-a\n+A\n",           # tronqué
+    "@@ -1 +1 @@\n?a\n",
+    "pas un diff\n@@ x @@\n",
+])
+def test_from_unified_rejects_mismatch(diff):
+    with pytest.raises(ValueError):
+        text_delta.from_unified("a\nb\n", diff)
+
+def test_pack_round_trip():
+    ops = text_delta.compute(HTML, HTML.replace("un", "\U0001f600"))
+    assert text_delta.unpack_ops(text_delta.pack_ops(ops)) == ops
+    assert text_delta.unpack_text(text_delta.pack_text(HTML)) == HTML
+
+@pytest.mark.parametrize("old, new", [
+    ("<p>a</p>\n<p>b</p>", "<p>a</p>\n<p>c</p>"),
+    ("<p>a</p>\n<p>b</p>\n", "<p>a</p>\n<p>c</p>"),
+    ("<p>a</p>\n<p>b</p>", "<p>a</p>\n<p>b</p>\n"),
+    ("", "<p>a</p>"),
+    ("<p>a</p>", ""),
+    ("a\r\nb\rc\u2028d", "a\r\nB\rc\u2028d"),
+    ("".join(f"<p>{i}</p>\n" for i in range(40)), "".join(f"<p>{i * 2}</p>\n" for i in range(40)) + "fin"),
+])
+def test_to_unified_round_trips(old, new):
+    diff = text_delta.to_unified(old, new, "a", "b")
+    assert text_delta.apply(old, text_delta.from_unified(old, diff)) == new
+
+def test_to_unified_marks_missing_final_newline():
+    diff = text_delta.to_unified("x\ny", "x\nz")
+    assert diff.endswith("-y\n\\ No newline at end of file\n+z\n\\ No newline at end of file\n")
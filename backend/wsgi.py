@@ -0,0 +1,9 @@
+﻿"""
+Point d'entrée WSGI de production :
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+from app.lifecycle import warm_up
+
+app = create_app()
+warm_up(app)
@@ -2,6 +2,7 @@
 
 export type Course = {
   id: number; title: string; lesson_count: number; has_certification: boolean;
+  chapter_count: number; question_count: number; option_count: number; html_bytes: number;
   created_at: string; updated_at: string;
 };
 
@@ -9,12 +10,16 @@ export type CourseDetail = Course & {
   lessons: { id: number; index: number; title: string; chapters: { id: number; index: number; title: string }[] }[];
 };
 
-export type QuizDTO = {
+export type QuizQuestion = { id: number; index: number; text: string; type: "single"|"multiple"; tag: string|null;
+  options: { id: number; text: string; is_correct: boolean }[];
+};
+
+export type QuizSettings = { draw_count: number|null; stratify_by_tag: boolean; shuffle_options: boolean };
+
+export type QuizDTO = ({
   id: number; lesson_id: number; title: string;
-  questions: { id: number; index: number; text: string; type: "single"|"multiple";
-    options: { id: number; text: string; is_correct: boolean }[];
-  }[];
-} | { quiz: null };
+  questions: QuizQuestion[];
+} & QuizSettings) | { quiz: null };
 
 export async function listCourses(){ const r=await fetch(`${API}/api/courses`); if(!r.ok) throw new Error("Failed"); return r.json(); }
 export async function createCourse(input:{title:string;lesson_count:number;has_certification:boolean}){ const r=await fetch(`${API}/api/courses`,{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify(input)}); if(!r.ok) throw new Error("Failed"); return r.json(); }
@@ -23,17 +28,44 @@ export async function deleteCourse(id:number){ const r=await fetch(`${API}/api/c
 
 export async function getCourseDetail(id:number){ const r=await fetch(`${API}/api/courses/${id}`); if(!r.ok) throw new Error("Not found"); return r.json(); }
 
+export const COURSE_EVENT_TYPES = ["ready","reset","course.updated","course.deleted","lesson.updated","chapter.added","chapter.updated","chapter.deleted","quiz.created","quiz.updated","question.added","question.updated","question.deleted","option.added","option.updated","option.deleted"] as const;
+export type CourseEventType = typeof COURSE_EVENT_TYPES[number];
+// Flux SSE des modifications du cours ; EventSource renvoie Last-Event-ID à la reconnexion. "reset" => tout recharger.
+export function subscribeCourseEvents(id:number, onEvent:(type:CourseEventType, data:any)=>void){ const es=new EventSource(`${API}/api/courses/${id}/events`); COURSE_EVENT_TYPES.forEach(t=>es.addEventListener(t,(e)=>onEvent(t, JSON.parse((e as MessageEvent).data)))); return ()=>es.close(); }
+
 export async function addChapter(input:{lesson_id:number;title:string;html_content:string}){ const r=await fetch(`${API}/api/chapters/add`,{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify(input)}); if(!r.ok) throw new Error("Failed"); return r.json(); }
-export async function getChapter(id:number){ const r=await fetch(`${API}/api/chapters/${id}`); if(!r.ok) throw new Error("Not found"); return r.json() as Promise<{id:number;lesson_id:number;index:number;title:string;html_content:string}>; }
-export async function updateChapter(id:number, patch:Partial<{title:string;html_content:string}>){ const r=await fetch(`${API}/api/chapters/${id}`,{method:"PATCH",headers:{"Content-Type":"application/json"},body:JSON.stringify(patch)}); if(!r.ok) throw new Error("Failed"); return r.json(); }
+export async function getChapter(id:number){ const r=await fetch(`${API}/api/chapters/${id}`); if(!r.ok) throw new Error("Not found"); return r.json() as Promise<{id:number;lesson_id:number;index:number;title:string;html_content:string;html_hash:string|null}>; }
+export async function getRenderedChapter(id:number){ const r=await fetch(`${API}/api/chapters/${id}?view=rendered`); if(!r.ok) throw new Error("Not found"); return r.json() as Promise<{id:number;lesson_id:number;index:number;title:string;html_rendered:string}>; }
+export async function updateChapter(id:number, patch:Partial<{title:string;html_content:string}>){ const r=await fetch(`${API}/api/chapters/${id}`,{method:"PATCH",headers:{"Content-Type":"application/json"},body:JSON.stringify(patch)}); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<{id:number;title:string;html_hash:string|null}>; }
+// Delta envoyé à la place du HTML complet : un remplacement [début, fin, texte] entre préfixe et suffixe communs, indices en points de code (comme côté serveur).
+function codePoints(s:string){ let n=s.length; for (let i=1;i<s.length;i++){ const c=s.charCodeAt(i), h=s.charCodeAt(i-1); if (c>=0xdc00 && c<=0xdfff && h>=0xd800 && h<=0xdbff) n--; } return n; }
+export function spliceDelta(base:string, next:string): [number, number, string][] {
+  if (base===next) return [];
+  let p=0; const max=Math.min(base.length, next.length);
+  while (p<max && base.charCodeAt(p)===next.charCodeAt(p)) p++;
+  if (p>0 && base.charCodeAt(p-1)>=0xd800 && base.charCodeAt(p-1)<=0xdbff) p--;
+  let s=0; while (s<max-p && base.charCodeAt(base.length-1-s)===next.charCodeAt(next.length-1-s)) s++;
+  if (s>0 && base.charCodeAt(base.length-s)>=0xdc00 && base.charCodeAt(base.length-s)<=0xdfff) s--;
+  const start=codePoints(base.slice(0,p));
+  return [[start, start+codePoints(base.slice(p, base.length-s)), next.slice(p, next.length-s)]];
+}
+export class ChapterConflict extends Error { html_hash:string; constructor(html_hash:string){ super("Chapitre modifié entre-temps"); this.html_hash=html_hash; } }
+export async function patchChapterHtml(id:number, base:{html:string;hash:string}, html:string, title?:string){ const r=await fetch(`${API}/api/chapters/${id}`,{method:"PATCH",headers:{"Content-Type":"application/json"},body:JSON.stringify({title, base_hash:base.hash, html_delta:spliceDelta(base.html, html)})}); if(r.status===409) throw new ChapterConflict((await r.json()).html_hash); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<{id:number;title:string;html_hash:string}>; }
 export async function deleteChapter(id:number){ const r=await fetch(`${API}/api/chapters/${id}`,{method:"DELETE"}); if(!r.ok && r.status!==204) throw new Error("Failed"); }
+export type ChapterRevision = {rev:number;kind:"snapshot"|"delta";title:string;size:number;created_at:string};
+export async function listChapterRevisions(id:number, before?:number){ const q=before?`?before=${before}`:""; const r=await fetch(`${API}/api/chapters/${id}/revisions${q}`); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<{revisions:ChapterRevision[]; next_before:number|null}>; }
+export async function getChapterRevision(id:number, rev:number){ const r=await fetch(`${API}/api/chapters/${id}/revisions/${rev}`); if(!r.ok) throw new Error("Not found"); return r.json() as Promise<ChapterRevision & {html_content:string}>; }
+export async function diffChapterRevisions(id:number, rev:number, to?:number){ const q=to?`?to=${to}`:""; const r=await fetch(`${API}/api/chapters/${id}/revisions/${rev}/diff${q}`); if(!r.ok) throw new Error("Not found"); return r.json() as Promise<{from:number;to:number;format:string;diff:string}>; }
+export async function restoreChapterRevision(id:number, rev:number){ const r=await fetch(`${API}/api/chapters/${id}/revisions/${rev}/restore`,{method:"POST"}); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<{id:number;title:string;rev:number}>; }
 export async function updateLesson(id:number, patch:Partial<{title:string}>){ const r=await fetch(`${API}/api/lessons/${id}`,{method:"PATCH",headers:{"Content-Type":"application/json"},body:JSON.stringify(patch)}); if(!r.ok) throw new Error("Failed to update lesson"); return r.json(); }
 
 export async function createQuizForLesson(lesson_id:number, title="Quiz"){ const r=await fetch(`${API}/api/quizzes/create-for-lesson`,{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({lesson_id, title})}); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<{id:number; lesson_id:number; title:string}>; }
 export async function getQuizByLesson(lesson_id:number){ const r=await fetch(`${API}/api/quizzes/by-lesson/${lesson_id}`); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<QuizDTO>; }
+export async function updateQuiz(id:number, patch:Partial<{title:string} & QuizSettings>){ const r=await fetch(`${API}/api/quizzes/${id}`,{method:"PATCH",headers:{"Content-Type":"application/json"},body:JSON.stringify(patch)}); if(!r.ok) throw new Error("Failed"); return r.json(); }
+export async function drawQuiz(lesson_id:number, opts:{count?:number; seed?:number}={}){ const q=new URLSearchParams(); if(opts.count) q.set("count",String(opts.count)); if(opts.seed!==undefined) q.set("seed",String(opts.seed)); const r=await fetch(`${API}/api/quizzes/by-lesson/${lesson_id}/draw?${q}`); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<{id:number; lesson_id:number; title:string; seed:number; questions:QuizQuestion[]} & QuizSettings>; }
 
-export async function addQuestion(quiz_id:number, text:string, type:"single"|"multiple"="single"){ const r=await fetch(`${API}/api/questions/add`,{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({quiz_id, text, type})}); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<{id:number}>; }
-export async function updateQuestion(id:number, patch:Partial<{text:string; type:"single"|"multiple"}>){ const r=await fetch(`${API}/api/questions/${id}`,{method:"PATCH",headers:{"Content-Type":"application/json"},body:JSON.stringify(patch)}); if(!r.ok) throw new Error("Failed"); return r.json(); }
+export async function addQuestion(quiz_id:number, text:string, type:"single"|"multiple"="single", tag?:string){ const r=await fetch(`${API}/api/questions/add`,{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({quiz_id, text, type, tag})}); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<{id:number}>; }
+export async function updateQuestion(id:number, patch:Partial<{text:string; type:"single"|"multiple"; tag:string}>){ const r=await fetch(`${API}/api/questions/${id}`,{method:"PATCH",headers:{"Content-Type":"application/json"},body:JSON.stringify(patch)}); if(!r.ok) throw new Error("Failed"); return r.json(); }
 export async function deleteQuestion(id:number){ const r=await fetch(`${API}/api/questions/${id}`,{method:"DELETE"}); if(!r.ok && r.status!==204) throw new Error("Failed"); }
 
 export async function addOption(question_id:number, text:string, is_correct=false){ const r=await fetch(`${API}/api/options/add`,{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({question_id, text, is_correct})}); if(!r.ok) throw new Error("Failed"); return r.json() as Promise<{id:number}>; }
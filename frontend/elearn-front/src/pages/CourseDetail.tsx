@@ -2,7 +2,7 @@
 import { Link, useParams } from "react-router-dom";
 import type { CourseDetail as CourseDetailT, QuizDTO } from "../api";
 import {
-  getCourseDetail, addChapter, deleteChapter, updateChapter, getChapter, updateLesson,
+  getCourseDetail, addChapter, deleteChapter, updateChapter, getChapter, updateLesson, patchChapterHtml, ChapterConflict,
   createQuizForLesson, getQuizByLesson, addQuestion, updateQuestion, deleteQuestion,
   addOption, updateOption, deleteOption
 } from "../api";
@@ -20,6 +20,7 @@ export default function CourseDetailPage() {
   const [editingChapterId, setEditingChapterId] = useState<number | null>(null);
   const [editChapterTitle, setEditChapterTitle] = useState("");
   const [editContent, setEditContent] = useState("");
+  const [editBase, setEditBase] = useState<{html:string; hash:string|null} | null>(null); // HTML chargé : base des deltas
 
   // Leçons (édition titre)
   const [editingLessonId, setEditingLessonId] = useState<number | null>(null);
@@ -94,6 +95,7 @@ export default function CourseDetailPage() {
       setEditingChapterId(ch.id);
       setEditChapterTitle(ch.title);
       setEditContent(ch.html_content || "");
+      setEditBase({ html: ch.html_content || "", hash: ch.html_hash });
     } catch (e:any) {
       alert("Impossible de charger le chapitre : " + (e.message || "inconnue"));
     }
@@ -101,7 +103,15 @@ export default function CourseDetailPage() {
 
   async function saveEditChapter(cid: number) {
     if (!editChapterTitle.trim()) { alert("Titre requis"); return; }
-    await updateChapter(cid, { title: editChapterTitle.trim(), html_content: editContent });
+    const title = editChapterTitle.trim();
+    try {
+      if (editBase && editContent === editBase.html) await updateChapter(cid, { title });
+      else if (editBase?.hash) await patchChapterHtml(cid, { html: editBase.html, hash: editBase.hash }, editContent, title);
+      else await updateChapter(cid, { title, html_content: editContent });
+    } catch (e:any) {
+      if (e instanceof ChapterConflict) { alert("Chapitre modifié entre-temps : rechargez-le avant d'enregistrer."); return; }
+      throw e;
+    }
     setEditingChapterId(null);
     await load();
   }
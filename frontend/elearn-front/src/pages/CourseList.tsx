@@ -107,6 +107,14 @@ export default function CourseList() {
                     <div style={{display:"flex", gap:8}}>
                       <button onClick={()=>startEdit(c)}>Éditer</button>
                       <Link to={`/courses/${c.id}`}>Détail →</Link>
+                      <a
+                        href={`http://127.0.0.1:5001/api/preview/${c.id}/`}
+                        target="_blank"
+                        rel="noreferrer"
+                        title="Pages du package SCORM, sans export"
+                      >
+                        Prévisualiser
+                      </a>
                       <a
                         href={`http://127.0.0.1:5001/api/export/scorm/${c.id}`}
                         target="_blank"
@@ -114,6 +122,14 @@ export default function CourseList() {
                       >
                         Exporter SCORM
                       </a>
+                      <a
+                        href={`http://127.0.0.1:5001/api/export/scorm/${c.id}?mode=lessons`}
+                        target="_blank"
+                        rel="noreferrer"
+                        title="Un SCO par leçon"
+                      >
+                        SCORM par leçon
+                      </a>
                       <button onClick={() => onDeleteCourse(c.id)} disabled={deletingId === c.id}>
                         {deletingId === c.id ? "Suppression…" : "Supprimer"}
                       </button>